@@ -2,21 +2,27 @@ import genanki
 import random
 import requests
 import os
+import sys
 import urllib.parse
 import re
 import json
 from datetime import datetime
-from openai import OpenAI, OpenAIError
-from googletrans import Translator
 import asyncio
-import replicate
 import shutil
-from pypinyin import pinyin, Style
 import time
+from negative_cache import NegativeCache
+from svg_optimizer import SvgOptimizer
+from stroke_assets import StrokeAssets, stroke_tag
+from image_postprocess import optimize_story_images, apply_media_mapping, is_story_image
+from task_dag import StageGraph
+from progress_log import Progress, cache_lookup, get_logger
+from apkg_volumes import MAX_PACKAGE_MB, write_deck
 
 # Этот скрипт содержит общие классы, которые могут быть использованы в обоих файлах.
 # В более крупном проекте их можно было бы вынести в отдельный файл `common.py`.
 
+log = get_logger("hmm_deck")
+
 # --- НАСТРОЙКИ ---
 STORIES_JSON_FILE = "stories/stories_for_review.json"
 anki_deck_name = "DuChinese Hanzi Spaces with Actors (Русский)"
@@ -29,7 +35,7 @@ IMAGE_SIZE = "512x512"  # Размер изображения для DALL-E
 
 
 class AnkiDeckGenerator:
-    def __init__(self):
+    def __init__(self, negative_cache=None):
         self.model = genanki.Model(
             random.randrange(1 << 30, 1 << 31),
             anki_deck_name,
@@ -76,6 +82,11 @@ class AnkiDeckGenerator:
         )
         self.deck = genanki.Deck(random.randrange(1 << 30, 1 << 31), anki_deck_name)
         self.media_files = []
+        self.negative_cache = negative_cache or NegativeCache()
+        self.openai_client = None
+        self.http = requests
+        self.svg_optimizer = SvgOptimizer()
+        self.stroke_assets = StrokeAssets(self.negative_cache, self.svg_optimizer)
 
     def color_pinyin(self, pinyin_text):
         result = []
@@ -87,6 +98,15 @@ class AnkiDeckGenerator:
             else: result.append(syllable)
         return " ".join(result)
 
+    def get_openai_client(self):
+        """Reuse one OpenAI client (injected by build_decks.py when several decks share a run)."""
+        from openai import OpenAI, OpenAIError
+
+        if self.openai_client is None:
+            self.openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        if not self.openai_client.api_key: raise OpenAIError("Ключ OpenAI API не найден")
+        return self.openai_client
+
     def _build_image_prompt(self, primary_meaning, actor, location, story):
         return (
             f"Фотореалистичное изображение, кинематографический свет, высокая детализация. "
@@ -101,28 +121,29 @@ class AnkiDeckGenerator:
         os.makedirs(image_dir, exist_ok=True)
         image_file_path = f"{image_dir}/{hanzi}_story.png"
         if os.path.exists(image_file_path):
-            print(f"Image for {hanzi} already exists. Using existing.")
+            log.debug(f"Image for {hanzi} already exists. Using existing.")
+            cache_lookup("dall-e", True)
             self.media_files.append(image_file_path)
             return image_file_path
+        cache_lookup("dall-e", False)
 
         prompt = self._build_image_prompt(meaning_ru, actor, location, story)
         try:
-            print(f"Generating image for {hanzi} based on your edited story...")
-            client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-            if not client.api_key: raise OpenAIError("Ключ OpenAI API не найден")
+            log.debug(f"Generating image for {hanzi} based on your edited story...")
+            client = self.get_openai_client()
             response = client.images.generate(model=OPENAI_IMAGE_MODEL, prompt=prompt, n=1, size=IMAGE_SIZE)
             image_url = response.data[0].url
-            image_response = requests.get(image_url)
+            image_response = self.http.get(image_url)
             if image_response.status_code == 200:
                 with open(image_file_path, "wb") as f: f.write(image_response.content)
-                print(f"Successfully saved image for {hanzi}")
+                log.debug(f"Successfully saved image for {hanzi}")
                 self.media_files.append(image_file_path)
-                print("Waiting 15 seconds to respect the rate limit...")
+                log.debug("Waiting 15 seconds to respect the rate limit...")
                 time.sleep(15)
                 return image_file_path
         except Exception as e:
-            print(f"Error generating image for {hanzi} with DALL-E: {e}")
-            print("Waiting 15 seconds to respect the rate limit...")
+            log.error(f"Error generating image for {hanzi} with DALL-E: {e}", extra={"item": hanzi, "provider": "dall-e"})
+            log.debug("Waiting 15 seconds to respect the rate limit...")
             time.sleep(15)
         return None
 
@@ -166,6 +187,7 @@ class AnkiDeckGenerator:
     #         print(f"Generating image for {hanzi} based on your edited story...")
             
     #         # Initialize Replicate client
+    #         import replicate
     #         client = replicate.Client(api_token=os.getenv("REPLICATE_API_TOKEN"))
             
     #         # Run Google Imagen 3 model
@@ -233,49 +255,51 @@ class AnkiDeckGenerator:
         os.makedirs(audio_dir, exist_ok=True)
         audio_file_path = f"{audio_dir}/{hanzi}_audio.mp3"
         if os.path.exists(audio_file_path):
+            cache_lookup("forvo", True)
             return audio_file_path
+        if self.negative_cache.is_missing("forvo", hanzi):
+            cache_lookup("forvo", True)
+            return None
+        cache_lookup("forvo", False)
         try:
             encoded_hanzi = urllib.parse.quote(hanzi)
             forvo_api_key = os.getenv("FORVO_API_KEY")
             api_url = f"https://apifree.forvo.com/key/{forvo_api_key}/format/json/action/word-pronunciations/word/{encoded_hanzi}/language/zh"
-            response = requests.get(api_url)
-            if response.status_code == 200 and "items" in response.json() and response.json()["items"]:
-                items = sorted(response.json()["items"], key=lambda x: int(x.get("num_positive_votes", 0)), reverse=True)
+            response = self.http.get(api_url)
+            data = response.json() if response.status_code == 200 else {}
+            if data.get("items"):
+                items = sorted(data["items"], key=lambda x: int(x.get("num_positive_votes", 0)), reverse=True)
                 audio_url = items[0]["pathmp3"]
-                audio_response = requests.get(audio_url)
+                audio_response = self.http.get(audio_url)
                 if audio_response.status_code == 200:
                     with open(audio_file_path, "wb") as f:
                         f.write(audio_response.content)
+                    self.negative_cache.record_hit("forvo", hanzi)
                     return audio_file_path
+                self.negative_cache.record_error("forvo", hanzi, f"audio download HTTP {audio_response.status_code}")
+            elif "items" in data:
+                log.info(f"No audio found for {hanzi} on Forvo.")
+                self.negative_cache.record_miss("forvo", hanzi, "no items")
             else:
-                print(f"No audio found for {hanzi} on Forvo.")
+                self.negative_cache.record_error("forvo", hanzi, f"HTTP {response.status_code}")
         except Exception as e:
-            print(f"Ошибка при загрузке аудио для {hanzi}: {e}")
+            log.warning(f"Ошибка при загрузке аудио для {hanzi}: {e}", extra={"item": hanzi, "provider": "forvo"})
+            self.negative_cache.record_error("forvo", hanzi, e)
         return None
         
 
     def create_stroke_image(self, word):
-        svg_paths = []
-        for char in word:
-            code_point = ord(char)
-            svg_path = f"svgs/{code_point}.svg"
-            if not os.path.exists(svg_path):
-                svg_path = f"svgs-still/{code_point}-still.svg"
-                if not os.path.exists(svg_path):
-                    print(f"Warning: No SVG file found for '{char}' (code point {code_point})")
-                    continue
-            svg_paths.append(svg_path)
-        if not svg_paths:
-            return None
-        for svg_path in svg_paths:
+        # Для нескольких иероглифов — один составной SVG (stroke_assets.find_word)
+        svg_path = self.stroke_assets.find_word(word)
+        if svg_path:
             self.media_files.append(svg_path)
-        if len(svg_paths) > 1:
-            return svg_paths[0], svg_paths
-        return svg_paths[0]
+        return svg_path
 
 
 async def google_translate_ru(en_word):
     if not en_word: return ""
+    from googletrans import Translator
+
     translator = Translator()
     try:
         return (await translator.translate(en_word, src="ru", dest="en")).text
@@ -293,47 +317,15 @@ def main():
     with open(STORIES_JSON_FILE, 'r', encoding='utf-8') as f:
         stories_data = json.load(f)
 
-    generator = AnkiDeckGenerator()
-
-    for data in stories_data:
-        hanzi = data['hanzi']
-        print(f"Creating card for: {hanzi}")
-        
-        # Генерация медиафайлов
-        image_file = generator.generate_story_image(hanzi, data['meaning_ru'], data['actor'], data['location'], data['story'])
-        audio_file = generator.get_audio_from_forvo(hanzi)
-        stroke_image_result = generator.create_stroke_image(hanzi)
-
-        # Форматирование тегов для Anki
-        if image_file: 
-            image_tag = f'<img src="{os.path.basename(image_file)}">' if image_file else ""
-        
-        if audio_file:            
-            audio_tag = f"[sound:{os.path.basename(audio_file)}]" if audio_file else ""
-        stroke_tag = ""
-        if stroke_image_result:
-            if isinstance(stroke_image_result, tuple):
-                stroke_tag = "".join(f'<img src="{os.path.basename(p)}">' for p in stroke_image_result[1])
-            else:
-                stroke_tag = f'<img src="{os.path.basename(stroke_image_result)}">'
+    if "--plan" in sys.argv:
+        from run_planner import print_plan
+        print_plan("hmm_deck", [data["hanzi"] for data in stories_data])
+        return
+    build_deck(stories_data, output_deck)
+    archive_stories_file()
 
-        # Создание карточки
-        note = genanki.Note(
-            model=generator.model,
-            fields=[
-                data['hanzi'], data['pinyin'], generator.color_pinyin(data['pinyin']),
-                data['meaning_en'], data['location'], data['hint'],
-                audio_tag, data['story'], image_tag, stroke_tag,
-            ]
-        )
-        generator.deck.add_note(note)
 
-    # Сохранение колоды
-    package = genanki.Package(generator.deck)
-    package.media_files = generator.media_files
-    package.write_to_file(output_deck)
-    print(f"\nКолода '{output_deck}' успешно создана с {len(stories_data)} карточками.")
-    
+def archive_stories_file():
     # Архивируем файл с историями, чтобы не использовать его повторно
     archive_dir = "processed_stories_archive"
     os.makedirs(archive_dir, exist_ok=True)
@@ -342,5 +334,50 @@ def main():
     print(f"Файл '{STORIES_JSON_FILE}' перемещен в архив.")
 
 
+def build_deck(stories_data, output_file=output_deck, generator=None, max_mb=MAX_PACKAGE_MB):
+    """Создаёт .apkg из списка историй (формат stories_for_review.json)."""
+    generator = generator or AnkiDeckGenerator()
+
+    with Progress(len(stories_data), "hmm_deck") as progress:
+        for data in stories_data:
+            hanzi = data['hanzi']
+            log.debug(f"Creating card for: {hanzi}", extra={"item": hanzi})
+        
+            # Генерация медиафайлов: картинка, аудио и SVG штрихов не зависят друг от друга
+            graph = StageGraph()
+            graph.stage("image", lambda: generator.generate_story_image(
+                hanzi, data['meaning_ru'], data['actor'], data['location'], data['story']))
+            graph.stage("audio", lambda: generator.get_audio_from_forvo(hanzi))
+            graph.stage("strokes", lambda: generator.create_stroke_image(hanzi))
+            stages = graph.run()
+            image_file, audio_file = stages["image"], stages["audio"]
+
+            # Форматирование тегов для Anki
+            image_tag = f'<img src="{os.path.basename(image_file)}">' if image_file else ""
+            audio_tag = f"[sound:{os.path.basename(audio_file)}]" if audio_file else ""
+
+            # Создание карточки
+            note = genanki.Note(
+                model=generator.model,
+                fields=[
+                    data['hanzi'], data['pinyin'], generator.color_pinyin(data['pinyin']),
+                    data['meaning_en'], data['location'], data['hint'],
+                    audio_tag, data['story'], image_tag, stroke_tag(stages["strokes"]),
+                ]
+            )
+            generator.deck.add_note(note)
+            progress.advance()
+
+    # Сжимаем изображения историй до размера отображения перед упаковкой
+    image_map = optimize_story_images([p for p in generator.media_files if is_story_image(p)])
+    generator.media_files = apply_media_mapping(generator.deck.notes, generator.media_files, image_map)
+
+    # Сохранение колоды
+    write_deck(generator.deck, generator.media_files, output_file, max_mb)
+    print(f"\nКолода '{output_file}' успешно создана с {len(stories_data)} карточками.")
+    print(generator.svg_optimizer.report())
+    return generator
+
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
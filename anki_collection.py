@@ -0,0 +1,98 @@
+import argparse
+import html
+import os
+import re
+import sqlite3
+import tempfile
+import time
+import zipfile
+
+# Предварительный фильтр: слова, которые уже есть в коллекции Anki (collection.anki2 или
+# экспортированный .apkg), не отправляются на платную генерацию историй, картинок и аудио.
+# Путь по умолчанию берётся из переменной окружения ANKI_COLLECTION_PATH.
+ANKI_COLLECTION_PATH = os.getenv("ANKI_COLLECTION_PATH")
+
+COLLECTION_NAMES = ("collection.anki21", "collection.anki2")
+
+_TAG = re.compile(r"<[^>]*>")
+_SOUND = re.compile(r"\[sound:[^\]]*\]")
+
+
+def normalize_field(value):
+    """First-field text as a plain word: no HTML, entities, [sound:] tags or zero-width spaces."""
+    text = html.unescape(_TAG.sub("", _SOUND.sub("", value)))
+    return text.replace("\u200b", "").replace("\xa0", " ").strip()
+
+
+def _read_first_fields(db_path, uri=False):
+    conn = sqlite3.connect(db_path, uri=uri)
+    try:
+        # Первое поле — всё до разделителя полей \x1f
+        return [row[0] for row in conn.execute(
+            "SELECT CASE WHEN instr(flds, char(31)) > 0 THEN substr(flds, 1, instr(flds, char(31)) - 1) "
+            "ELSE flds END FROM notes")]
+    finally:
+        conn.close()
+
+
+def read_collection_fields(path):
+    """Raw first-field values of every note in a collection.anki2 or an .apkg, opened read-only."""
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as apkg:
+            name = next((n for n in COLLECTION_NAMES if n in apkg.NameToInfo), None)
+            if name is None:
+                raise ValueError(f"{path}: no collection.anki2/collection.anki21 inside")
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                return _read_first_fields(apkg.extract(name, tmp_dir))
+    # mode=ro: коллекция самого Anki не меняется и не блокируется на запись
+    return _read_first_fields(f"file:{os.path.abspath(path)}?mode=ro", uri=True)
+
+
+def load_collection_words(path):
+    """Set of normalized, simplified first-field values of the notes in `path`."""
+    from hanziconv import HanziConv
+
+    started = time.monotonic()
+    words = set()
+    for value in read_collection_fields(path):
+        text = normalize_field(value)
+        if text:
+            words.add(text)
+            words.add(HanziConv.toSimplified(text))
+    print(f"Indexed {len(words)} words from Anki collection {path} in {time.monotonic() - started:.2f}s")
+    return words
+
+
+def filter_known_words(words, path=ANKI_COLLECTION_PATH, known_words=None):
+    """Drop words that already have a note in the Anki collection. No-op without a collection."""
+    if known_words is None:
+        if not path:
+            return list(words)
+        if not os.path.exists(path):
+            print(f"Anki collection {path} not found, skipping collection check.")
+            return list(words)
+        known_words = load_collection_words(path)
+    from hanziconv import HanziConv
+
+    # Входные слова приводятся к тому же виду, что и коллекция: традиционное 愛 совпадает с 爱
+    new_words = [word for word in words
+                 if HanziConv.toSimplified(normalize_field(word)) not in known_words]
+    if len(new_words) != len(words):
+        print(f"Skipped {len(words) - len(new_words)} words already in the Anki collection.")
+    return new_words
+
+
+def main():
+    parser = argparse.ArgumentParser(description="List input words that are not in an Anki collection yet")
+    parser.add_argument("collection", help="collection.anki2 or an exported .apkg")
+    parser.add_argument("input", help="word list, one word per line")
+    args = parser.parse_args()
+
+    with open(args.input, "r", encoding="utf-8") as f:
+        words = [line.strip().replace("\u200b", "") for line in f if line.strip()]
+    for word in filter_known_words(words, args.collection):
+        print(word)
+
+
+if __name__ == "__main__":
+    main()
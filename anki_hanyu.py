@@ -1,15 +1,23 @@
 import genanki
 import random
 import requests
-import os, time
+import os, sys, time
 from pypinyin import pinyin, Style
 import urllib.parse
 import asyncio
-from googletrans import Translator
 from datetime import datetime
 from hanziconv import HanziConv
-import json
 import random
+from negative_cache import NegativeCache
+from input_words import is_chinese_char
+from anki_collection import filter_known_words
+from svg_optimizer import SvgOptimizer
+from stroke_assets import StrokeAssets, stroke_tag as stroke_image_tag
+from graphics_index import GraphicsIndex
+from stroke_renderer import StrokeRenderer
+from task_dag import StageGraph
+from progress_log import Progress, cache_lookup, get_logger
+from apkg_volumes import MAX_PACKAGE_MB, write_deck
 
 
 # anki_deck_name = "Vova chinese HSK1"
@@ -19,11 +27,16 @@ anki_deck_name = "DuChinese chinese HSK1"
 output_deck = "Duchinese_hsk1.apkg"
 input_file = "chinese_words.txt"
 
+log = get_logger("hanyu")
+
 # Path to makemeahanzi graphics.txt (update this to your local path)
 GRAPHICS_PATH = "graphics.txt"
+# Pause after each word (Forvo and Google Translate rate limits)
+REQUEST_DELAY = 1
 
 class ChineseAnkiGenerator:
-    def __init__(self):
+    def __init__(self, negative_cache=None):
+        self.request_delay = REQUEST_DELAY
         # Load stroke data from makemeahanzi
         self.graphics_data = self.load_graphics_data(GRAPHICS_PATH)
 
@@ -133,61 +146,34 @@ class ChineseAnkiGenerator:
         # Media files
         self.media_files = []
 
+        # Known misses (Forvo words without audio, characters without SVG)
+        self.negative_cache = negative_cache or NegativeCache()
+        # HTTP client; build_decks.py injects a shared requests.Session
+        self.http = requests
+        self.svg_optimizer = SvgOptimizer()
+        # Символы без готового SVG рисуются из уже проиндексированного graphics.txt
+        self.stroke_assets = StrokeAssets(self.negative_cache, self.svg_optimizer,
+                                          renderer=StrokeRenderer(self.graphics_data))
+
     def load_graphics_data(self, file_path):
-        """Load stroke data from makemeahanzi graphics.txt"""
-        characters = {}
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                for line in f:
-                    data = json.loads(line.strip())
-                    characters[data['character']] = {
-                        'strokes': data['strokes'],
-                        'medians': data['medians']
-                    }
-            print(f"Loaded stroke data for {len(characters)} characters")
-        except FileNotFoundError:
+        """Index stroke data from makemeahanzi graphics.txt; each character is parsed on first access"""
+        characters = GraphicsIndex(file_path)
+        if characters.available:
+            print(f"Indexed stroke data for {len(characters)} characters")
+        else:
             print(f"Error: {file_path} not found. Stroke order will not be included.")
         return characters
                 
     def create_stroke_image(self, word, output_path):
-        """Use existing SVG files for each character without combining them"""
-        svg_paths = []
-        
-        # For each character in the word, find its corresponding SVG file
-        for char in word:
-            # Convert character to Unicode code point
-            code_point = ord(char)
-            
-            # Check for SVG file in svgs directory
-            svg_path = f"svgs/{code_point}.svg"
-            if not os.path.exists(svg_path):
-                # Try with "-still" suffix
-                svg_path = f"svgs-still/{code_point}-still.svg"
-                if not os.path.exists(svg_path):
-                    print(f"Warning: No SVG file found for '{char}' (code point {code_point})")
-                    continue
-            
-            svg_paths.append(svg_path)
-            print(f"Found existing SVG for '{char}' at {svg_path}")
-        
-        if not svg_paths:
+        """Stroke-order SVG for the word: one composite SVG for several characters"""
+        # Packed store (stroke_assets.pack) or svgs/ + svgs-still/, minified;
+        # multi-character words are laid out side by side in svgs-min/composite/
+        svg_path = self.stroke_assets.find_word(word)
+        if not svg_path:
             return None
-        
-        # Add all SVGs to media files
-        for svg_path in svg_paths:
-            self.media_files.append(svg_path)
-        
-        # Return the first SVG path to be used as the primary reference
-        primary_svg_path = svg_paths[0]
-        
-        # For multi-character words, we'll need to update how we display the SVGs
-        if len(svg_paths) > 1:
-            # Instead of creating a combined SVG, we'll just return the first one
-            # But we'll update the process_word method to include all SVGs in the note
-            return primary_svg_path, svg_paths
-        else:
-            # For single character, just return the SVG path
-            return primary_svg_path    
+        log.debug(f"Stroke SVG for '{word}' at {svg_path}")
+        self.media_files.append(svg_path)
+        return svg_path
     
     
     def color_pinyin(self, pinyin_text):
@@ -221,7 +207,7 @@ class ChineseAnkiGenerator:
             headers = {
                 "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
             }
-            response = requests.get(backup_url, headers=headers)
+            response = self.http.get(backup_url, headers=headers)
             if response.status_code == 200:
                 data = response.json()
                 if data and "results" in data and data["results"]:
@@ -246,7 +232,7 @@ class ChineseAnkiGenerator:
             pinyin_result = pinyin(word, style=Style.TONE3)
             return f"[{pinyin_result}] Definition not available - please check a dictionary"
         except Exception as e:
-            print(f"Error fetching dictionary data: {e}")
+            log.warning(f"Error fetching dictionary data: {e}", extra={"item": word, "provider": "dictionary"})
             try:
                 pinyin_result = pinyin(word, style=Style.TONE3)
                 return f"[{pinyin_result}] Unable to fetch definition"
@@ -260,7 +246,7 @@ class ChineseAnkiGenerator:
         translation_lang = "eng"
         url = f"https://tatoeba.org/eng/api_v0/search?from={lang}&to={translation_lang}&query={word}"
         try:
-            response = requests.get(url, timeout=10)
+            response = self.http.get(url, timeout=10)
             response.raise_for_status()
             data = response.json()
             if not data or "results" not in data:
@@ -283,7 +269,7 @@ class ChineseAnkiGenerator:
                         return {"chinese": chinese_text, "meaning": translation_text}
                 return None
         except Exception as e:
-            print(f"Error fetching example: {e}")
+            log.warning(f"Error fetching example: {e}", extra={"item": word, "provider": "tatoeba"})
             return None
 
     def get_audio_from_forvo(self, word):
@@ -294,79 +280,92 @@ class ChineseAnkiGenerator:
             os.makedirs(audio_dir)
         audio_file_path = f"{audio_dir}/{word}_audio.mp3"
         if os.path.exists(audio_file_path):
+            cache_lookup("forvo", True)
             return audio_file_path
+        if self.negative_cache.is_missing("forvo", word):
+            cache_lookup("forvo", True)
+            return None
+        cache_lookup("forvo", False)
         try:
             encoded_word = urllib.parse.quote(word)
             forvo_api_key = os.getenv("FORVO_API_KEY")
             api_url = f"https://apifree.forvo.com/key/{forvo_api_key}/format/json/action/word-pronunciations/word/{encoded_word}/language/zh"
-            response = requests.get(api_url)
+            response = self.http.get(api_url)
             if response.status_code == 200:
                 data = response.json()
                 if "items" in data and len(data["items"]) > 0:
                     sorted_items = sorted(data["items"], key=lambda x: int(x.get("num_positive_votes", 0)), reverse=True)
                     audio_url = sorted_items[0]["pathmp3"]
-                    audio_response = requests.get(audio_url)
+                    audio_response = self.http.get(audio_url)
                     if audio_response.status_code == 200:
                         with open(audio_file_path, "wb") as f:
                             f.write(audio_response.content)
-                        print(f"Downloaded audio for {word}")
+                        log.debug(f"Downloaded audio for {word}")
+                        self.negative_cache.record_hit("forvo", word)
                         return audio_file_path
+                    self.negative_cache.record_error("forvo", word, f"audio download HTTP {audio_response.status_code}")
+                elif "items" in data:
+                    # Forvo answered, but has no pronunciation for this word
+                    self.negative_cache.record_miss("forvo", word, "no items")
+                else:
+                    self.negative_cache.record_error("forvo", word, f"unexpected response: {str(data)[:200]}")
+            else:
+                self.negative_cache.record_error("forvo", word, f"HTTP {response.status_code}")
             return None
         except Exception as e:
-            print(f"Error fetching audio: {e}")
+            log.warning(f"Error fetching audio: {e}", extra={"item": word, "provider": "forvo"})
+            self.negative_cache.record_error("forvo", word, e)
             return None
 
     def process_word(self, word):
         """Process a single Chinese word"""
-        print(f"Processing: {word}")
+        log.debug(f"Processing: {word}", extra={"item": word})
 
         # Get pinyin
         raw_pinyin = pinyin(word, style=Style.TONE3)
         pinyin_text = " ".join(["".join(p) for p in raw_pinyin])
         colored_pinyin = self.color_pinyin(pinyin_text)
 
+        # Словарь, пример, аудио и SVG штрихов не зависят друг от друга и запрашиваются параллельно
+        def fetch_example():
+            try:
+                return self.get_example_from_tatoeba(word)
+            except Exception as e:
+                log.warning(f"Error fetching example: {e}", extra={"item": word, "provider": "tatoeba"})
+                return None
+
+        graph = StageGraph()
+        graph.stage("meaning", lambda: self.get_dictionary_data(word))
+        graph.stage("example", fetch_example)
+        graph.stage("audio", lambda: self.get_audio_from_forvo(word))
+        graph.stage("strokes", lambda: self.create_stroke_image(word, f"strokes/{word}_strokes.png"))
+        stages = graph.run()
+
         # Get dictionary definition
-        meaning = self.get_dictionary_data(word)
+        meaning = stages["meaning"]
 
         # Get example sentence
         try:
-            example = self.get_example_from_tatoeba(word)
+            example = stages["example"]
             example_chinese = example["chinese"] if example else ""
             example_meaning = example["meaning"] if example else ""
             example_raw_pinyin = pinyin(example_chinese, style=Style.TONE3)
             example_pinyin_text = " ".join(["".join(p) for p in example_raw_pinyin])
             example_colored_pinyin = self.color_pinyin(example_pinyin_text)
         except Exception as e:
-            print(f"Error fetching example: {e}")
+            log.warning(f"Error fetching example: {e}", extra={"item": word})
             example_chinese = ""
             example_colored_pinyin = ""
             example_meaning = ""
 
         # Get audio
-        audio_file = self.get_audio_from_forvo(word)
+        audio_file = stages["audio"]
         audio_tag = f"[sound:{os.path.basename(audio_file)}]" if audio_file and os.path.exists(audio_file) else ""
         if audio_file:
             self.media_files.append(audio_file)
 
-        # Generate stroke order image references
-        stroke_image_result = self.create_stroke_image(word, f"strokes/{word}_strokes.png")
-
-        if stroke_image_result:
-            if isinstance(stroke_image_result, tuple):
-                # We have multiple SVGs for a multi-character word
-                primary_svg_path, all_svg_paths = stroke_image_result
-                
-                # Create HTML to display all SVGs side by side
-                stroke_tag = ""
-                for svg_path in all_svg_paths:
-                    base_filename = os.path.basename(svg_path)
-                    stroke_tag += f'<img src="{base_filename}" style="height:100px; margin-right:10px;">'
-            else:
-                # Single SVG
-                base_filename = os.path.basename(stroke_image_result)
-                stroke_tag = f'<img src="{base_filename}">'
-        else:
-            stroke_tag = ""
+        # Generate stroke order image reference (one image, also for multi-character words)
+        stroke_tag = stroke_image_tag(stages["strokes"])
 
         # Create Anki note
         note = genanki.Note(
@@ -388,7 +387,7 @@ class ChineseAnkiGenerator:
         # print(f"Note fields: {note.fields}")
 
         self.deck.add_note(note)
-        time.sleep(1)
+        time.sleep(self.request_delay)
 
         return {
             "word": word,
@@ -396,21 +395,22 @@ class ChineseAnkiGenerator:
             "meaning": meaning[:50] + "..." if len(meaning) > 50 else meaning,
         }
 
+    def write_package(self, output_file=output_deck, max_mb=MAX_PACKAGE_MB):
+        """Write the deck and its media files to an .apkg (or size-capped volumes, see apkg_volumes.py)"""
+        write_deck(self.deck, self.media_files, output_file, max_mb)
+        print(f"Created Anki deck: {output_file}")
+        print(self.svg_optimizer.report())
+
     def create_deck_from_file(self, input_words, output_file=output_deck):
         """Create Anki deck from Chinese words"""
         results = []
-        for word in input_words:
-            result = self.process_word(word)
-            results.append(result)
+        with Progress(len(input_words), "words") as progress:
+            for word in input_words:
+                result = self.process_word(word)
+                results.append(result)
+                progress.advance()
 
-        # Create package with media files
-        package = genanki.Package(self.deck)
-        if self.media_files:
-            package.media_files = self.media_files
-
-        # Write to file
-        package.write_to_file(output_file)
-        print(f"Created Anki deck: {output_file}")
+        self.write_package(output_file)
 
         # Archive input file (your existing logic)
         output_file_archive_path = "input_words_archive"
@@ -429,18 +429,13 @@ class ChineseAnkiGenerator:
     def create_deck_from_file(self, input_words, output_file=output_deck):
         """Create Anki deck from Chinese words"""
         results = []
-        for word in input_words:
-            result = self.process_word(word)
-            results.append(result)
-
-        # Create package with media files
-        package = genanki.Package(self.deck)
-        if self.media_files:
-            package.media_files = self.media_files
+        with Progress(len(input_words), "words") as progress:
+            for word in input_words:
+                result = self.process_word(word)
+                results.append(result)
+                progress.advance()
 
-        # Write to file
-        package.write_to_file(output_file)
-        print(f"Created Anki deck: {output_file}")
+        self.write_package(output_file)
 
         # copy inputs to archive
         output_file_archive_path = "input_words_archive"
@@ -459,6 +454,8 @@ class ChineseAnkiGenerator:
         return results
 
 async def google_translate(word):
+    from googletrans import Translator
+
     translator = Translator()
     translation = await translator.translate(word, src="zh-cn", dest="en")
     if translation and translation.text:
@@ -496,15 +493,6 @@ def check_input_duplicates(input_file):
             f.write(f"{word}\n")
     return new_input_words
 
-def is_chinese_char(text):
-    if not text or len(text) == 0:
-        return False
-    for char in text:
-        code_point = ord(char)
-        if not ((0x4E00 <= code_point <= 0x9FFF) or (0x3400 <= code_point <= 0x4DBF)):
-            return False
-    return True
-
 
 if __name__ == "__main__":
 
@@ -515,7 +503,11 @@ if __name__ == "__main__":
             f.write("你好\n")
         print(f"Created example file: {input_file}")
 
-    checked_input_words = check_input_duplicates(input_file)
+    checked_input_words = filter_known_words(check_input_duplicates(input_file))
+    if "--plan" in sys.argv:
+        from run_planner import print_plan
+        print_plan("words", checked_input_words)
+        sys.exit()
     results = generator.create_deck_from_file(checked_input_words)
 
     print("\nProcessed words:")
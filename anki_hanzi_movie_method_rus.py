@@ -2,17 +2,25 @@ import genanki
 import random
 import requests
 import os
+import sys
 import time
 from pypinyin import pinyin, Style
 import urllib.parse
 from hanziconv import HanziConv
-from googletrans import Translator
 import re
 import asyncio
-import json
 from datetime import datetime
-from openai import OpenAI
-from openai import OpenAIError
+from negative_cache import NegativeCache
+from completion_cache import CompletionCache
+from input_words import check_input_duplicates
+from anki_collection import filter_known_words
+from svg_optimizer import SvgOptimizer
+from stroke_assets import StrokeAssets, stroke_tag
+from image_postprocess import optimize_story_images, apply_media_mapping, is_story_image
+from task_dag import StageGraph
+from hanzi_components import HanziComponentsDB
+from progress_log import Progress, cache_lookup, get_logger
+from apkg_volumes import MAX_PACKAGE_MB, write_deck
 
 # input_file = "chinese_words_hanzi_movie_method.txt"
 input_file = "du_chinese_words_hanzi_movie_method.txt"
@@ -26,72 +34,26 @@ OPENAI_MODEL = "gpt-4o-mini"
 # OPENAI_MODEL = "o3-mini-2025-01-31"
 OPENAI_MAX_TOKENS = 300
 OPENAI_TEMPERATURE = 0.8
+STORY_SYSTEM_PROMPT = "Ты креативный помощник для создания мнемонических историй."
 # --- FIXED: Added missing constants for DALL-E ---
 OPENAI_IMAGE_MODEL = "dall-e-3"
 # OPENAI_IMAGE_MODEL = "dall-e-2"
 IMAGE_SIZE = "1024x1024"
+# Пауза после каждого иероглифа (лимиты запросов к DALL-E)
+REQUEST_DELAY = 20
 
-class HanziComponentsDB:
-    def __init__(self, db_file='hanzi_db.txt'):
-        self.db = self._load_db(db_file)
-        self.component_meanings = {
-            '⿰': 'слева направо', '⿱': 'сверху вниз', '⿲': 'три части горизонтально',
-            '⿳': 'три части вертикально', '⿴': 'внешнее-внутреннее', '⿵': 'верхняя рамка',
-            '⿶': 'нижняя рамка', '⿷': 'левая рамка', '⿸': 'верхне-левая рамка',
-            '⿹': 'верхне-правая рамка', '⿺': 'нижне-левая рамка', '⿻': 'пересекающиеся компоненты'
-        }
 
-    def _load_db(self, db_file):
-        db = {}
-        try:
-            with open(db_file, 'r', encoding='utf-8') as f:
-                for line in f:
-                    if line.strip():
-                        data = json.loads(line.strip())
-                        db[data['character']] = data
-        except FileNotFoundError:
-            print(f"Файл {db_file} не найден! Будет использован пустой словарь.")
-        return db
-
-    def parse_separated_values(self, input_string):
-        standardized = str(input_string).replace(';', ',')
-        values = [item.strip() for item in standardized.split(',')]
-        return [item for item in values if item]
-
-    def get_hanzi_components(self, hanzi):
-        if hanzi not in self.db:
-            return None
-        data = self.db[hanzi]
-        decomposition = data.get('decomposition', '')
-        structure, components = self._parse_decomposition(decomposition)
-        new_components = []
-        for component in components:
-            if component:
-                meanings_list = ""
-                component_data = self.db.get(component, {})
-                meaning_data = component_data.get('definition', '')
-                if meaning_data:
-                    meanings_list = self.parse_separated_values(meaning_data)
-                    meanings_list = meanings_list[0] if meanings_list else ""
-                new_components.append(f'{component} ({meanings_list})')
-        components_with_meaning = ", ".join(new_components)
-        return {
-            'character': hanzi, 'structure': structure, 'components': components,
-            'components_with_meaning': components_with_meaning, 'radical': data.get('radical', ''),
-            'etymology': data.get('etymology', {}).get('hint', ''), 'definition': data.get('definition', '')
-        }
+log = get_logger("hmm")
+
+
+def note_guid(hanzi):
+    return genanki.guid_for(anki_deck_name, hanzi)
 
-    def _parse_decomposition(self, decomposition):
-        if not decomposition:
-            return '', []
-        structure_symbol = decomposition[0]
-        structure = self.component_meanings.get(structure_symbol, 'неизвестная структура')
-        components = [char for char in decomposition[1:] if char not in self.component_meanings]
-        return structure, components
 
 class HanziSpacesGenerator:
-    def __init__(self):
-        self.components_db = HanziComponentsDB('hanzi_db.txt')
+    def __init__(self, components_db=None, negative_cache=None):
+        self.components_db = components_db or HanziComponentsDB('hanzi_db.txt')
+        self.request_delay = REQUEST_DELAY
         # --- FIXED: Corrected Anki model definition ---
         self.model = genanki.Model(
             random.randrange(1 << 30, 1 << 31),
@@ -154,6 +116,13 @@ class HanziSpacesGenerator:
         )
         self.deck = genanki.Deck(random.randrange(1 << 30, 1 << 31), anki_deck_name)
         self.media_files = []
+        self.negative_cache = negative_cache or NegativeCache()
+        # Кэш ответов OpenAI (политика: OPENAI_CACHE_POLICY=reuse|refresh|off)
+        self.completion_cache = CompletionCache()
+        self.openai_client = None
+        self.http = requests
+        self.svg_optimizer = SvgOptimizer()
+        self.stroke_assets = StrokeAssets(self.negative_cache, self.svg_optimizer)
         # (Dictionaries for spaces and actors remain unchanged)
         self.spaces = {
             "a": {"name": "Арт-галерея", "tones": {"1": "Вестибюль", "2": "Главный выставочный зал", "3": "Мастерская художников", "4": "Кабинет куратора"}},
@@ -235,23 +204,23 @@ class HanziSpacesGenerator:
         }
 
     def create_stroke_image(self, word):
-        svg_paths = []
-        for char in word:
-            code_point = ord(char)
-            svg_path = f"svgs/{code_point}.svg"
-            if not os.path.exists(svg_path):
-                svg_path = f"svgs-still/{code_point}-still.svg"
-                if not os.path.exists(svg_path):
-                    print(f"Warning: No SVG file found for '{char}' (code point {code_point})")
-                    continue
-            svg_paths.append(svg_path)
-        if not svg_paths:
-            return None
-        for svg_path in svg_paths:
+        # Для нескольких иероглифов — один составной SVG (stroke_assets.find_word)
+        svg_path = self.stroke_assets.find_word(word)
+        if svg_path:
             self.media_files.append(svg_path)
-        if len(svg_paths) > 1:
-            return svg_paths[0], svg_paths
-        return svg_paths[0]
+        return svg_path
+
+    def get_openai_client(self):
+        """Reuse one OpenAI client (injected by build_decks.py when several decks share a run)."""
+        from openai import OpenAI, OpenAIError
+
+        if self.openai_client is None:
+            self.openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        if not self.openai_client.api_key: raise OpenAIError("Ключ OpenAI API не найден")
+        return self.openai_client
+
+    def translate_en_ru(self, text):
+        return asyncio.run(google_translate_en(text))
 
     def get_pinyin(self, hanzi):
         raw_pinyin = pinyin(hanzi, style=Style.TONE3)
@@ -308,22 +277,36 @@ class HanziSpacesGenerator:
         os.makedirs(audio_dir, exist_ok=True)
         audio_file_path = f"{audio_dir}/{hanzi}_audio.mp3"
         if os.path.exists(audio_file_path):
+            cache_lookup("forvo", True)
             return audio_file_path
+        if self.negative_cache.is_missing("forvo", hanzi):
+            cache_lookup("forvo", True)
+            return None
+        cache_lookup("forvo", False)
         try:
             encoded_hanzi = urllib.parse.quote(hanzi)
             forvo_api_key = os.getenv("FORVO_API_KEY")
             api_url = f"https://apifree.forvo.com/key/{forvo_api_key}/format/json/action/word-pronunciations/word/{encoded_hanzi}/language/zh"
-            response = requests.get(api_url)
-            if response.status_code == 200 and "items" in response.json() and response.json()["items"]:
-                items = sorted(response.json()["items"], key=lambda x: int(x.get("num_positive_votes", 0)), reverse=True)
+            response = self.http.get(api_url)
+            data = response.json() if response.status_code == 200 else {}
+            if data.get("items"):
+                items = sorted(data["items"], key=lambda x: int(x.get("num_positive_votes", 0)), reverse=True)
                 audio_url = items[0]["pathmp3"]
-                audio_response = requests.get(audio_url)
+                audio_response = self.http.get(audio_url)
                 if audio_response.status_code == 200:
                     with open(audio_file_path, "wb") as f:
                         f.write(audio_response.content)
+                    self.negative_cache.record_hit("forvo", hanzi)
                     return audio_file_path
+                self.negative_cache.record_error("forvo", hanzi, f"audio download HTTP {audio_response.status_code}")
+            elif "items" in data:
+                # Forvo ответил, но произношения для этого иероглифа нет
+                self.negative_cache.record_miss("forvo", hanzi, "no items")
+            else:
+                self.negative_cache.record_error("forvo", hanzi, f"HTTP {response.status_code}")
         except Exception as e:
-            print(f"Ошибка при загрузке аудио для {hanzi}: {e}")
+            log.warning(f"Ошибка при загрузке аудио для {hanzi}: {e}", extra={"item": hanzi, "provider": "forvo"})
+            self.negative_cache.record_error("forvo", hanzi, e)
         return None
 
     def _build_hanzi_story_prompt(self, hanzi, primary_meaning, actor, location, components_str):
@@ -341,22 +324,17 @@ class HanziSpacesGenerator:
 
     # --- FIXED: Corrected function signature and logic ---
     def generate_hanzi_movie_story(self, hanzi, meaning, actor, location, hint):
+        from openai import OpenAIError
+
         primary_meaning = self.components_db.parse_separated_values(meaning)[0] if meaning else "нечто"
         prompt = self._build_hanzi_story_prompt(hanzi, primary_meaning, actor, location, hint)
         try:
-            client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-            if not client.api_key: raise OpenAIError("Ключ OpenAI API не найден")
-            response = client.chat.completions.create(
-                model=OPENAI_MODEL,
-                messages=[
-                    {"role": "system", "content": "Ты креативный помощник для создания мнемонических историй."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=OPENAI_MAX_TOKENS, temperature=OPENAI_TEMPERATURE
+            return self.completion_cache.complete(
+                self.get_openai_client, OPENAI_MODEL, STORY_SYSTEM_PROMPT, prompt,
+                OPENAI_TEMPERATURE, OPENAI_MAX_TOKENS
             )
-            return response.choices[0].message.content.strip()
         except OpenAIError as e:
-            print(f"Ошибка при вызове OpenAI API для {hanzi}: {e}")
+            log.error(f"Ошибка при вызове OpenAI API для {hanzi}: {e}", extra={"item": hanzi, "provider": "openai"})
             return f"{actor} в {location} видит иероглиф {hanzi} и вспоминает '{primary_meaning}'."
 
     def _build_image_prompt(self, hanzi, primary_meaning, actor, location, story):
@@ -384,85 +362,106 @@ class HanziSpacesGenerator:
         os.makedirs(image_dir, exist_ok=True)
         image_file_path = f"{image_dir}/{hanzi}_story.png"
         if os.path.exists(image_file_path):
-            print(f"Image for {hanzi} already exists. Skipping generation.")
+            log.debug(f"Image for {hanzi} already exists. Skipping generation.")
+            cache_lookup("dall-e", True)
             return image_file_path
+        cache_lookup("dall-e", False)
 
         primary_meaning_ru = self.components_db.parse_separated_values(meaning_ru)[0] if meaning_ru else ""
         prompt = self._build_image_prompt(hanzi, primary_meaning_ru, actor, location, story)
         try:
-            print(f"Generating image for {hanzi}...")
-            client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-            if not client.api_key: raise OpenAIError("Ключ OpenAI API не найден")
+            log.debug(f"Generating image for {hanzi}...")
+            client = self.get_openai_client()
             response = client.images.generate(model=OPENAI_IMAGE_MODEL, prompt=prompt, n=1, size=IMAGE_SIZE)
             image_url = response.data[0].url
-            image_response = requests.get(image_url)
+            image_response = self.http.get(image_url)
             if image_response.status_code == 200:
                 with open(image_file_path, "wb") as f:
                     f.write(image_response.content)
-                print(f"Successfully saved image for {hanzi} to {image_file_path}")
+                log.debug(f"Successfully saved image for {hanzi} to {image_file_path}")
                 return image_file_path
         except Exception as e:
-            print(f"Error generating image for {hanzi} with DALL-E: {e}")
+            log.error(f"Error generating image for {hanzi} with DALL-E: {e}", extra={"item": hanzi, "provider": "dall-e"})
         return None
 
-    def process_hanzi(self, hanzi):
-        hanzi = HanziConv.toSimplified(hanzi)
-        print(f"Обрабатываем: {hanzi}")
-
+    def offline_fields(self, hanzi):
+        """Card fields that need no network: pinyin, meaning, space, actor, hint and stroke SVGs."""
         pinyin_text = self.get_pinyin(hanzi)
-        colored_pinyin = self.color_pinyin(pinyin_text)
-        meaning_en = self.get_meaning(hanzi)
-        meaning_ru = asyncio.run(google_translate_en(self.components_db.parse_separated_values(meaning_en)[0] if meaning_en else hanzi))
         space = self.generate_space(pinyin_text)
-        hint = self.decompose_hanzi(hanzi)
+        actor_match = re.match(r'\((.*?)\)\s*(.*)', space)
+        return {
+            "hanzi": hanzi, "pinyin": pinyin_text, "colored_pinyin": self.color_pinyin(pinyin_text),
+            "meaning_en": self.get_meaning(hanzi), "space": space, "hint": self.decompose_hanzi(hanzi),
+            "actor": actor_match.group(1) if actor_match else "Неизвестный актер",
+            "location": actor_match.group(2) if actor_match else "Неизвестное место",
+            "stroke_tag": stroke_tag(self.create_stroke_image(hanzi)),
+        }
+
+    def make_note(self, offline, audio_tag="", story="", image_tag=""):
+        # --- FIXED: Aligned Note creation with model fields ---
+        # GUID зависит только от иероглифа: история, картинка и аудио, добавленные позже
+        # (bulk_build.py fill), обновляют ту же карточку при импорте
+        return genanki.Note(
+            model=self.model,
+            fields=[
+                offline["hanzi"], offline["pinyin"], offline["colored_pinyin"], offline["meaning_en"],
+                offline["space"], offline["hint"], audio_tag, story,
+                image_tag, offline["stroke_tag"],
+            ],
+            guid=note_guid(offline["hanzi"]),
+        )
+
+    def process_hanzi(self, hanzi):
+        hanzi = HanziConv.toSimplified(hanzi)
+        log.debug(f"Обрабатываем: {hanzi}", extra={"item": hanzi})
+
+        offline = self.offline_fields(hanzi)
+        meaning_en, actor, location, hint = offline["meaning_en"], offline["actor"], offline["location"], offline["hint"]
+
+        # Сетевые этапы: от истории зависит только картинка, остальное выполняется параллельно
+        graph = StageGraph()
+        graph.stage("meaning_ru", lambda: self.translate_en_ru(
+            self.components_db.parse_separated_values(meaning_en)[0] if meaning_en else hanzi))
+        graph.stage("audio", lambda: self.get_audio_from_forvo(hanzi))
+        graph.stage("story", lambda meaning_ru: self.generate_hanzi_movie_story(
+            hanzi, meaning_ru, actor, location, hint), ["meaning_ru"])
+        graph.stage("image", lambda meaning_ru, story: self.generate_story_image(
+            hanzi, meaning_ru, actor, location, story), ["meaning_ru", "story"])
+        stages = graph.run()
 
         audio_tag = ""
-        audio_file = self.get_audio_from_forvo(hanzi)
+        audio_file = stages["audio"]
         if audio_file:
             audio_tag = f"[sound:{os.path.basename(audio_file)}]"
             self.media_files.append(audio_file)
 
-        actor_match = re.match(r'\((.*?)\)\s*(.*)', space)
-        actor = actor_match.group(1) if actor_match else "Неизвестный актер"
-        location = actor_match.group(2) if actor_match else "Неизвестное место"
-        
-        story = self.generate_hanzi_movie_story(hanzi, meaning_ru, actor, location, hint)
-        
         image_tag = ""
-        image_file = self.generate_story_image(hanzi, meaning_ru, actor, location, story)
+        image_file = stages["image"]
         if image_file:
             image_tag = f'<img src="{os.path.basename(image_file)}">'
             self.media_files.append(image_file)
 
-        stroke_tag = ""
-        stroke_image_result = self.create_stroke_image(hanzi)
-        if stroke_image_result:
-            if isinstance(stroke_image_result, tuple):
-                _, all_svg_paths = stroke_image_result
-                stroke_tag = "".join(f'<img src="{os.path.basename(p)}">' for p in all_svg_paths)
-            else:
-                stroke_tag = f'<img src="{os.path.basename(stroke_image_result)}">'
+        self.deck.add_note(self.make_note(offline, audio_tag, stages["story"], image_tag))
 
-        # --- FIXED: Aligned Note creation with model fields ---
-        note = genanki.Note(
-            model=self.model,
-            fields=[
-                hanzi, pinyin_text, colored_pinyin, meaning_en,
-                space, hint, audio_tag, story,
-                image_tag, stroke_tag,
-            ],
-        )
-        self.deck.add_note(note)
+        time.sleep(self.request_delay)
+        return {"иероглиф": hanzi, "пиньинь": offline["pinyin"], "значение": meaning_en}
 
-        time.sleep(20)
-        return {"иероглиф": hanzi, "пиньинь": pinyin_text, "значение": meaning_en}
+    def write_package(self, output_file=output_deck, max_mb=MAX_PACKAGE_MB):
+        # Сжимаем изображения историй до размера отображения перед упаковкой
+        image_map = optimize_story_images([p for p in self.media_files if is_story_image(p)])
+        self.media_files = apply_media_mapping(self.deck.notes, self.media_files, image_map)
+        write_deck(self.deck, self.media_files, output_file, max_mb)
+        print(f"Created Anki deck: {output_file}")
+        print(self.svg_optimizer.report())
+        print(self.completion_cache.report())
 
     def create_deck_from_file(self, input_hanzi, output_file=output_deck):
-        results = [self.process_hanzi(hanzi) for hanzi in input_hanzi]
-        package = genanki.Package(self.deck)
-        package.media_files = self.media_files
-        package.write_to_file(output_file)
-        print(f"Created Anki deck: {output_file}")
+        results = []
+        with Progress(len(input_hanzi), "hmm") as progress:
+            for hanzi in input_hanzi:
+                results.append(self.process_hanzi(hanzi))
+                progress.advance()
+        self.write_package(output_file)
         
         if os.path.exists(input_file):
             os.makedirs(output_file_archive_path, exist_ok=True)
@@ -479,37 +478,16 @@ class HanziSpacesGenerator:
 
 async def google_translate_en(en_word):
     if not en_word: return ""
+    from googletrans import Translator
+
     translator = Translator()
     try:
         translation = await translator.translate(en_word, src="en", dest="ru")
         return translation.text
     except Exception as e:
-        print(f"Translation error: {e}")
+        log.warning(f"Translation error: {e}", extra={"item": en_word, "provider": "translate"})
         return en_word
 
-def check_input_duplicates(input_file, archive_path):
-    if not os.path.exists(input_file): return []
-    archived_words = set()
-    if os.path.exists(archive_path):
-        for file in os.listdir(archive_path):
-            try:
-                with open(os.path.join(archive_path, file), "r", encoding="utf-8") as f:
-                    archived_words.update(line.strip().replace("\u200b", "") for line in f if line.strip())
-            except Exception as e:
-                print(f"Could not read archive file {file}: {e}")
-    
-    with open(input_file, "r", encoding="utf-8") as f:
-        input_words = {line.strip().replace("\u200b", "") for line in f if line.strip() and is_chinese_char(line.strip())}
-    
-    new_words = list(input_words - archived_words)
-    print(f"Found {len(archived_words)} words in archive.")
-    print(f"Removed {len(input_words) - len(new_words)} duplicates.")
-    print(f"Found {len(new_words)} new words to process.")
-    return new_words
-
-def is_chinese_char(text):
-    return bool(text) and all(0x4E00 <= ord(char) <= 0x9FFF or 0x3400 <= ord(char) <= 0x4DBF for char in text)
-
 if __name__ == "__main__":
     generator = HanziSpacesGenerator()
     if not os.path.exists(input_file):
@@ -517,7 +495,11 @@ if __name__ == "__main__":
             f.write("爱\n")
         print(f"Создан пример файла: {input_file}")
 
-    checked_hanzi = check_input_duplicates(input_file, output_file_archive_path)
+    checked_hanzi = filter_known_words(check_input_duplicates(input_file, output_file_archive_path))
+    if "--plan" in sys.argv:
+        from run_planner import print_plan
+        print_plan("hmm", checked_hanzi)
+        sys.exit()
     if checked_hanzi:
         results = generator.create_deck_from_file(checked_hanzi)
         print("\nОбработанные иероглифы:")
@@ -0,0 +1,146 @@
+import glob
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Разбиение большой колоды на несколько .apkg-томов не больше заданного размера: AnkiMobile и
+# AnkiWeb плохо импортируют файлы в сотни мегабайт. Тома используют одни и те же ID модели и
+# колоды, поэтому после импорта всех томов получается одна колода. Медиа заметки всегда лежат
+# в том же томе, что и она (общий файл копируется в каждый том, где он нужен). Тома пишутся
+# параллельно: это в основном копирование медиа в zip без сжатия.
+#   MAX_PACKAGE_MB=200  — включить разбиение для write_package во всех скриптах
+MAX_PACKAGE_MB = float(os.getenv("MAX_PACKAGE_MB", "0")) or None
+VOLUME_WORKERS = 4
+COLLECTION_BYTES = 64 * 1024  # пустая collection.anki2 со схемой, моделью и колодой
+NOTE_BYTES = 1024             # строки notes и cards сверх текста полей
+ZIP_ENTRY_BYTES = 100         # локальный заголовок и запись центрального каталога
+
+_MEDIA_REFERENCE = re.compile(r'<img[^>]*\ssrc="([^"]+)"|\[sound:([^\]]+)\]')
+
+
+def field_references(fields):
+    """Media file names referenced by note fields (<img src="..."> and [sound:...])."""
+    return [image or sound for field in fields for image, sound in _MEDIA_REFERENCE.findall(field)]
+
+
+def media_references(note):
+    return field_references(note.fields)
+
+
+def megabytes(size):
+    return size / (1024 * 1024)
+
+
+def plan_volumes(notes, media_files, max_bytes):
+    """
+    Split `notes` in order into volumes of at most `max_bytes`.
+
+    Returns [(notes, media_files)]. A note whose own media exceeds the cap gets a
+    volume of its own. Media files no note references go into the first volume.
+    """
+    media_by_name = {os.path.basename(path): path for path in media_files}
+    sizes = {name: os.path.getsize(path) + ZIP_ENTRY_BYTES for name, path in media_by_name.items()}
+    volumes = []
+    current_notes, current_media, current_bytes = [], {}, COLLECTION_BYTES
+    referenced = set()
+    for note in notes:
+        names = [name for name in dict.fromkeys(media_references(note)) if name in media_by_name]
+        referenced.update(names)
+        added = NOTE_BYTES + sum(len(field.encode("utf-8")) for field in note.fields)
+        added += sum(sizes[name] for name in names if name not in current_media)
+        if current_notes and current_bytes + added > max_bytes:
+            volumes.append((current_notes, list(current_media.values())))
+            current_notes, current_media, current_bytes = [], {}, COLLECTION_BYTES
+            added = NOTE_BYTES + sum(len(field.encode("utf-8")) for field in note.fields)
+            added += sum(sizes[name] for name in names)
+        current_notes.append(note)
+        current_media.update((name, media_by_name[name]) for name in names)
+        current_bytes += added
+    if current_notes:
+        volumes.append((current_notes, list(current_media.values())))
+
+    unreferenced = [path for name, path in media_by_name.items() if name not in referenced]
+    if unreferenced:
+        if not volumes:
+            volumes.append(([], []))
+        volumes[0][1].extend(unreferenced)
+    return volumes
+
+
+def volume_paths(output_file, count):
+    """deck.apkg -> [deck.apkg] for one volume, else [deck.part01.apkg, deck.part02.apkg, ...]."""
+    if count <= 1:
+        return [output_file]
+    stem, ext = os.path.splitext(output_file)
+    width = max(2, len(str(count)))
+    return [f"{stem}.part{index:0{width}d}{ext or '.apkg'}" for index in range(1, count + 1)]
+
+
+def remove_stale_volumes(output_file, keep):
+    """Delete files of an earlier build (deck.apkg, deck.partNN.apkg) that are not in `keep`."""
+    # Иначе старый том легко импортировать вместе с новыми
+    stem, ext = os.path.splitext(output_file)
+    previous = set(glob.glob(f"{glob.escape(stem)}.part*{ext or '.apkg'}")) | {output_file}
+    for stale in previous - set(keep):
+        if os.path.exists(stale):
+            os.remove(stale)
+
+
+def _write_volume(deck, notes, media_files, path, timestamp):
+    import genanki
+
+    volume = genanki.Deck(deck.deck_id, deck.name, description=deck.description)
+    for note in notes:
+        volume.add_note(note)
+    package = genanki.Package(volume)
+    package.media_files = media_files
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    package.write_to_file(tmp_path, timestamp=timestamp)
+    os.replace(tmp_path, path)
+    return path, os.path.getsize(path)
+
+
+def write_volumes(deck, media_files, output_file, max_bytes, workers=VOLUME_WORKERS):
+    """Write `deck` as one or more .apkg volumes of at most `max_bytes`; returns [(path, size)]."""
+    volumes = plan_volumes(deck.notes, media_files, max_bytes)
+    paths = volume_paths(output_file, len(volumes))
+    remove_stale_volumes(output_file, paths)
+
+    # ID заметок и карточек genanki берёт из времени в миллисекундах: у каждого тома свой
+    # диапазон, чтобы ID разных томов не пересекались
+    timestamp = time.time()
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(volumes)))) as pool:
+        written = list(pool.map(
+            lambda args: _write_volume(deck, *args),
+            [(notes, media, path, timestamp + index * 3600)
+             for index, ((notes, media), path) in enumerate(zip(volumes, paths))]))
+    for (notes, media), (path, size) in zip(volumes, written):
+        over = " (over the limit: one note's media)" if size > max_bytes else ""
+        print(f"  {path}: {len(notes)} notes, {len(media)} media, {megabytes(size):.1f} MB{over}")
+    print(f"Wrote {len(written)} volumes in {time.monotonic() - started:.1f}s")
+    return written
+
+
+def write_deck(deck, media_files, output_file, max_mb=MAX_PACKAGE_MB):
+    """write_package backend: a single .apkg, or size-capped volumes when `max_mb` is set."""
+    import genanki
+
+    from deck_report import DECK_REPORT_TOP, format_report, report_deck
+    from task_dag import record_stage
+
+    started = time.perf_counter()
+    if max_mb:
+        written = write_volumes(deck, media_files, output_file, int(max_mb * 1024 * 1024))
+    else:
+        remove_stale_volumes(output_file, [output_file])
+        package = genanki.Package(deck)
+        package.media_files = media_files
+        package.write_to_file(output_file)
+        written = [(output_file, os.path.getsize(output_file))]
+    record_stage("package", time.perf_counter() - started)
+    if DECK_REPORT_TOP:
+        print(format_report(report_deck(deck, media_files), DECK_REPORT_TOP))
+    return written
+
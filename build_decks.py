@@ -0,0 +1,342 @@
+import argparse
+import functools
+import importlib
+import json
+import os
+import time
+from datetime import datetime
+
+from anki_collection import ANKI_COLLECTION_PATH, filter_known_words, load_collection_words
+from apkg_volumes import MAX_PACKAGE_MB
+from completion_cache import CompletionCache
+from input_words import is_chinese_char, read_archived_words
+from negative_cache import NegativeCache
+from progress_log import Progress
+from task_dag import reset_stage_timings
+
+# Единая точка входа: собирает любой набор колод в одном процессе.
+# Общие ресурсы (hanzi_db.txt, кэши, HTTP- и OpenAI-клиенты) загружаются один раз,
+# а слово, нужное нескольким колодам, обогащается (перевод, аудио, история) только один раз.
+
+BUILD_CONFIG_FILE = "build_config.json"
+
+# Порядок важен: истории генерируются раньше, чем HMM-колода, которая их переиспользует
+DECK_MODULES = {
+    "hmm_stories": "001_generate_du_chinese_hmm_stories",
+    "hmm_deck": "001_generate_du_chinese_hmm_deck",
+    "hmm": "anki_hanzi_movie_method_rus",
+    "words": "anki_hanyu",
+}
+# hmm_deck собирается из stories_for_review.json после ручной проверки историй, поэтому по
+# умолчанию не собирается: `--decks hmm_deck` отдельным запуском после правки файла
+DEFAULT_DECKS = ["hmm_stories", "hmm", "words"]
+
+DEFAULT_CONFIG = {
+    "input_file": "chinese_words.txt",
+    "decks": DEFAULT_DECKS,
+    "outputs": {
+        "words": "Duchinese_hsk1.apkg",
+        "hmm": "hanzi_spaces_actors_rus.apkg",
+        "hmm_deck": "duchinese_hanzi_spaces_actors_rus.apkg",
+    },
+    # Пропускать слова, уже записанные в архив соответствующей колоды
+    "skip_archived": True,
+    # Записывать обработанные слова в архив каждой колоды
+    "archive": True,
+    # Очищать входной файл после сборки
+    "clear_input": False,
+    # Собирать hmm_deck из историй, только что созданных hmm_stories в этом же запуске, без проверки.
+    # Такой файл историй не архивируется: архив считается проверенным (см. story_warehouse.py)
+    "build_unreviewed_stories": False,
+    # collection.anki2 или .apkg: слова, уже имеющиеся там, не обогащаются
+    "anki_collection": ANKI_COLLECTION_PATH,
+    # Максимальный размер .apkg в МБ: больше — несколько томов deck.part01.apkg, ... (см. apkg_volumes.py)
+    "max_package_mb": MAX_PACKAGE_MB,
+}
+
+# Методы генераторов, результат которых одинаков для всех колод: stage -> имена методов.
+# Истории сюда не входят: у hmm_stories и hmm разные промпты, а повторный запрос с тем же
+# промптом и так отвечает CompletionCache
+SHARED_STAGES = {
+    "audio": ("get_audio_from_forvo",),
+    "translate_en_ru": ("translate_en_ru",),
+    "dictionary": ("get_dictionary_data",),
+}
+
+
+def load_config(config_file=BUILD_CONFIG_FILE):
+    config = json.loads(json.dumps(DEFAULT_CONFIG))
+    if config_file and os.path.exists(config_file):
+        with open(config_file, 'r', encoding='utf-8') as f:
+            user_config = json.load(f)
+        outputs = {**config["outputs"], **user_config.pop("outputs", {})}
+        config.update(user_config)
+        config["outputs"] = outputs
+    unknown = [deck for deck in config["decks"] if deck not in DECK_MODULES]
+    if unknown:
+        raise ValueError(f"Unknown decks in config: {', '.join(unknown)}. Known: {', '.join(DECK_MODULES)}")
+    return config
+
+
+class SharedContext:
+    """
+    Warm state shared by every deck built in this process.
+
+    `stable_ids` gives every generator model and deck IDs derived from their names
+    (for repeated incremental builds), `request_delay` overrides the generators'
+    pause between items.
+    """
+
+    def __init__(self, stable_ids=False, request_delay=None):
+        import requests
+
+        self.modules = {}
+        self.negative_cache = NegativeCache()
+        self.completion_cache = CompletionCache()
+        self.http = requests.Session()
+        self.memo = {}
+        self.memo_hits = 0
+        self.stories_generated = False
+        self.stable_ids = stable_ids
+        self.request_delay = request_delay
+        self._components_db = None
+        self._openai_client = None
+
+    def module(self, deck):
+        name = DECK_MODULES[deck]
+        if name not in self.modules:
+            self.modules[name] = importlib.import_module(name)
+        return self.modules[name]
+
+    @property
+    def components_db(self):
+        if self._components_db is None:
+            from hanzi_components import HanziComponentsDB
+            self._components_db = HanziComponentsDB()
+        return self._components_db
+
+    @property
+    def openai_client(self):
+        if self._openai_client is None and os.getenv("OPENAI_API_KEY"):
+            from openai import OpenAI
+            self._openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        return self._openai_client
+
+    def attach(self, generator):
+        """Point a generator at the shared clients and memoize its shared stages."""
+        if hasattr(generator, "http"):
+            generator.http = self.http
+        if hasattr(generator, "openai_client"):
+            generator.openai_client = self.openai_client
+        if hasattr(generator, "completion_cache"):
+            generator.completion_cache = self.completion_cache
+        if self.stable_ids and hasattr(generator, "model"):
+            from shard_build import stable_id
+
+            # Иначе каждая партия создаёт при импорте новый тип заметок и новую колоду
+            generator.model.model_id = stable_id(generator.model.name)
+            generator.deck.deck_id = stable_id(generator.deck.name)
+        if self.request_delay is not None and hasattr(generator, "request_delay"):
+            generator.request_delay = self.request_delay
+        for stage, method_names in SHARED_STAGES.items():
+            for method_name in method_names:
+                if hasattr(generator, method_name):
+                    setattr(generator, method_name, self._memoized(stage, getattr(generator, method_name)))
+        return generator
+
+    def _memoized(self, stage, method):
+        @functools.wraps(method)
+        def wrapper(*args):
+            key = (stage,) + args
+            if key in self.memo:
+                self.memo_hits += 1
+                return self.memo[key]
+            result = method(*args)
+            self.memo[key] = result
+            return result
+        return wrapper
+
+
+def read_input_words(input_file):
+    if not os.path.exists(input_file):
+        return []
+    with open(input_file, 'r', encoding='utf-8') as f:
+        words = [line.strip().replace("\u200b", "") for line in f if line.strip()]
+    return list(dict.fromkeys(word for word in words if is_chinese_char(word)))
+
+
+def write_archive(archive_path, words, prefix):
+    if not words:
+        return
+    os.makedirs(archive_path, exist_ok=True)
+    archive_file = os.path.join(archive_path, f'{prefix}_{datetime.now().strftime("%Y-%m-%d_%H_%M_%S")}.txt')
+    with open(archive_file, 'w', encoding='utf-8') as f:
+        f.writelines(f"{word}\n" for word in words)
+    print(f"Archived {len(words)} words to {archive_file}")
+
+
+def archive_path_for(ctx, deck):
+    if deck == "words":
+        return "input_words_archive"
+    if deck == "hmm_deck":
+        return None  # колода из stories_for_review.json, архивируется сам файл историй
+    return ctx.module(deck).output_file_archive_path
+
+
+def build_hmm_stories(ctx, characters, config):
+    module = ctx.module("hmm_stories")
+    generator = ctx.attach(module.HanziStoryGenerator(components_db=ctx.components_db))
+    warehouse = module.StoryWarehouse()
+    warehouse.ingest()
+    stories = []
+    for hanzi in characters:
+        stories.append(module.build_story_data(generator, hanzi, warehouse))
+        time.sleep(1)  # Задержка между запросами к API, как в 001_generate_du_chinese_hmm_stories.py
+    module.save_stories_for_review(stories)
+    ctx.stories_generated = True
+    print(f"Saved {len(stories)} stories to {module.STORIES_JSON_FILE} for review.")
+
+
+def build_hmm_deck(ctx, characters, config):
+    module = ctx.module("hmm_deck")
+    if not os.path.exists(module.STORIES_JSON_FILE):
+        print(f"{module.STORIES_JSON_FILE} not found, skipping hmm_deck.")
+        return
+    if ctx.stories_generated and not config["build_unreviewed_stories"]:
+        print(f"{module.STORIES_JSON_FILE} was generated in this run and is not reviewed yet, skipping hmm_deck. "
+              f"Review it, then run with --decks hmm_deck (or pass --build-unreviewed-stories).")
+        return
+    with open(module.STORIES_JSON_FILE, 'r', encoding='utf-8') as f:
+        stories_data = json.load(f)
+    generator = ctx.attach(module.AnkiDeckGenerator(negative_cache=ctx.negative_cache))
+    module.build_deck(stories_data, config["outputs"]["hmm_deck"], generator, config["max_package_mb"])
+    # Непроверенные истории не попадают в архив, иначе хранилище историй примет их за проверенные
+    if config["archive"] and not ctx.stories_generated:
+        module.archive_stories_file()
+
+
+def build_hmm(ctx, characters, config):
+    module = ctx.module("hmm")
+    generator = ctx.attach(module.HanziSpacesGenerator(components_db=ctx.components_db,
+                                                        negative_cache=ctx.negative_cache))
+    with Progress(len(characters), "hmm") as progress:
+        for hanzi in characters:
+            generator.process_hanzi(hanzi)
+            progress.advance()
+    generator.write_package(config["outputs"]["hmm"], config["max_package_mb"])
+
+
+def build_words(ctx, words, config):
+    module = ctx.module("words")
+    generator = ctx.attach(module.ChineseAnkiGenerator(negative_cache=ctx.negative_cache))
+    with Progress(len(words), "words") as progress:
+        for word in words:
+            generator.process_word(word)
+            progress.advance()
+    generator.write_package(config["outputs"]["words"], config["max_package_mb"])
+
+
+BUILDERS = {
+    "hmm_stories": build_hmm_stories,
+    "hmm_deck": build_hmm_deck,
+    "hmm": build_hmm,
+    "words": build_words,
+}
+
+
+def deck_items(config, ctx, words=None):
+    """Yield (deck, items, archive_path) for every configured deck, after the archive and collection filters."""
+    words = read_input_words(config["input_file"]) if words is None else words
+    # HMM-колоды работают с отдельными иероглифами
+    characters = list(dict.fromkeys(char for word in words for char in word))
+    collection = config.get("anki_collection")
+    known_words = load_collection_words(collection) if collection and os.path.exists(collection) else None
+
+    for deck in DECK_MODULES:
+        if deck not in config["decks"]:
+            continue
+        items = words if deck == "words" else characters
+        archive_path = archive_path_for(ctx, deck)
+        if archive_path and config["skip_archived"]:
+            archived = read_archived_words(archive_path)
+            items = [item for item in items if item not in archived]
+        if known_words is not None:
+            items = filter_known_words(items, known_words=known_words)
+        yield deck, items, archive_path
+
+
+def build(config, ctx=None, words=None):
+    """Build every deck listed in config["decks"] from one word list."""
+    ctx = ctx or SharedContext()
+    # Новые слова всех колод определяются до сборки: hmm_stories и hmm делят один архив,
+    # и архив первой колоды иначе скрыл бы все слова от второй
+    pending = list(deck_items(config, ctx, words))
+    for deck, items, archive_path in pending:
+        if not items and deck != "hmm_deck":
+            print(f"[{deck}] nothing new to process.")
+            continue
+        print(f"\n=== [{deck}] {len(items)} items ===")
+        # Время этапов в отчёте после сборки — только для этой колоды
+        reset_stage_timings()
+        BUILDERS[deck](ctx, items, config)
+        if archive_path and config["archive"]:
+            write_archive(archive_path, items, "chinese_words" if deck != "hmm_stories" else "processed")
+
+    if config["clear_input"] and os.path.exists(config["input_file"]):
+        open(config["input_file"], 'w').close()
+    print(f"\nShared enrichment reused {ctx.memo_hits} times across decks.")
+    print(ctx.completion_cache.report())
+    return ctx
+
+
+def plan(config, ctx=None, words=None):
+    """Print the run plan of every configured deck without calling any API."""
+    from run_planner import print_plan
+
+    ctx = ctx or SharedContext()
+    for deck, items, _ in deck_items(config, ctx, words):
+        if deck == "hmm_deck":
+            items = read_story_characters(ctx.module(deck).STORIES_JSON_FILE)
+        print_plan(deck, items)
+        print()
+
+
+def read_story_characters(stories_file):
+    if not os.path.exists(stories_file):
+        return []
+    with open(stories_file, 'r', encoding='utf-8') as f:
+        return [story["hanzi"] for story in json.load(f)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build several Anki decks in one process with shared state")
+    parser.add_argument("--config", default=BUILD_CONFIG_FILE, help=f"JSON config (default: {BUILD_CONFIG_FILE})")
+    parser.add_argument("--decks", help=f"comma-separated subset of: {', '.join(DECK_MODULES)}")
+    parser.add_argument("--input", help="word list file (overrides config input_file)")
+    parser.add_argument("--plan", action="store_true", help="only estimate API calls, time and cost, then exit")
+    parser.add_argument("--max-size-mb", type=float,
+                        help="split each deck into .apkg volumes of at most this size (overrides max_package_mb)")
+    parser.add_argument("--build-unreviewed-stories", action="store_true",
+                        help="build hmm_deck from stories generated by hmm_stories in the same run, without review")
+    args = parser.parse_args()
+
+    config = load_config(args.config)
+    if args.max_size_mb:
+        config["max_package_mb"] = args.max_size_mb
+    if args.build_unreviewed_stories:
+        config["build_unreviewed_stories"] = True
+    if args.decks:
+        config["decks"] = [deck.strip() for deck in args.decks.split(",") if deck.strip()]
+        unknown = [deck for deck in config["decks"] if deck not in DECK_MODULES]
+        if unknown:
+            parser.error(f"unknown decks: {', '.join(unknown)}")
+    if args.input:
+        config["input_file"] = args.input
+    if args.plan:
+        plan(config)
+        return
+    build(config)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+import argparse
+import importlib
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from build_decks import DECK_MODULES, write_archive
+from hanzi_components import HANZI_DB_FILE, HanziComponentsDB
+from input_words import read_archived_words
+from progress_log import Progress
+from shard_build import merge_media, stable_id
+
+# Справочная HMM-колода по всему hanzi_db.txt. Шаг `offline` за минуты строит в пуле процессов
+# все поля, не требующие сети (пиньинь, значение, пространство, актёр, подсказка, SVG штрихов).
+# Шаг `fill` постепенно дописывает платные поля (история, картинка, аудио) в те же карточки:
+# GUID карточки зависит только от иероглифа, а ID модели и колоды — только от их имён.
+CATALOG_OUTPUT = "hanzi_catalog_rus.apkg"
+FILL_OUTPUT = "hanzi_catalog_fill_rus.apkg"
+CHUNK_SIZE = 64
+
+_generator = None
+
+
+def _init_worker():
+    global _generator
+    module = importlib.import_module(DECK_MODULES["hmm"])
+    _generator = module.HanziSpacesGenerator()
+
+
+def _offline_note(hanzi):
+    """Worker: offline fields and stroke media for one character, or an error message."""
+    _generator.media_files = []
+    _generator.svg_optimizer.stats = {}
+    try:
+        offline = _generator.offline_fields(hanzi)
+    except Exception as e:
+        return hanzi, None, [], {}, f"{type(e).__name__}: {e}"
+    return hanzi, offline, _generator.media_files, _generator.svg_optimizer.stats, None
+
+
+def catalog_characters(db_file=HANZI_DB_FILE, components_db=None):
+    """Every simplified character of hanzi_db.txt, components before the characters built from them."""
+    from hanziconv import HanziConv
+
+    components_db = components_db or HanziComponentsDB(db_file)
+    characters = dict.fromkeys(HanziConv.toSimplified(char) for char in components_db.db)
+    return components_db.order_by_components([char for char in characters if char in components_db.db])
+
+
+def stable_generator(module):
+    generator = module.HanziSpacesGenerator()
+    generator.model.model_id = stable_id(generator.model.name)
+    generator.deck.deck_id = stable_id(generator.deck.name)
+    return generator
+
+
+def build_catalog(characters, output_file=CATALOG_OUTPUT, workers=os.cpu_count()):
+    """Build the offline-only deck for `characters` on a process pool."""
+    module = importlib.import_module(DECK_MODULES["hmm"])
+    started = time.monotonic()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        results = list(pool.map(_offline_note, characters, chunksize=CHUNK_SIZE))
+    print(f"Offline fields for {len(characters)} characters in {time.monotonic() - started:.1f}s "
+          f"with {workers} workers")
+
+    generator = stable_generator(module)
+    media_lists = []
+    for hanzi, offline, media_files, stats, error in results:
+        if offline is None:
+            print(f"Skipped {hanzi}: {error}")
+            continue
+        generator.deck.add_note(generator.make_note(offline))
+        generator.svg_optimizer.stats.update(stats)
+        media_lists.append(media_files)
+    generator.media_files = merge_media(media_lists)
+    generator.write_package(output_file)
+    return generator
+
+
+def fill_catalog(characters, output_file=FILL_OUTPUT, limit=None):
+    """Generate story, image and audio for the next `limit` characters not filled yet."""
+    module = importlib.import_module(DECK_MODULES["hmm"])
+    archived = read_archived_words(module.output_file_archive_path)
+    pending = [char for char in characters if char not in archived][:limit]
+    if not pending:
+        print("Every catalog character already has a story.")
+        return []
+    print(f"Filling {len(pending)} characters ({sum(char not in archived for char in characters)} still without a story)")
+    generator = stable_generator(module)
+    results = []
+    with Progress(len(pending), "fill") as progress:
+        for hanzi in pending:
+            results.append(generator.process_hanzi(hanzi))
+            progress.advance()
+    generator.write_package(output_file)
+    write_archive(module.output_file_archive_path, pending, "chinese_words")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reference HMM deck for every character in hanzi_db.txt")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    offline = subparsers.add_parser("offline", help="build the deck with offline fields only")
+    offline.add_argument("--output", default=CATALOG_OUTPUT)
+    offline.add_argument("--workers", type=int, default=os.cpu_count())
+    offline.add_argument("--limit", type=int, help="only the first N characters (components first)")
+    fill = subparsers.add_parser("fill", help="add story, image and audio to the next N characters")
+    fill.add_argument("--output", default=FILL_OUTPUT)
+    fill.add_argument("--limit", type=int, default=100)
+    args = parser.parse_args()
+
+    characters = catalog_characters()
+    if args.command == "offline":
+        build_catalog(characters[:args.limit] if args.limit else characters, args.output, args.workers)
+    else:
+        fill_catalog(characters, args.output, args.limit)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+import argparse
+import importlib
+import json
+import os
+import subprocess
+import sys
+
+# Общая точка входа. Каждая подкоманда импортирует только то, что ей нужно:
+# `check` и `dedupe` работают без openai, genanki, googletrans и прочих SDK.
+
+# Источник слов -> (входной файл, папка архива); значения совпадают с настройками скриптов
+CHECK_SOURCES = {
+    "words": ("chinese_words.txt", "input_words_archive"),
+    "hmm": ("du_chinese_words_hanzi_movie_method.txt", "input_words_du_chinese_hmm_archive"),
+    "stories": ("input_du_chinese_words_hanzi_movie_method.txt", "input_words_du_chinese_hmm_archive"),
+}
+
+HEAVY_MODULES = ("openai", "genanki", "googletrans", "pypinyin", "hanziconv", "requests", "replicate")
+# Модули, которые импортируют лёгкие подкоманды, и бюджет на их импорт
+LIGHT_COMMAND_IMPORTS = {
+    "check": ["input_words"],
+    "dedupe": ["remove_duplicates_from_apkg"],
+}
+IMPORT_BUDGET_MS = 50
+
+
+def cmd_check(args):
+    from input_words import check_input_duplicates
+
+    input_file, archive_path = CHECK_SOURCES[args.source]
+    new_words = check_input_duplicates(args.input or input_file, args.archive or archive_path)
+    if args.collection:
+        from anki_collection import filter_known_words
+
+        new_words = filter_known_words(new_words, args.collection)
+    if args.order_components:
+        from hanzi_components import HanziComponentsDB
+
+        new_words = HanziComponentsDB().order_by_components(list(new_words))
+    else:
+        new_words = sorted(new_words)
+    for word in new_words:
+        print(word)
+
+
+def cmd_stories(args):
+    importlib.import_module("001_generate_du_chinese_hmm_stories").main()
+
+
+def cmd_deck(args):
+    from build_decks import DECK_MODULES, build, load_config, plan
+
+    config = load_config(args.config)
+    if args.decks:
+        config["decks"] = [deck.strip() for deck in args.decks.split(",") if deck.strip()]
+        unknown = [deck for deck in config["decks"] if deck not in DECK_MODULES]
+        if unknown:
+            sys.exit(f"unknown decks: {', '.join(unknown)}")
+    if args.input:
+        config["input_file"] = args.input
+    if args.max_size_mb:
+        config["max_package_mb"] = args.max_size_mb
+    if args.build_unreviewed_stories:
+        config["build_unreviewed_stories"] = True
+    if args.plan:
+        plan(config)
+        return
+    build(config)
+
+
+def cmd_dedupe(args):
+    from remove_duplicates_from_apkg import remove_duplicates_from_apkg
+
+    output_path = args.output or args.input.replace('.apkg', '_no_duplicates.apkg')
+    remove_duplicates_from_apkg(args.input, output_path)
+
+
+def cmd_convert(args):
+    from traditional_to_simplified import process_html_directory
+
+    process_html_directory(args.input_dir, args.output_dir)
+
+
+def cmd_vocab(args):
+    from vocab_extractor import VOCAB_TARGETS, append_words, extract_vocabulary
+
+    ranked = [(word, count) for word, count in extract_vocabulary(args.paths, args.target)
+              if len(word) >= args.min_length][:args.limit]
+    if args.write:
+        append_words(VOCAB_TARGETS[args.target][0], [word for word, _ in ranked])
+    else:
+        for word, count in ranked:
+            print(f"{count:6d}  {word}")
+
+
+def measure_imports(modules):
+    """Import `modules` in a fresh interpreter; return (milliseconds, heavy SDKs that got loaded)."""
+    code = (
+        "import json, sys, time\n"
+        "started = time.perf_counter()\n"
+        "import cli\n"
+        f"for name in {modules!r}: __import__(name)\n"
+        "elapsed = (time.perf_counter() - started) * 1000\n"
+        f"print(json.dumps([elapsed, [m for m in {HEAVY_MODULES!r} if m in sys.modules]]))\n"
+    )
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+    elapsed, heavy = json.loads(output.strip().splitlines()[-1])
+    return elapsed, heavy
+
+
+def check_import_budget(budget_ms=IMPORT_BUDGET_MS):
+    failures = []
+    for command, modules in LIGHT_COMMAND_IMPORTS.items():
+        elapsed, heavy = measure_imports(modules)
+        print(f"{command}: {elapsed:.1f} ms (budget {budget_ms} ms)" + (f", loads {', '.join(heavy)}" if heavy else ""))
+        if heavy or elapsed > budget_ms:
+            failures.append(command)
+    if failures:
+        sys.exit(f"Import budget exceeded for: {', '.join(failures)}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Chinese Anki deck tools")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    check = subparsers.add_parser("check", help="list new words that are not in the archive yet")
+    check.add_argument("source", nargs="?", default="words", choices=list(CHECK_SOURCES))
+    check.add_argument("--input", help="input file (default depends on source)")
+    check.add_argument("--archive", help="archive folder (default depends on source)")
+    check.add_argument("--collection", help="also skip words already in this collection.anki2 or .apkg")
+    check.add_argument("--order-components", action="store_true",
+                       help="list components before the characters built from them")
+    check.set_defaults(func=cmd_check)
+
+    stories = subparsers.add_parser("stories", help="generate HMM stories for review (001_generate_du_chinese_hmm_stories.py)")
+    stories.set_defaults(func=cmd_stories)
+
+    deck = subparsers.add_parser("deck", help="build decks (see build_decks.py)")
+    deck.add_argument("--config", default="build_config.json")
+    deck.add_argument("--decks", help="comma-separated subset of: words, hmm, hmm_stories, hmm_deck")
+    deck.add_argument("--input", help="word list file (overrides config input_file)")
+    deck.add_argument("--plan", action="store_true", help="only estimate API calls, time and cost, then exit")
+    deck.add_argument("--max-size-mb", type=float, help="split each deck into .apkg volumes of at most this size")
+    deck.add_argument("--build-unreviewed-stories", action="store_true",
+                      help="build hmm_deck from stories generated in the same run, without review")
+    deck.set_defaults(func=cmd_deck)
+
+    dedupe = subparsers.add_parser("dedupe", help="remove duplicate notes from an .apkg")
+    dedupe.add_argument("input")
+    dedupe.add_argument("output", nargs="?")
+    dedupe.set_defaults(func=cmd_dedupe)
+
+    convert = subparsers.add_parser("convert", help="convert HTML files from traditional to simplified characters")
+    convert.add_argument("input_dir")
+    convert.add_argument("output_dir")
+    convert.set_defaults(func=cmd_convert)
+
+    vocab = subparsers.add_parser("vocab", help="find new vocabulary in lesson texts (see vocab_extractor.py)")
+    vocab.add_argument("paths", nargs="+")
+    vocab.add_argument("--target", choices=["words", "hmm"], default="words")
+    vocab.add_argument("--min-length", type=int, default=1)
+    vocab.add_argument("--limit", type=int)
+    vocab.add_argument("--write", action="store_true", help="append the result to the target's input file")
+    vocab.set_defaults(func=cmd_vocab)
+
+    budget = subparsers.add_parser("budget", help="check that quick subcommands stay within the import budget")
+    budget.add_argument("--ms", type=float, default=IMPORT_BUDGET_MS)
+    budget.set_defaults(func=lambda args: check_import_budget(args.ms))
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+import argparse
+import hashlib
+import json
+import os
+import time
+
+from progress_log import cache_lookup
+
+# Кэш ответов chat completions: ключ — хэш (модель, системный промпт, промпт, temperature, max_tokens).
+# Один JSON-файл на ответ, поэтому кэш безопасен для параллельных процессов (shard_build.py).
+COMPLETION_CACHE_DIR = "completion_cache"
+# reuse   — вернуть сохранённый ответ, если есть (детерминированная пересборка, 0 токенов)
+# refresh — всегда запрашивать заново и перезаписывать сохранённый ответ
+# off     — не читать и не писать кэш
+COMPLETION_CACHE_POLICY = os.getenv("OPENAI_CACHE_POLICY", "refresh")
+POLICIES = ("reuse", "refresh", "off")
+
+
+def completion_key(model, system_prompt, user_prompt, temperature, max_tokens):
+    payload = json.dumps([model, system_prompt, user_prompt, temperature, max_tokens], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class CompletionCache:
+    """Stores full chat completion responses with their token usage, keyed by the request."""
+
+    def __init__(self, cache_dir=COMPLETION_CACHE_DIR, policy=COMPLETION_CACHE_POLICY):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown completion cache policy {policy!r}, expected one of {', '.join(POLICIES)}")
+        self.cache_dir = cache_dir
+        self.policy = policy
+        self.hits = 0
+        self.misses = 0
+        self.tokens_saved = 0
+        self.tokens_spent = 0
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def get(self, key):
+        try:
+            with open(self._path(key), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (json.JSONDecodeError, OSError) as e:
+            print(f"Could not read cached completion {key}: {e}")
+            return None
+
+    def put(self, key, entry):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entry, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, path)
+
+    def complete(self, get_client, model, system_prompt, user_prompt, temperature, max_tokens):
+        """
+        Return the completion text for the request, from the cache when the policy allows.
+
+        `get_client` is only called on a cache miss, so a fully cached rebuild needs no API key.
+        """
+        key = completion_key(model, system_prompt, user_prompt, temperature, max_tokens)
+        if self.policy == "reuse":
+            cached = self.get(key)
+            cache_lookup("openai", bool(cached))
+            if cached:
+                self.hits += 1
+                self.tokens_saved += cached.get("usage", {}).get("total_tokens", 0)
+                return cached["response"]["content"]
+
+        response = get_client().chat.completions.create(
+            model=model,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ],
+            max_tokens=max_tokens, temperature=temperature
+        )
+        self.misses += 1
+        content = response.choices[0].message.content.strip()
+        usage = response.usage.model_dump() if getattr(response, "usage", None) else {}
+        self.tokens_spent += usage.get("total_tokens", 0)
+        if self.policy != "off":
+            self.put(key, {
+                "request": {"model": model, "system": system_prompt, "prompt": user_prompt,
+                            "temperature": temperature, "max_tokens": max_tokens},
+                "response": {"id": response.id, "model": response.model, "content": content,
+                             "finish_reason": response.choices[0].finish_reason},
+                "usage": usage,
+                "created_at": time.time(),
+            })
+        return content
+
+    def report(self):
+        return (f"Completions ({self.policy}): {self.hits} cached, {self.misses} requested, "
+                f"{self.tokens_saved} tokens saved, {self.tokens_spent} tokens spent")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect the OpenAI completion cache")
+    parser.add_argument("--dir", default=COMPLETION_CACHE_DIR)
+    args = parser.parse_args()
+
+    entries = tokens = 0
+    for root, _, files in os.walk(args.dir):
+        for name in files:
+            if name.endswith(".json"):
+                with open(os.path.join(root, name), 'r', encoding='utf-8') as f:
+                    tokens += json.load(f).get("usage", {}).get("total_tokens", 0)
+                entries += 1
+    print(f"{entries} cached completions in {args.dir}, {tokens} tokens in total")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+import argparse
+import json
+import os
+import sqlite3
+import tempfile
+import zipfile
+from collections import Counter
+
+from anki_collection import COLLECTION_NAMES
+from apkg_volumes import field_references, megabytes
+from task_dag import stage_timings
+
+# Отчёт о составе колоды: почему .apkg большой или долго импортируется. Считает заметки и
+# карточки, байты медиа по типам, самые большие файлы, файлы, нужные нескольким заметкам,
+# и файлы, на которые не ссылается ни одна заметка. Для готового .apkg читается только
+# каталог zip и collection.anki2, медиа не распаковываются.
+#   DECK_REPORT_TOP=0  — не печатать отчёт после сборки
+DECK_REPORT_TOP = int(os.getenv("DECK_REPORT_TOP", "5"))
+
+MEDIA_KINDS = {
+    ".png": "story images", ".jpg": "story images", ".jpeg": "story images", ".webp": "story images",
+    ".gif": "story images",
+    ".mp3": "audio", ".ogg": "audio", ".wav": "audio",
+    ".svg": "stroke SVGs",
+}
+
+
+def media_kind(name):
+    return MEDIA_KINDS.get(os.path.splitext(name)[1].lower(), "other")
+
+
+def analyze(note_fields, media_sizes, cards):
+    """
+    Composition of a deck from its notes' fields and {media name: bytes}.
+
+    `note_fields` is a list of field lists, `cards` the number of cards.
+    """
+    users = Counter()
+    missing = set()
+    for fields in note_fields:
+        for name in set(field_references(fields)):
+            if name in media_sizes:
+                users[name] += 1
+            else:
+                missing.add(name)
+    kinds = {}
+    for name, size in media_sizes.items():
+        count, total = kinds.get(media_kind(name), (0, 0))
+        kinds[media_kind(name)] = (count + 1, total + size)
+    return {
+        "notes": len(note_fields),
+        "cards": cards,
+        "media_files": len(media_sizes),
+        "media_bytes": sum(media_sizes.values()),
+        "kinds": kinds,
+        "largest": sorted(media_sizes.items(), key=lambda item: item[1], reverse=True),
+        "shared": sorted(((name, count) for name, count in users.items() if count > 1),
+                         key=lambda item: item[1], reverse=True),
+        "unreferenced": sorted(name for name in media_sizes if name not in users),
+        "missing": sorted(missing),
+        "stages": {},
+    }
+
+
+def report_deck(deck, media_files):
+    """Report on an in-memory genanki deck and the media list it will be packaged with."""
+    media_sizes = {os.path.basename(path): os.path.getsize(path) for path in media_files if os.path.exists(path)}
+    report = analyze([note.fields for note in deck.notes], media_sizes, sum(len(note.cards) for note in deck.notes))
+    report["stages"] = stage_timings()
+    return report
+
+
+def report_apkg(path):
+    """Report on an existing .apkg without extracting its media files."""
+    with zipfile.ZipFile(path) as apkg:
+        media_map = json.loads(apkg.read("media") or b"{}") if "media" in apkg.NameToInfo else {}
+        # Размеры берутся из центрального каталога zip
+        media_sizes = {name: apkg.NameToInfo[index].file_size
+                       for index, name in media_map.items() if index in apkg.NameToInfo}
+        collection = next((n for n in COLLECTION_NAMES if n in apkg.NameToInfo), None)
+        if collection is None:
+            raise ValueError(f"{path}: no collection.anki2/collection.anki21 inside")
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            conn = sqlite3.connect(apkg.extract(collection, tmp_dir))
+            try:
+                note_fields = [row[0].split("\x1f") for row in conn.execute("SELECT flds FROM notes")]
+                cards = conn.execute("SELECT count(*) FROM cards").fetchone()[0]
+            finally:
+                conn.close()
+    report = analyze(note_fields, media_sizes, cards)
+    report["package_bytes"] = os.path.getsize(path)
+    return report
+
+
+def format_report(report, top=10):
+    lines = [f"Notes: {report['notes']}, cards: {report['cards']}, "
+             f"media: {report['media_files']} files, {megabytes(report['media_bytes']):.1f} MB"
+             + (f", package: {megabytes(report['package_bytes']):.1f} MB" if "package_bytes" in report else "")]
+    for kind, (count, size) in sorted(report["kinds"].items(), key=lambda item: item[1][1], reverse=True):
+        lines.append(f"  {kind}: {count} files, {megabytes(size):.1f} MB")
+    if report["largest"]:
+        lines.append("Largest media:")
+        lines.extend(f"  {size / 1024:9.1f} KB  {name}" for name, size in report["largest"][:top])
+    if report["shared"]:
+        lines.append(f"Media used by several notes: {len(report['shared'])}")
+        lines.extend(f"  {count:4d} notes  {name}" for name, count in report["shared"][:top])
+    if report["unreferenced"]:
+        unreferenced = set(report["unreferenced"])
+        wasted = sum(size for name, size in report["largest"] if name in unreferenced)
+        lines.append(f"Media no note references: {len(report['unreferenced'])} files, {megabytes(wasted):.1f} MB")
+        lines.extend(f"  {name}" for name in report["unreferenced"][:top])
+    if report["missing"]:
+        lines.append(f"Referenced but not packaged: {len(report['missing'])}")
+        lines.extend(f"  {name}" for name in report["missing"][:top])
+    if report["stages"]:
+        # Этапы идут параллельно, поэтому сумма больше времени сборки
+        lines.append("Stage time (summed over threads):")
+        for name, (calls, seconds) in sorted(report["stages"].items(), key=lambda item: item[1][1], reverse=True):
+            lines.append(f"  {name}: {calls} calls, {seconds:.1f}s, {1000 * seconds / calls:.0f} ms avg")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report what an .apkg consists of and where its size goes")
+    parser.add_argument("apkg", nargs="+")
+    parser.add_argument("--top", type=int, default=10, help="entries per list (default: 10)")
+    parser.add_argument("--json", action="store_true", help="print the full report as JSON")
+    args = parser.parse_args()
+
+    for path in args.apkg:
+        report = report_apkg(path)
+        if args.json:
+            print(json.dumps({"apkg": path, **report}, ensure_ascii=False))
+        else:
+            print(f"== {path}")
+            print(format_report(report, args.top))
+
+
+if __name__ == "__main__":
+    main()
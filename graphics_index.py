@@ -0,0 +1,100 @@
+import json
+import os
+import re
+from collections.abc import Mapping
+
+# Path to makemeahanzi graphics.txt
+GRAPHICS_PATH = "graphics.txt"
+
+_CHARACTER_PREFIX = re.compile(rb'^\{\s*"character"\s*:\s*"((?:[^"\\]|\\.)+)"')
+
+
+class GraphicsIndex(Mapping):
+    """
+    Lazy, read-only view of makemeahanzi graphics.txt.
+
+    A byte-offset index (graphics.txt.idx) is built once and reused while the
+    source file is unchanged. Stroke data for a character is parsed from its line
+    on first access only, so startup cost does not depend on the file size.
+    With `save_index=False` a missing or stale index is built in memory only.
+    """
+
+    def __init__(self, graphics_path=GRAPHICS_PATH, index_path=None, save_index=True):
+        self.graphics_path = graphics_path
+        self.index_path = index_path or f"{graphics_path}.idx"
+        self.save_index = save_index
+        self._file = None
+        self._cache = {}
+        self.offsets = self._load_index() if os.path.exists(graphics_path) else {}
+
+    @property
+    def available(self):
+        return bool(self.offsets)
+
+    def _source_stamp(self):
+        stat = os.stat(self.graphics_path)
+        return {"size": stat.st_size, "mtime": stat.st_mtime}
+
+    def _load_index(self):
+        stamp = self._source_stamp()
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+            if index.get("size") == stamp["size"] and index.get("mtime") == stamp["mtime"]:
+                return index["offsets"]
+        except (FileNotFoundError, json.JSONDecodeError, KeyError):
+            pass
+        return self._build_index(stamp)
+
+    def _build_index(self, stamp):
+        offsets = {}
+        offset = 0
+        with open(self.graphics_path, 'rb') as f:
+            for line in f:
+                match = _CHARACTER_PREFIX.match(line)
+                if match:
+                    character = json.loads(b'"' + match.group(1) + b'"')
+                elif line.strip():
+                    character = json.loads(line)['character']
+                else:
+                    character = None
+                if character:
+                    offsets[character] = [offset, len(line)]
+                offset += len(line)
+        if not self.save_index:
+            return offsets
+        try:
+            tmp_path = f"{self.index_path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({**stamp, "offsets": offsets}, f, ensure_ascii=False)
+            os.replace(tmp_path, self.index_path)
+            print(f"Built stroke data index {self.index_path} ({len(offsets)} characters)")
+        except OSError as e:
+            print(f"Could not save stroke data index {self.index_path}: {e}")
+        return offsets
+
+    def __getitem__(self, character):
+        if character in self._cache:
+            return self._cache[character]
+        offset, length = self.offsets[character]
+        if self._file is None:
+            self._file = open(self.graphics_path, 'rb')
+        self._file.seek(offset)
+        data = json.loads(self._file.read(length))
+        entry = {'strokes': data['strokes'], 'medians': data['medians']}
+        self._cache[character] = entry
+        return entry
+
+    def __contains__(self, character):
+        return character in self.offsets
+
+    def __iter__(self):
+        return iter(self.offsets)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
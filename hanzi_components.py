@@ -0,0 +1,228 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+# База разложений иероглифов hanzi_db.txt (по одному JSON на строку), общая для скриптов HMM.
+# В памяти хранятся только поля, которые читают генераторы; массивы `matches` и остальная
+# этимология отбрасываются при загрузке, строки интернируются, компоненты хранятся кортежами.
+HANZI_DB_FILE = "hanzi_db.txt"
+
+IDC_MEANINGS = {
+    '⿰': 'слева направо', '⿱': 'сверху вниз', '⿲': 'три части горизонтально',
+    '⿳': 'три части вертикально', '⿴': 'внешнее-внутреннее', '⿵': 'верхняя рамка',
+    '⿶': 'нижняя рамка', '⿷': 'левая рамка', '⿸': 'верхне-левая рамка',
+    '⿹': 'верхне-правая рамка', '⿺': 'нижне-левая рамка', '⿻': 'пересекающиеся компоненты'
+}
+# Так в hanzi_db.txt обозначен неизвестный компонент
+UNKNOWN_COMPONENT = '？'
+
+
+class HanziRecord:
+    """One hanzi_db.txt entry, reduced to the fields the deck generators use."""
+
+    __slots__ = ("definition", "pinyin", "decomposition", "components", "radical", "etymology_hint")
+
+    def __init__(self, definition, pinyin, decomposition, components, radical, etymology_hint):
+        self.definition = definition
+        self.pinyin = pinyin
+        self.decomposition = decomposition
+        self.components = components
+        self.radical = radical
+        self.etymology_hint = etymology_hint
+
+    @classmethod
+    def from_json(cls, data):
+        intern = sys.intern
+        decomposition = intern(data.get('decomposition', ''))
+        return cls(
+            definition=intern(data.get('definition', '')),
+            pinyin=tuple(intern(p) for p in data.get('pinyin', ())),
+            decomposition=decomposition,
+            components=tuple(intern(char) for char in decomposition[1:] if char not in IDC_MEANINGS),
+            radical=intern(data.get('radical', '')),
+            etymology_hint=intern(data.get('etymology', {}).get('hint', '')),
+        )
+
+
+class HanziComponentsDB:
+    def __init__(self, db_file=HANZI_DB_FILE):
+        self.db = self._load_db(db_file)
+        self.component_meanings = IDC_MEANINGS
+        self._build_graph()
+
+    def _load_db(self, db_file):
+        db = {}
+        try:
+            with open(db_file, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        data = json.loads(line)
+                        db[sys.intern(data['character'])] = HanziRecord.from_json(data)
+        except FileNotFoundError:
+            print(f"Файл {db_file} не найден! Будет использован пустой словарь.")
+        return db
+
+    def parse_separated_values(self, input_string):
+        standardized = str(input_string).replace(';', ',')
+        values = [item.strip() for item in standardized.split(',')]
+        return [item for item in values if item]
+
+    def _build_graph(self):
+        """
+        Precompute, once for the whole DB: the hint text of every character, its full
+        component tree down to primitives, the flat set of everything it contains and the
+        reverse index component -> characters that contain it at any depth.
+        """
+        short_meanings = {}
+        for char, record in self.db.items():
+            meanings = self.parse_separated_values(record.definition) if record.definition else []
+            short_meanings[char] = meanings[0] if meanings else ""
+        self.hints = {
+            char: sys.intern(", ".join(f'{component} ({short_meanings.get(component, "")})'
+                                       for component in record.components))
+            for char, record in self.db.items()
+        }
+
+        self.trees = {}
+        self.descendants = {}
+        for char in self.db:
+            self._tree(char, frozenset())
+
+        containing = defaultdict(list)
+        for char in self.db:
+            for component in self.descendants[char]:
+                containing[component].append(char)
+        self.containing = {component: tuple(chars) for component, chars in containing.items()}
+
+    def _tree(self, char, path):
+        """((component, subtree), ...) for `char`; primitives and unknown characters have ()."""
+        if char in self.trees:
+            return self.trees[char]
+        record = self.db.get(char)
+        # Некоторые записи ссылаются сами на себя или друг на друга — такие ветви обрываются
+        children = tuple(
+            (component, self._tree(component, path | {char}))
+            for component in (record.components if record else ())
+            if component != UNKNOWN_COMPONENT and component != char and component not in path
+        )
+        descendants = set()
+        for component, _ in children:
+            descendants.add(component)
+            descendants.update(self.descendants.get(component, ()))
+        self.trees[char] = children
+        self.descendants[char] = frozenset(descendants)
+        return children
+
+    def get_hanzi_components(self, hanzi):
+        record = self.db.get(hanzi)
+        if record is None:
+            return None
+        return {
+            'character': hanzi, 'structure': self._structure(record.decomposition),
+            'components': record.components, 'components_with_meaning': self.hints[hanzi],
+            'radical': record.radical, 'etymology': record.etymology_hint, 'definition': record.definition
+        }
+
+    def component_tree(self, hanzi):
+        return self.trees.get(hanzi, ())
+
+    def primitives(self, hanzi):
+        """Leaf components of `hanzi`'s full decomposition."""
+        return {component for component in self.descendants.get(hanzi, ()) if not self.trees.get(component)}
+
+    def characters_with(self, component):
+        """Every character that contains `component` at any depth of its decomposition."""
+        return self.containing.get(component, ())
+
+    def order_by_components(self, characters):
+        """
+        Reorder `characters` so that components come before the characters built from them,
+        and characters sharing more components with the rest of the list come earlier.
+        """
+        present = set(characters)
+        shared = {char: sum(1 for other in self.characters_with(char) if other in present) for char in present}
+        position = {char: i for i, char in enumerate(characters)}
+        return sorted(characters, key=lambda char: (len(self.descendants.get(char, ())),
+                                                    -shared[char], position[char]))
+
+    def _structure(self, decomposition):
+        if not decomposition:
+            return ''
+        return self.component_meanings.get(decomposition[0], 'неизвестная структура')
+
+
+def _rss_kb():
+    """Current resident set size in KiB (peak RSS where /proc is not available)."""
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    import resource
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == "darwin" else rss
+
+
+def _load_plain_dicts(db_file):
+    """The previous representation: every line kept as a full dict."""
+    db = {}
+    with open(db_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                data = json.loads(line)
+                db[data['character']] = data
+    return db
+
+
+def measure_memory(representation, db_file=HANZI_DB_FILE):
+    """Load the DB in a fresh interpreter; return (RSS growth in KiB, number of entries)."""
+    load = ("HanziComponentsDB(db_file).db" if representation == "slots"
+            else "_load_plain_dicts(db_file)")
+    code = (
+        "import gc, json\n"
+        "from hanzi_components import HanziComponentsDB, _load_plain_dicts, _rss_kb\n"
+        f"db_file = {db_file!r}\n"
+        "gc.collect(); before = _rss_kb()\n"
+        f"db = {load}\n"
+        "gc.collect(); print(json.dumps([_rss_kb() - before, len(db)]))\n"
+    )
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+    growth, entries = json.loads(output.strip().splitlines()[-1])
+    return growth, entries
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Look up hanzi_db.txt entries or benchmark its memory use")
+    parser.add_argument("hanzi", nargs="*")
+    parser.add_argument("--db", default=HANZI_DB_FILE)
+    parser.add_argument("--benchmark", action="store_true", help="RSS growth of plain dicts vs slotted records")
+    parser.add_argument("--shared", metavar="COMPONENT", help="list characters containing COMPONENT at any depth")
+    parser.add_argument("--order", metavar="FILE", help="print FILE's characters with components first")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        db_file = os.path.abspath(args.db)
+        for representation in ("dicts", "slots"):
+            growth, entries = measure_memory(representation, db_file)
+            print(f"{representation:>5}: {entries} entries, +{growth / 1024:.1f} MiB RSS")
+        return
+    db = HanziComponentsDB(args.db)
+    if args.shared:
+        print("".join(db.characters_with(args.shared)))
+    if args.order:
+        with open(args.order, 'r', encoding='utf-8') as f:
+            characters = list(dict.fromkeys(char for line in f for char in line.strip() if char in db.db))
+        for char in db.order_by_components(characters):
+            print(char)
+    for hanzi in args.hanzi:
+        print(json.dumps(db.get_hanzi_components(hanzi), ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
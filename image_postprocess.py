@@ -0,0 +1,134 @@
+import argparse
+import hashlib
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+# Карточка показывает изображение истории не шире 350px (см. .story-image img в CSS модели),
+# поэтому храним 2x для retina-экранов вместо исходных 1024x1024 / 512x512 PNG от DALL-E.
+STORY_IMAGE_MAX_SIDE = 700
+STORY_IMAGE_FORMAT = "webp"  # "webp" или "jpeg"
+STORY_IMAGE_QUALITY = 80
+STORY_IMAGE_CACHE_DIR = "story_images_optimized"
+
+
+def _file_sha1(path):
+    sha1 = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+def _pillow_format(fmt):
+    """Return the Pillow format to use, falling back to JPEG when WebP support is missing."""
+    from PIL import features
+    if fmt == "webp" and not features.check("webp"):
+        print("Pillow is built without WebP support, falling back to JPEG.")
+        return "jpeg"
+    return fmt
+
+
+def _transcode(job):
+    """Resize and re-encode one image. Runs in a worker process."""
+    from PIL import Image
+
+    src_path, out_path, max_side, fmt, quality = job
+    with Image.open(src_path) as img:
+        img = img.convert("RGB")
+        img.thumbnail((max_side, max_side), Image.LANCZOS)
+        tmp_path = f"{out_path}.tmp"
+        if fmt == "webp":
+            img.save(tmp_path, "WEBP", quality=quality, method=6)
+        else:
+            img.save(tmp_path, "JPEG", quality=quality, optimize=True, progressive=True)
+    os.replace(tmp_path, out_path)
+    return src_path, out_path
+
+
+def optimize_story_images(image_paths, max_side=STORY_IMAGE_MAX_SIDE, fmt=STORY_IMAGE_FORMAT,
+                          quality=STORY_IMAGE_QUALITY, cache_dir=STORY_IMAGE_CACHE_DIR, workers=None):
+    """
+    Shrink story images to display resolution on a process pool.
+
+    Outputs are cached by a hash of the source bytes and the encoding settings,
+    so every image is transcoded only once. Returns {source_path: optimized_path};
+    images that could not be processed are left out and should be shipped as-is.
+    """
+    try:
+        fmt = _pillow_format(fmt)
+    except ImportError:
+        print("Pillow не установлен (pip install Pillow) - изображения историй будут добавлены без сжатия.")
+        return {}
+
+    os.makedirs(cache_dir, exist_ok=True)
+    extension = "webp" if fmt == "webp" else "jpg"
+    settings = f"{max_side}:{fmt}:{quality}".encode()
+
+    mapping, jobs = {}, []
+    for src_path in dict.fromkeys(image_paths):
+        if not os.path.exists(src_path):
+            continue
+        digest = hashlib.sha1(_file_sha1(src_path).encode() + settings).hexdigest()[:12]
+        stem = os.path.splitext(os.path.basename(src_path))[0]
+        out_path = os.path.join(cache_dir, f"{stem}_{digest}.{extension}")
+        mapping[src_path] = out_path
+        if not os.path.exists(out_path):
+            jobs.append((src_path, out_path, max_side, fmt, quality))
+
+    if jobs:
+        print(f"Optimizing {len(jobs)} story images ({len(mapping) - len(jobs)} cached)...")
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(_transcode, job): job[0] for job in jobs}
+            for future, src_path in futures.items():
+                try:
+                    future.result()
+                except Exception as e:
+                    print(f"Error optimizing image {src_path}: {e}")
+                    mapping.pop(src_path, None)
+
+    bytes_before = sum(os.path.getsize(src) for src in mapping)
+    bytes_after = sum(os.path.getsize(out) for out in mapping.values())
+    if mapping:
+        print(f"Story images: {bytes_before / 1024:.0f} KB -> {bytes_after / 1024:.0f} KB")
+    return mapping
+
+
+def apply_media_mapping(notes, media_files, mapping):
+    """
+    Point notes and the media list at the optimized files.
+
+    Rewrites `src="old.png"` references in every note field and returns the new
+    media file list (order preserved, duplicates dropped).
+    """
+    renames = {os.path.basename(src): os.path.basename(dst) for src, dst in mapping.items()}
+    if renames:
+        for note in notes:
+            for i, field in enumerate(note.fields):
+                for old_name, new_name in renames.items():
+                    field = field.replace(f'src="{old_name}"', f'src="{new_name}"')
+                note.fields[i] = field
+    return list(dict.fromkeys(mapping.get(path, path) for path in media_files))
+
+
+def is_story_image(path):
+    return os.path.basename(os.path.dirname(path)) == "story_images"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-build the optimized story image cache")
+    parser.add_argument("images", nargs="*", help="images to process (default: story_images/*.png)")
+    parser.add_argument("--max-side", type=int, default=STORY_IMAGE_MAX_SIDE)
+    parser.add_argument("--format", choices=["webp", "jpeg"], default=STORY_IMAGE_FORMAT)
+    parser.add_argument("--quality", type=int, default=STORY_IMAGE_QUALITY)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    images = args.images
+    if not images and os.path.isdir("story_images"):
+        images = [os.path.join("story_images", name) for name in sorted(os.listdir("story_images"))
+                  if name.lower().endswith(".png")]
+    optimize_story_images(images, args.max_side, args.format, args.quality, workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
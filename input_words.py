@@ -0,0 +1,35 @@
+import os
+
+# Лёгкий модуль без сторонних зависимостей: проверка входных файлов
+# не должна импортировать openai, genanki и прочие SDK.
+
+
+def is_chinese_char(text):
+    return bool(text) and all(0x4E00 <= ord(char) <= 0x9FFF or 0x3400 <= ord(char) <= 0x4DBF for char in text)
+
+
+def read_archived_words(archive_path):
+    """All words from the archive files in `archive_path` (empty set if there is no archive)."""
+    archived_words = set()
+    if os.path.exists(archive_path):
+        for file in os.listdir(archive_path):
+            try:
+                with open(os.path.join(archive_path, file), "r", encoding="utf-8") as f:
+                    archived_words.update(line.strip().replace("\u200b", "") for line in f if line.strip())
+            except Exception as e:
+                print(f"Could not read archive file {file}: {e}")
+    return archived_words
+
+
+def check_input_duplicates(input_file, archive_path):
+    if not os.path.exists(input_file): return []
+    archived_words = read_archived_words(archive_path)
+
+    with open(input_file, "r", encoding="utf-8") as f:
+        input_words = {line.strip().replace("\u200b", "") for line in f if line.strip() and is_chinese_char(line.strip())}
+
+    new_words = list(input_words - archived_words)
+    print(f"Found {len(archived_words)} words in archive.")
+    print(f"Removed {len(input_words) - len(new_words)} duplicates.")
+    print(f"Found {len(new_words)} new words to process.")
+    return new_words
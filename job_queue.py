@@ -0,0 +1,320 @@
+import argparse
+import importlib
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+from build_decks import DECK_MODULES, read_input_words, write_archive
+from input_words import read_archived_words
+from progress_log import Progress, get_logger
+from shard_build import SHARD_DECKS, merge_media, stable_id
+
+# Общая очередь заданий для нескольких процессов-воркеров (например, каждый со своим
+# OPENAI_API_KEY и своим лимитом запросов). Одно задание — одно слово для одной колоды.
+# Воркер берёт задание в аренду на LEASE_SECONDS, продлевает её, пока работает, и
+# записывает результат вместе со сменой статуса в одной транзакции. Аренды упавших
+# воркеров истекают, и задания возвращаются в очередь.
+JOB_QUEUE_DB = "job_queue.db"
+LEASE_SECONDS = 120
+MAX_ATTEMPTS = 3
+
+log = get_logger("job_queue")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    stage TEXT NOT NULL,            -- колода: words, hmm
+    item TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',  -- pending, leased, done, failed
+    attempts INTEGER NOT NULL DEFAULT 0,
+    lease_owner TEXT,
+    lease_expires REAL,
+    result TEXT,                    -- JSON: поля, теги, GUID и медиафайлы карточки
+    error TEXT,
+    updated_at REAL NOT NULL,
+    UNIQUE (stage, item)
+);
+CREATE INDEX IF NOT EXISTS jobs_claim ON jobs (stage, status, id);
+"""
+
+
+def default_worker_id():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class JobQueue:
+    def __init__(self, db_path=JOB_QUEUE_DB):
+        self.db_path = db_path
+        # isolation_level=None: транзакции открываются явно через BEGIN IMMEDIATE
+        self.conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(_SCHEMA)
+
+    def _transaction(self, sql, params=()):
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            cursor = self.conn.execute(sql, params)
+            self.conn.execute("COMMIT")
+            return cursor
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+
+    def enqueue(self, stage, items):
+        """Add one job per item; items already queued (in any state) are ignored. Returns the number added."""
+        now = time.time()
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            before = self.conn.execute("SELECT count(*) FROM jobs WHERE stage = ?", (stage,)).fetchone()[0]
+            self.conn.executemany("INSERT OR IGNORE INTO jobs (stage, item, updated_at) VALUES (?, ?, ?)",
+                                  [(stage, item, now) for item in items])
+            after = self.conn.execute("SELECT count(*) FROM jobs WHERE stage = ?", (stage,)).fetchone()[0]
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        return after - before
+
+    def _fail_expired(self, now, max_attempts):
+        # Аренда истекла на последней попытке: воркер упал или завис на этом задании
+        # (например, нехватка памяти на одном слове), повторять его бесконечно нельзя
+        return self.conn.execute(
+            "UPDATE jobs SET status = 'failed', error = 'lease expired', lease_owner = NULL, "
+            "lease_expires = NULL, updated_at = ? WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?",
+            (now, now, max_attempts)).rowcount
+
+    def claim(self, stage, worker_id, lease_seconds=LEASE_SECONDS, limit=1, max_attempts=MAX_ATTEMPTS):
+        """Lease up to `limit` pending jobs (or jobs whose lease has expired) to `worker_id`."""
+        now = time.time()
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._fail_expired(now, max_attempts)
+            rows = self.conn.execute(
+                "SELECT id, item, attempts FROM jobs WHERE stage = ? AND (status = 'pending' OR "
+                "(status = 'leased' AND lease_expires < ? AND attempts < ?)) ORDER BY id LIMIT ?",
+                (stage, now, max_attempts, limit)).fetchall()
+            self.conn.executemany(
+                "UPDATE jobs SET status = 'leased', lease_owner = ?, lease_expires = ?, "
+                "attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                [(worker_id, now + lease_seconds, now, row["id"]) for row in rows])
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        return [dict(row, attempts=row["attempts"] + 1) for row in rows]
+
+    def heartbeat(self, job_ids, worker_id, lease_seconds=LEASE_SECONDS):
+        """Extend the leases `worker_id` still holds. Returns the number of leases extended."""
+        now = time.time()
+        placeholders = ", ".join("?" * len(job_ids))
+        cursor = self._transaction(
+            f"UPDATE jobs SET lease_expires = ?, updated_at = ? WHERE id IN ({placeholders}) "
+            "AND status = 'leased' AND lease_owner = ?", (now + lease_seconds, now, *job_ids, worker_id))
+        return cursor.rowcount
+
+    def complete(self, job_id, worker_id, result):
+        """Store the result and mark the job done, only if `worker_id` still holds the lease."""
+        cursor = self._transaction(
+            "UPDATE jobs SET status = 'done', result = ?, error = NULL, lease_owner = NULL, "
+            "lease_expires = NULL, updated_at = ? WHERE id = ? AND status = 'leased' AND lease_owner = ?",
+            (json.dumps(result, ensure_ascii=False), time.time(), job_id, worker_id))
+        return cursor.rowcount == 1
+
+    def fail(self, job_id, worker_id, error, max_attempts=MAX_ATTEMPTS):
+        """Return the job to the queue, or mark it failed after `max_attempts` attempts."""
+        cursor = self._transaction(
+            "UPDATE jobs SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+            "error = ?, lease_owner = NULL, lease_expires = NULL, updated_at = ? "
+            "WHERE id = ? AND status = 'leased' AND lease_owner = ?",
+            (max_attempts, str(error), time.time(), job_id, worker_id))
+        return cursor.rowcount == 1
+
+    def reclaim(self, max_attempts=MAX_ATTEMPTS):
+        """Return jobs with expired leases to the queue (failed after `max_attempts`). Returns the number reclaimed."""
+        now = time.time()
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._fail_expired(now, max_attempts)
+            reclaimed = self.conn.execute(
+                "UPDATE jobs SET status = 'pending', lease_owner = NULL, lease_expires = NULL, updated_at = ? "
+                "WHERE status = 'leased' AND lease_expires < ?", (now, now)).rowcount
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        return reclaimed
+
+    def retry_failed(self, stage):
+        return self._transaction(
+            "UPDATE jobs SET status = 'pending', attempts = 0, updated_at = ? WHERE stage = ? AND status = 'failed'",
+            (time.time(), stage)).rowcount
+
+    def results(self, stage):
+        rows = self.conn.execute("SELECT item, result FROM jobs WHERE stage = ? AND status = 'done' ORDER BY id",
+                                 (stage,))
+        return [(row["item"], json.loads(row["result"])) for row in rows]
+
+    def status(self):
+        rows = self.conn.execute("SELECT stage, status, count(*) AS jobs FROM jobs GROUP BY stage, status "
+                                 "ORDER BY stage, status")
+        return [(row["stage"], row["status"], row["jobs"]) for row in rows]
+
+    def close(self):
+        self.conn.close()
+
+
+class Heartbeat(threading.Thread):
+    """Keeps extending a worker's leases from a background thread while a job runs."""
+
+    def __init__(self, db_path, job_ids, worker_id, lease_seconds=LEASE_SECONDS):
+        super().__init__(daemon=True)
+        self.db_path = db_path
+        self.job_ids = job_ids
+        self.worker_id = worker_id
+        self.lease_seconds = lease_seconds
+        self.stopped = threading.Event()
+
+    def run(self):
+        # У потока своё соединение: sqlite3-соединения нельзя делить между потоками
+        queue = JobQueue(self.db_path)
+        try:
+            while not self.stopped.wait(self.lease_seconds / 3):
+                if not queue.heartbeat(self.job_ids, self.worker_id, self.lease_seconds):
+                    print(f"Lost the lease on jobs {self.job_ids}")
+                    return
+        finally:
+            queue.close()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def run_worker(stage, db_path=JOB_QUEUE_DB, worker_id=None, lease_seconds=LEASE_SECONDS, max_jobs=None):
+    """Process jobs of `stage` until the queue is empty (or `max_jobs` are done)."""
+    worker_id = worker_id or default_worker_id()
+    class_name, method_name, _ = SHARD_DECKS[stage]
+    module = importlib.import_module(DECK_MODULES[stage])
+    generator = getattr(module, class_name)()
+    process = getattr(generator, method_name)
+    queue = JobQueue(db_path)
+    done = 0
+    # Оценка по очереди на момент старта: те же задания разбирают и другие воркеры
+    pending = sum(jobs for job_stage, status, jobs in queue.status() if job_stage == stage and status == "pending")
+    try:
+        with Progress(min(pending, max_jobs) if max_jobs else pending, stage) as progress:
+            while max_jobs is None or done < max_jobs:
+                jobs = queue.claim(stage, worker_id, lease_seconds)
+                if not jobs:
+                    break
+                job = jobs[0]
+                heartbeat = Heartbeat(db_path, [job["id"]], worker_id, lease_seconds)
+                heartbeat.start()
+                generator.media_files = []
+                notes_before = len(generator.deck.notes)
+                try:
+                    process(job["item"])
+                    note = generator.deck.notes[notes_before]
+                    result = {"fields": note.fields, "tags": note.tags, "guid": note.guid,
+                              "media": generator.media_files}
+                except Exception as e:
+                    heartbeat.stop()
+                    log.warning(f"[{worker_id}] {job['item']} failed: {e}", extra={"item": job["item"], "worker": worker_id})
+                    queue.fail(job["id"], worker_id, e)
+                    progress.advance()  # ошибку уже посчитал log.warning
+                    continue
+                heartbeat.stop()
+                if queue.complete(job["id"], worker_id, result):
+                    done += 1
+                    progress.advance()
+                else:
+                    log.warning(f"[{worker_id}] lease on {job['item']} expired, result discarded")
+    finally:
+        queue.close()
+    print(f"[{worker_id}] processed {done} {stage} jobs")
+    return done
+
+
+def export_deck(stage, output_file, db_path=JOB_QUEUE_DB, archive=False):
+    """Write every finished job of `stage` into one .apkg with stable model and deck IDs."""
+    import genanki
+
+    class_name, _, archive_path = SHARD_DECKS[stage]
+    module = importlib.import_module(DECK_MODULES[stage])
+    queue = JobQueue(db_path)
+    results = queue.results(stage)
+    queue.close()
+    if not results:
+        print(f"No finished {stage} jobs to export.")
+        return 0
+
+    generator = getattr(module, class_name)()
+    generator.model.model_id = stable_id(generator.model.name)
+    generator.deck.deck_id = stable_id(generator.deck.name)
+    for _, result in results:
+        generator.deck.add_note(genanki.Note(model=generator.model, fields=result["fields"],
+                                             tags=result["tags"], guid=result["guid"]))
+    generator.media_files = merge_media(result["media"] for _, result in results)
+    generator.write_package(output_file)
+    if archive:
+        write_archive(archive_path or module.output_file_archive_path, [item for item, _ in results], "chinese_words")
+    return len(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Shared job queue for several deck worker processes")
+    parser.add_argument("--db", default=JOB_QUEUE_DB)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    enqueue = subparsers.add_parser("enqueue", help="queue the words of an input file")
+    enqueue.add_argument("stage", choices=list(SHARD_DECKS))
+    enqueue.add_argument("--input", help="word list file (default: the deck script's input file)")
+    enqueue.add_argument("--no-skip-archived", action="store_true")
+    work = subparsers.add_parser("work", help="process jobs until the queue is empty")
+    work.add_argument("stage", choices=list(SHARD_DECKS))
+    work.add_argument("--worker-id", default=None)
+    work.add_argument("--lease", type=float, default=LEASE_SECONDS, help="lease length in seconds")
+    work.add_argument("--max-jobs", type=int)
+    export = subparsers.add_parser("export", help="write finished jobs into an .apkg")
+    export.add_argument("stage", choices=list(SHARD_DECKS))
+    export.add_argument("--output", help="output .apkg (default: the deck script's output file)")
+    export.add_argument("--archive", action="store_true", help="archive the exported words")
+    subparsers.add_parser("status", help="job counts per stage and status")
+    subparsers.add_parser("reclaim", help="return jobs with expired leases to the queue")
+    retry = subparsers.add_parser("retry", help="requeue failed jobs")
+    retry.add_argument("stage", choices=list(SHARD_DECKS))
+    args = parser.parse_args()
+
+    if args.command == "work":
+        run_worker(args.stage, args.db, args.worker_id, args.lease, args.max_jobs)
+        return
+    if args.command == "export":
+        module = importlib.import_module(DECK_MODULES[args.stage])
+        export_deck(args.stage, args.output or module.output_deck, args.db, args.archive)
+        return
+
+    queue = JobQueue(args.db)
+    if args.command == "enqueue":
+        module = importlib.import_module(DECK_MODULES[args.stage])
+        words = read_input_words(args.input or module.input_file)
+        items = words if args.stage == "words" else list(dict.fromkeys(char for word in words for char in word))
+        if not args.no_skip_archived:
+            archived = read_archived_words(SHARD_DECKS[args.stage][2] or module.output_file_archive_path)
+            items = [item for item in items if item not in archived]
+        print(f"Queued {queue.enqueue(args.stage, items)} new {args.stage} jobs ({len(items)} items).")
+    elif args.command == "reclaim":
+        print(f"Reclaimed {queue.reclaim()} jobs with expired leases.")
+    elif args.command == "retry":
+        print(f"Requeued {queue.retry_failed(args.stage)} failed jobs.")
+    else:
+        for stage, status, count in queue.status():
+            print(f"{stage:<8}{status:<10}{count:>6}")
+    queue.close()
+
+
+if __name__ == "__main__":
+    main()
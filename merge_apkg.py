@@ -0,0 +1,253 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import zipfile
+
+# Сливает любое число .apkg в один файл: заметки и карточки копируются SQL-запросами
+# через ATTACH, медиа дедуплицируются по SHA-1 и переносятся в новый архив без перепаковки.
+
+COLLECTION_NAMES = ("collection.anki21", "collection.anki2")
+_CHUNK = 1 << 20
+
+
+def _collection_entry(source_zip):
+    for name in COLLECTION_NAMES:
+        if name in source_zip.NameToInfo:
+            return name
+    raise ValueError(f"{source_zip.filename}: no collection.anki2/collection.anki21 inside")
+
+
+def _sha1_of_entry(source_zip, info):
+    digest = hashlib.sha1()
+    with source_zip.open(info) as f:
+        for chunk in iter(lambda: f.read(_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# Внутреннее состояние ZipFile, которое меняет _append_raw_entry. Это не публичный API
+# и он меняется между версиями CPython: без этих атрибутов файл копируется через zf.open()
+_RAW_ZIPFILE_ATTRIBUTES = ("fp", "filelist", "NameToInfo", "start_dir", "_didModify", "_writing")
+
+
+def _raw_copy_supported(source_zip, target_zip):
+    return (hasattr(zipfile, "sizeFileHeader") and hasattr(zipfile.ZipInfo, "FileHeader")
+            and getattr(source_zip, "fp", None) is not None
+            and all(hasattr(target_zip, name) for name in _RAW_ZIPFILE_ATTRIBUTES)
+            and target_zip.fp is not None and not target_zip._writing)
+
+
+def _append_raw_entry(source_zip, info, target_zip, arcname):
+    """
+    Append `info`'s compressed bytes to `target_zip` through ZipFile internals.
+
+    Returns False, before writing anything, when this zipfile module does not
+    look like the one the code was written for.
+    """
+    if not _raw_copy_supported(source_zip, target_zip):
+        return False
+    source_zip.fp.seek(info.header_offset)
+    header = source_zip.fp.read(zipfile.sizeFileHeader)
+    if len(header) != zipfile.sizeFileHeader or header[:4] != b"PK\x03\x04":
+        return False
+    name_length, extra_length = int.from_bytes(header[26:28], "little"), int.from_bytes(header[28:30], "little")
+    source_zip.fp.seek(info.header_offset + zipfile.sizeFileHeader + name_length + extra_length)
+
+    # Локальный заголовок пишется заново с известными CRC и размерами, затем данные как есть
+    entry = zipfile.ZipInfo(arcname, info.date_time)
+    entry.compress_type = info.compress_type
+    entry.CRC = info.CRC
+    entry.compress_size = info.compress_size
+    entry.file_size = info.file_size
+    entry.external_attr = info.external_attr
+    entry.header_offset = target_zip.fp.tell()
+    target_zip.fp.write(entry.FileHeader())
+    remaining = info.compress_size
+    while remaining:
+        chunk = source_zip.fp.read(min(_CHUNK, remaining))
+        if not chunk:
+            raise zipfile.BadZipFile(f"{source_zip.filename}: {info.filename} is truncated")
+        target_zip.fp.write(chunk)
+        remaining -= len(chunk)
+    target_zip.filelist.append(entry)
+    target_zip.NameToInfo[arcname] = entry
+    target_zip.start_dir = target_zip.fp.tell()
+    target_zip._didModify = True
+    return True
+
+
+def copy_raw_entry(source_zip, info, target_zip, arcname):
+    """Copy a zip entry's compressed bytes as they are: no decompression, no recompression."""
+    if _append_raw_entry(source_zip, info, target_zip, arcname):
+        return
+    # Запасной путь через публичный API: распаковка и повторное сжатие тем же методом
+    entry = zipfile.ZipInfo(arcname, info.date_time)
+    entry.compress_type = info.compress_type
+    entry.external_attr = info.external_attr
+    with source_zip.open(info) as src, target_zip.open(entry, "w") as dst:
+        shutil.copyfileobj(src, dst, _CHUNK)
+
+
+class ApkgMerger:
+    """Streams several .apkg files into one; the first occurrence of a note GUID wins."""
+
+    def __init__(self, output_path):
+        self.output_path = output_path
+        self.work_dir = tempfile.mkdtemp(prefix="merge_apkg_")
+        self.collection_path = None
+        self.conn = None
+        self.zip = zipfile.ZipFile(f"{output_path}.tmp", "w")
+        self.media_names = {}   # sha1 -> имя в итоговой колоде
+        self.media_hashes = {}  # имя в итоговой колоде -> sha1
+        self.media_index = []   # имена по номерам записей "0", "1", ...
+        self.stats = {"notes": 0, "skipped_notes": 0, "cards": 0, "media": 0, "duplicate_media": 0}
+
+    def _media_name_for(self, name, sha1):
+        """Surviving name for a media file: the existing copy of identical content, or a free name."""
+        if sha1 in self.media_names:
+            return self.media_names[sha1], False
+        if name in self.media_hashes:
+            stem, ext = os.path.splitext(name)
+            name = f"{stem}_{sha1[:8]}{ext}"
+        self.media_names[sha1] = name
+        self.media_hashes[name] = sha1
+        return name, True
+
+    def _merge_media(self, source_zip):
+        """Copy new media files and return {old name: new name} for the renamed ones."""
+        media_map = json.loads(source_zip.read("media") or b"{}") if "media" in source_zip.NameToInfo else {}
+        renames = {}
+        for index, name in media_map.items():
+            info = source_zip.NameToInfo.get(str(index))
+            if info is None:
+                continue
+            new_name, is_new = self._media_name_for(name, _sha1_of_entry(source_zip, info))
+            if new_name != name:
+                renames[name] = new_name
+            if is_new:
+                copy_raw_entry(source_zip, info, self.zip, str(len(self.media_index)))
+                self.media_index.append(new_name)
+                self.stats["media"] += 1
+            else:
+                self.stats["duplicate_media"] += 1
+        return renames
+
+    def _merge_collection_json(self, column):
+        merged = json.loads(self.conn.execute(f"SELECT {column} FROM main.col").fetchone()[0] or "{}")
+        incoming = json.loads(self.conn.execute(f"SELECT {column} FROM src.col").fetchone()[0] or "{}")
+        for key, value in incoming.items():
+            merged.setdefault(key, value)
+        self.conn.execute(f"UPDATE main.col SET {column} = ?", (json.dumps(merged),))
+
+    def _merge_notes(self, renames):
+        conn = self.conn
+        # Ссылки на медиа в полях: <img src="old"> и [sound:old]. Сначала подставляем метки,
+        # чтобы цепочки вида b -> a, a -> a_1234 не переименовали одно и то же дважды
+        for step, (old, new) in enumerate(renames.items()):
+            conn.execute("UPDATE src.notes SET flds = replace(replace(flds, ?, ?), ?, ?)",
+                         (f'"{old}"', f'"\x01{step}\x01"', f":{old}]", f":\x01{step}\x01]"))
+        for step, (old, new) in enumerate(renames.items()):
+            conn.execute("UPDATE src.notes SET flds = replace(flds, ?, ?)", (f"\x01{step}\x01", new))
+
+        conn.execute("DROP TABLE IF EXISTS temp.new_notes")
+        conn.execute("CREATE TEMP TABLE new_notes AS "
+                     "SELECT id FROM src.notes WHERE guid NOT IN (SELECT guid FROM main.notes)")
+        # При пересечении ID сдвигаем все новые заметки/карточки источника за максимальный ID
+        note_shift = conn.execute(
+            "SELECT CASE WHEN EXISTS (SELECT 1 FROM main.notes WHERE id IN (SELECT id FROM new_notes)) "
+            "THEN (SELECT max(id) FROM main.notes) - (SELECT min(id) FROM new_notes) + 1 ELSE 0 END").fetchone()[0]
+        card_shift = conn.execute(
+            "SELECT CASE WHEN EXISTS (SELECT 1 FROM main.cards WHERE id IN "
+            "(SELECT id FROM src.cards WHERE nid IN (SELECT id FROM new_notes))) "
+            "THEN (SELECT max(id) FROM main.cards) - (SELECT min(id) FROM src.cards) + 1 ELSE 0 END").fetchone()[0]
+
+        note_columns = [row[1] for row in conn.execute("PRAGMA main.table_info(notes)")]
+        card_columns = [row[1] for row in conn.execute("PRAGMA main.table_info(cards)")]
+        note_select = ", ".join("id + :note_shift" if c == "id" else c for c in note_columns)
+        card_select = ", ".join("id + :card_shift" if c == "id" else "nid + :note_shift" if c == "nid" else c
+                                for c in card_columns)
+        shifts = {"note_shift": note_shift, "card_shift": card_shift}
+
+        inserted = conn.execute(f"INSERT INTO main.notes ({', '.join(note_columns)}) SELECT {note_select} "
+                                f"FROM src.notes WHERE id IN (SELECT id FROM new_notes)", shifts).rowcount
+        cards = conn.execute(f"INSERT INTO main.cards ({', '.join(card_columns)}) SELECT {card_select} "
+                             f"FROM src.cards WHERE nid IN (SELECT id FROM new_notes)", shifts).rowcount
+        total = conn.execute("SELECT count(*) FROM src.notes").fetchone()[0]
+        self.stats["notes"] += inserted
+        self.stats["skipped_notes"] += total - inserted
+        self.stats["cards"] += cards
+
+    def add(self, apkg_path):
+        with zipfile.ZipFile(apkg_path) as source_zip:
+            collection_name = _collection_entry(source_zip)
+            renames = self._merge_media(source_zip)
+            source_db = os.path.join(self.work_dir, "source.db")
+            with source_zip.open(collection_name) as src, open(source_db, "wb") as dst:
+                shutil.copyfileobj(src, dst, _CHUNK)
+
+        if self.conn is None:
+            # Первая колода задаёт схему: её коллекция становится основой, заметки вливаются как у всех
+            self.collection_path = os.path.join(self.work_dir, collection_name)
+            shutil.copyfile(source_db, self.collection_path)
+            self.conn = sqlite3.connect(self.collection_path)
+            self.conn.executescript("DELETE FROM notes; DELETE FROM cards; DELETE FROM revlog; DELETE FROM graves;")
+
+        self.conn.execute("ATTACH DATABASE ? AS src", (source_db,))
+        try:
+            with self.conn:
+                self._merge_collection_json("models")
+                self._merge_collection_json("decks")
+                self._merge_collection_json("dconf")
+                self._merge_notes(renames)
+        finally:
+            self.conn.execute("DROP TABLE IF EXISTS temp.new_notes")
+            self.conn.execute("DETACH DATABASE src")
+        os.remove(source_db)
+        print(f"Merged {apkg_path}")
+
+    def close(self):
+        try:
+            if self.conn is not None:
+                self.conn.close()
+                self.zip.write(self.collection_path, os.path.basename(self.collection_path))
+            self.zip.writestr("media", json.dumps({str(i): name for i, name in enumerate(self.media_index)},
+                                                  ensure_ascii=False))
+            self.zip.close()
+            os.replace(f"{self.output_path}.tmp", self.output_path)
+        finally:
+            shutil.rmtree(self.work_dir, ignore_errors=True)
+
+
+def merge_apkgs(input_paths, output_path):
+    merger = ApkgMerger(output_path)
+    try:
+        for path in input_paths:
+            merger.add(path)
+    except Exception:
+        if merger.conn is not None:
+            merger.conn.close()
+        merger.zip.close()
+        os.remove(f"{output_path}.tmp")
+        shutil.rmtree(merger.work_dir, ignore_errors=True)
+        raise
+    merger.close()
+    stats = merger.stats
+    print(f"Created {output_path}: {stats['notes']} notes ({stats['skipped_notes']} duplicates skipped), "
+          f"{stats['cards']} cards, {stats['media']} media files ({stats['duplicate_media']} duplicates dropped)")
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge several .apkg files into one")
+    parser.add_argument("inputs", nargs="+", help=".apkg files, earlier files win on duplicate notes")
+    parser.add_argument("-o", "--output", required=True)
+    args = parser.parse_args()
+    merge_apkgs(args.inputs, args.output)
+
+
+if __name__ == "__main__":
+    main()
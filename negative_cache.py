@@ -0,0 +1,183 @@
+import argparse
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Файл, в котором хранятся "известные промахи" провайдеров (Forvo, SVG порядка черт и т.д.)
+NEGATIVE_CACHE_FILE = "negative_cache.json"
+# Через сколько дней запись считается устаревшей и поиск повторяется
+NEGATIVE_CACHE_TTL_DAYS = 30
+
+
+@contextmanager
+def _file_lock(path):
+    """Exclusive inter-process lock on `path` (created if missing)."""
+    with open(path, "a+b") as f:
+        if fcntl:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class NegativeCache:
+    """
+    Persistent cache of "provider has no result for X" answers.
+
+    Only definitive misses (e.g. Forvo answered 200 with an empty item list) are
+    used to skip lookups. Transport errors (timeouts, HTTP 5xx, bad keys) are kept
+    in a separate section for diagnostics and never suppress a retry.
+
+    Several processes (shard_build.py, job_queue.py workers) may share one file:
+    each save re-reads it under a file lock and applies only this process's
+    changes, so misses recorded by other processes are kept.
+    """
+
+    def __init__(self, cache_file=NEGATIVE_CACHE_FILE, ttl_days=NEGATIVE_CACHE_TTL_DAYS):
+        self.cache_file = cache_file
+        self.ttl_seconds = ttl_days * 24 * 60 * 60
+        # Этапы одной карточки выполняются в разных потоках (task_dag.py)
+        self._lock = threading.RLock()
+        # Изменения с последнего сохранения: (раздел, провайдер, ключ) -> запись или None (удалена)
+        self._changes = {}
+        self.data = self._load()
+
+    def _load(self):
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            data = {}
+        except (json.JSONDecodeError, OSError) as e:
+            print(f"Could not read negative cache {self.cache_file}: {e}. Starting empty.")
+            data = {}
+        data.setdefault("misses", {})
+        data.setdefault("errors", {})
+        return data
+
+    def _set(self, section, provider, key, entry):
+        if entry is None:
+            removed = self.data[section].get(provider, {}).pop(str(key), None)
+            if not self.data[section].get(provider, True):
+                self.data[section].pop(provider)
+        else:
+            removed = None
+            self.data[section].setdefault(provider, {})[str(key)] = entry
+        self._changes[(section, provider, str(key))] = entry
+        return removed
+
+    def _save(self):
+        with self._lock, _file_lock(f"{self.cache_file}.lock"):
+            # Файл могли переписать другие процессы: берём его текущее состояние и
+            # применяем поверх только свои изменения
+            data = self._load()
+            for (section, provider, key), entry in self._changes.items():
+                if entry is None:
+                    data[section].get(provider, {}).pop(key, None)
+                    if not data[section].get(provider, True):
+                        data[section].pop(provider)
+                else:
+                    data[section].setdefault(provider, {})[key] = entry
+            tmp_file = f"{self.cache_file}.{os.getpid()}.tmp"
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, indent=1)
+            os.replace(tmp_file, self.cache_file)
+            self.data = data
+            self._changes = {}
+
+    def _expired(self, entry):
+        return time.time() - entry["ts"] > self.ttl_seconds
+
+    def peek_missing(self, provider, key):
+        """Like is_missing(), but never changes the cache: expired entries are not removed."""
+        entry = self.data["misses"].get(provider, {}).get(str(key))
+        return bool(entry) and not self._expired(entry)
+
+    def is_missing(self, provider, key):
+        """True if `provider` is known to have no result for `key` and the entry has not expired."""
+        entry = self.data["misses"].get(provider, {}).get(str(key))
+        if not entry:
+            return False
+        if self._expired(entry):
+            with self._lock:
+                self._set("misses", provider, key, None)
+                self._save()
+            return False
+        return True
+
+    def record_miss(self, provider, key, reason=""):
+        with self._lock:
+            self._set("misses", provider, key, {"ts": time.time(), "reason": reason})
+            self._set("errors", provider, key, None)
+            self._save()
+
+    def record_error(self, provider, key, error):
+        """Remember the last transport error for `key`. Does not affect is_missing()."""
+        with self._lock:
+            self._set("errors", provider, key, {"ts": time.time(), "error": str(error)})
+            self._save()
+
+    def record_hit(self, provider, key):
+        """Forget any stale miss/error once the provider returns a result."""
+        with self._lock:
+            if any(str(key) in self.data[section].get(provider, {}) for section in ("misses", "errors")):
+                self._set("misses", provider, key, None)
+                self._set("errors", provider, key, None)
+                self._save()
+
+    def clear(self, provider=None, key=None):
+        """Drop misses and errors for one key, one provider or everything. Returns the number of removed entries."""
+        removed = 0
+        with self._lock:
+            for section in ("misses", "errors"):
+                providers = [provider] if provider else list(self.data[section])
+                for p in providers:
+                    keys = [str(key)] if key is not None else list(self.data[section].get(p, {}))
+                    for k in keys:
+                        removed += 1 if self._set(section, p, k, None) else 0
+            self._save()
+        return removed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or clear the negative lookup cache")
+    parser.add_argument("--cache-file", default=NEGATIVE_CACHE_FILE)
+    parser.add_argument("--clear", action="store_true", help="remove entries (optionally filtered by --provider/--key)")
+    parser.add_argument("--provider", help="e.g. forvo, stroke_svg")
+    parser.add_argument("--key", help="word or code point")
+    args = parser.parse_args()
+
+    cache = NegativeCache(args.cache_file)
+    if args.clear:
+        removed = cache.clear(args.provider, args.key)
+        print(f"Removed {removed} entries from {args.cache_file}")
+        return
+
+    for section in ("misses", "errors"):
+        for provider, entries in cache.data[section].items():
+            if args.provider and provider != args.provider:
+                continue
+            print(f"[{section}] {provider}: {len(entries)}")
+            for key, entry in entries.items():
+                when = time.strftime("%Y-%m-%d %H:%M", time.localtime(entry["ts"]))
+                print(f"  {key}\t{when}\t{entry.get('reason') or entry.get('error', '')}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+from collections import Counter
+
+# Журнал горячих циклов (обработка слов, Forvo, OpenAI, SVG штрихов). Записи уходят в очередь
+# (QueueHandler) и форматируются/пишутся в отдельном потоке (QueueListener), поэтому цикл не
+# ждёт терминала или диска. В терминале — одна строка прогресса: слов в минуту, сколько
+# запросов к каждому провайдеру сейчас в работе, доля попаданий в кэши и оценка окончания.
+# Поток и обработчики создаются при первой записи или первом Progress, а не при импорте.
+#   LOG_LEVEL=DEBUG        — также строки о каждом слове и найденных файлах
+#   LOG_JSON=run.jsonl     — дополнительно писать все записи в JSON Lines
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_JSON = os.getenv("LOG_JSON")
+PROGRESS_INTERVAL = 0.5   # секунд между перерисовками строки прогресса
+PROGRESS_LOG_EVERY = 30   # секунд между строками прогресса, если вывод не терминал
+
+LOGGER_NAME = "anki"
+_STANDARD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_listener = None
+_setup_lock = threading.Lock()
+_progress = None
+_console_lock = threading.RLock()
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record; `extra={...}` fields become top-level keys."""
+
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        entry.update({key: value for key, value in vars(record).items() if key not in _STANDARD_ATTRS})
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class ConsoleHandler(logging.StreamHandler):
+    """Writes records above the progress line: clears it, prints the record, redraws it."""
+
+    def emit(self, record):
+        with _console_lock:
+            if _progress and _progress.tty:
+                self.stream.write("\r\x1b[K")
+            super().emit(record)
+            if _progress:
+                _progress.draw(force=True, locked=True)
+
+
+class CountingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that also counts WARNING and ERROR records as errors on the progress line."""
+
+    def emit(self, record):
+        if record.levelno >= logging.WARNING and _progress:
+            _progress.error()
+        super().emit(record)
+
+
+def setup_logging(level=LOG_LEVEL, json_path=LOG_JSON):
+    """Route the `anki.*` loggers through a background listener. Safe to call more than once."""
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            return
+        console = ConsoleHandler(sys.stderr)
+        console.setFormatter(logging.Formatter("%(levelname).1s %(message)s"))
+        handlers = [console]
+        if json_path:
+            json_handler = logging.FileHandler(json_path, encoding="utf-8")
+            json_handler.setFormatter(JsonFormatter())
+            handlers.append(json_handler)
+
+        log_queue = queue.SimpleQueue()
+        root = logging.getLogger(LOGGER_NAME)
+        root.setLevel(level.upper() if isinstance(level, str) else level)
+        root.addHandler(CountingQueueHandler(log_queue))
+        root.propagate = False
+        _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    """Flush queued records (the listener thread drains the queue before stopping)."""
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+
+class LazyLogger(logging.LoggerAdapter):
+    """Logger that sets up logging on its first record, so importing a module starts no thread."""
+
+    def log(self, level, msg, *args, **kwargs):
+        if _listener is None:
+            setup_logging()
+        super().log(level, msg, *args, **kwargs)
+
+    def process(self, msg, kwargs):
+        return msg, kwargs
+
+
+def get_logger(name):
+    return LazyLogger(logging.getLogger(f"{LOGGER_NAME}.{name}"), {})
+
+
+def _duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h{minutes:02d}m" if hours else f"{minutes}m{seconds:02d}s"
+
+
+class Progress:
+    """
+    Single-line progress display for a loop over `total` items.
+
+    Stages report in-flight provider calls with `started`/`finished` (task_dag.py does it
+    for every stage) and caches report `cache(provider, hit)`. WARNING and ERROR records of
+    the `anki.*` loggers count as errors. The line is redrawn at most
+    every PROGRESS_INTERVAL seconds on a terminal, or logged every PROGRESS_LOG_EVERY
+    seconds otherwise.
+    """
+
+    def __init__(self, total, label=""):
+        self.total = total
+        self.label = label
+        self.done = 0
+        self.errors = 0
+        self.in_flight = Counter()
+        self.hits = 0
+        self.lookups = 0
+        self.started_at = time.monotonic()
+        self.tty = sys.stderr.isatty()
+        self._drawn_at = self.started_at
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        global _progress
+        setup_logging()
+        _progress = self
+        self.draw(force=True)
+        return self
+
+    def __exit__(self, *exc_info):
+        global _progress
+        with _console_lock:
+            _progress = None
+            if self.tty:
+                sys.stderr.write("\r\x1b[K" + self.line() + "\n")
+                sys.stderr.flush()
+        if not self.tty:
+            logging.getLogger(f"{LOGGER_NAME}.progress").info(self.line())
+        return False
+
+    def advance(self, n=1, error=False):
+        with self._lock:
+            self.done += n
+            self.errors += int(error)
+        self.draw()
+
+    def error(self):
+        with self._lock:
+            self.errors += 1
+
+    def started(self, provider):
+        with self._lock:
+            self.in_flight[provider] += 1
+
+    def finished(self, provider):
+        with self._lock:
+            self.in_flight[provider] -= 1
+        self.draw()
+
+    def cache(self, provider, hit):
+        with self._lock:
+            self.lookups += 1
+            self.hits += int(hit)
+
+    def line(self):
+        elapsed = time.monotonic() - self.started_at
+        rate = self.done / elapsed * 60 if elapsed > 0 else 0.0
+        parts = [f"[{self.label}]" if self.label else "",
+                 f"{self.done}/{self.total}" if self.total else f"{self.done}",
+                 f"{rate:.1f}/min"]
+        busy = ", ".join(f"{provider} {count}" for provider, count in sorted(self.in_flight.items()) if count)
+        if busy:
+            parts.append(f"in flight: {busy}")
+        if self.lookups:
+            parts.append(f"cache {100 * self.hits / self.lookups:.0f}%")
+        if self.errors:
+            parts.append(f"errors {self.errors}")
+        if self.total and 0 < self.done < self.total:
+            parts.append(f"ETA {_duration(elapsed / self.done * (self.total - self.done))}")
+        return " ".join(part for part in parts if part)
+
+    def draw(self, force=False, locked=False):
+        now = time.monotonic()
+        if not self.tty:
+            # Не терминал (файл, CI): строка прогресса периодически пишется в журнал
+            if not force and now - self._drawn_at >= PROGRESS_LOG_EVERY:
+                self._drawn_at = now
+                logging.getLogger(f"{LOGGER_NAME}.progress").info(self.line())
+            return
+        if not force and now - self._drawn_at < PROGRESS_INTERVAL:
+            return
+        self._drawn_at = now
+        if not locked:
+            _console_lock.acquire()
+        try:
+            sys.stderr.write("\r\x1b[K" + self.line())
+            sys.stderr.flush()
+        finally:
+            if not locked:
+                _console_lock.release()
+
+
+def current_progress():
+    return _progress
+
+
+def stage_started(provider):
+    if _progress:
+        _progress.started(provider)
+
+
+def stage_finished(provider):
+    if _progress:
+        _progress.finished(provider)
+
+
+def cache_lookup(provider, hit):
+    if _progress:
+        _progress.cache(provider, hit)
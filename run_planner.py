@@ -0,0 +1,209 @@
+import argparse
+import importlib
+import json
+import os
+
+from build_decks import DECK_MODULES
+from negative_cache import NegativeCache
+from task_dag import STAGE_WORKERS
+
+# План запуска: сколько вызовов каждого API потребуется, сколько уже закрыто кэшами на диске,
+# сколько займут фиксированные паузы и во что обойдутся токены и картинки. Сеть не используется.
+
+# Цена за 1M токенов (вход, выход), USD
+CHAT_PRICES = {"gpt-4o-mini": (0.15, 0.60), "gpt-4o": (2.50, 10.00), "gpt-3.5-turbo": (0.50, 1.50)}
+# Цена одной картинки, USD
+IMAGE_PRICES = {("dall-e-3", "1024x1024"): 0.040, ("dall-e-2", "512x512"): 0.018, ("dall-e-2", "1024x1024"): 0.020}
+# Средняя длительность одного запроса, секунд
+CALL_SECONDS = {"openai chat": 4.0, "dall-e": 15.0, "forvo": 1.5, "translate": 0.7, "tatoeba": 1.0}
+# Пауза после каждого элемента в скриптах (time.sleep), секунд
+ITEM_SLEEP_SECONDS = {"words": 1, "hmm": 20, "hmm_stories": 1, "hmm_deck": 0}
+# Пауза после каждой сгенерированной картинки в 001_generate_du_chinese_hmm_deck.py
+IMAGE_SLEEP_SECONDS = 15
+# Какие запросы одного элемента ждут другие (StageGraph в скриптах): независимые идут
+# одновременно, поэтому время элемента — самая длинная цепочка, а не сумма запросов
+PROVIDER_DEPS = {
+    "words": {"translate": (), "tatoeba": (), "forvo": ()},
+    "hmm": {"translate": (), "forvo": (), "openai chat": ("translate",), "dall-e": ("openai chat",)},
+    "hmm_stories": {"translate": (), "openai chat": ("translate",)},  # без StageGraph, по очереди
+    "hmm_deck": {"forvo": (), "dall-e": ()},
+}
+PROMPT_TOKENS = 450       # системный промпт + промпт истории
+COMPLETION_TOKENS = 250   # если в completion_cache/ ещё нет статистики
+
+
+def _average_completion_tokens(cache_dir="completion_cache"):
+    tokens, count = 0, 0
+    for root, _, files in os.walk(cache_dir):
+        for name in files:
+            if name.endswith(".json"):
+                try:
+                    with open(os.path.join(root, name), 'r', encoding='utf-8') as f:
+                        tokens += json.load(f).get("usage", {}).get("completion_tokens", 0)
+                    count += 1
+                except (OSError, json.JSONDecodeError):
+                    continue
+    return tokens // count if count and tokens else COMPLETION_TOKENS
+
+
+class RunPlan:
+    def __init__(self, deck, items):
+        self.deck = deck
+        self.items = items
+        self.providers = {}  # provider -> [нужно вызовов, уже в кэше]
+        self.sleep_seconds = 0
+        self.cost = 0.0
+        self.notes = []
+
+    def add(self, provider, needed, cached=0):
+        counts = self.providers.setdefault(provider, [0, 0])
+        counts[0] += needed
+        counts[1] += cached
+
+    def item_seconds(self):
+        """Average request time of one item along its longest chain of dependent requests."""
+        if not self.items:
+            return 0.0
+        per_item = {provider: needed * CALL_SECONDS.get(provider, 0) / len(self.items)
+                    for provider, (needed, _) in self.providers.items()}
+        deps = PROVIDER_DEPS.get(self.deck)
+        if deps is None or STAGE_WORKERS <= 1:
+            return sum(per_item.values())
+        finished = {}
+        for provider, provider_deps in deps.items():
+            finished[provider] = per_item.get(provider, 0) + max((finished[dep] for dep in provider_deps), default=0)
+        return max(finished.values(), default=0) + sum(seconds for provider, seconds in per_item.items()
+                                                       if provider not in deps)
+
+    def wall_seconds(self, workers=1):
+        return (len(self.items) * self.item_seconds() + self.sleep_seconds) / max(workers, 1)
+
+    def format(self, workers=1):
+        lines = [f"Plan for {self.deck}: {len(self.items)} items",
+                 f"  {'provider':<14}{'calls':>7}{'cached':>8}{'est. time':>11}"]
+        for provider, (needed, cached) in self.providers.items():
+            seconds = needed * CALL_SECONDS.get(provider, 0)
+            lines.append(f"  {provider:<14}{needed:>7}{cached:>8}{_duration(seconds):>11}")
+        lines.append(f"  {'sleeps':<14}{'':>15}{_duration(self.sleep_seconds):>11}")
+        lines.append(f"  {'per item':<14}{'':>15}{self.item_seconds():>10.1f}s  (longest request chain)")
+        suffix = f" with {workers} workers" if workers > 1 else ""
+        lines.append(f"  Estimated wall time{suffix}: {_duration(self.wall_seconds(workers))}, "
+                     f"estimated cost: ${self.cost:.2f}")
+        lines.extend(f"  Note: {note}" for note in self.notes)
+        return "\n".join(lines)
+
+
+def _duration(seconds):
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h{minutes:02d}m" if hours else f"{minutes}m{seconds:02d}s"
+
+
+def _plan_forvo(plan, items, negative_cache):
+    audio = [item for item in items if os.path.exists(f"forvo_audio/{item}_audio.mp3")]
+    known_missing = [item for item in items if item not in audio and negative_cache.peek_missing("forvo", item)]
+    plan.add("forvo", len(items) - len(audio) - len(known_missing), len(audio) + len(known_missing))
+    if not os.getenv("FORVO_API_KEY"):
+        plan.notes.append("FORVO_API_KEY is not set: Forvo lookups will fail without downloading audio")
+
+
+def _plan_strokes(plan, items, negative_cache):
+    from graphics_index import GRAPHICS_PATH, GraphicsIndex
+    from stroke_pack import STROKE_PACK_FILE, StrokePack
+
+    try:
+        pack = StrokePack(STROKE_PACK_FILE)
+    except (FileNotFoundError, ValueError):
+        pack = None
+
+    # План ничего не пишет на диск: ни индекс graphics.txt, ни negative_cache.json
+    graphics = GraphicsIndex(GRAPHICS_PATH, save_index=False)
+
+    def has_svg(code_point):
+        if chr(code_point) in graphics:
+            return True  # stroke_renderer.py нарисует SVG из graphics.txt
+        if pack:
+            return pack.lookup(code_point) is not None
+        return os.path.exists(f"svgs/{code_point}.svg") or os.path.exists(f"svgs-still/{code_point}-still.svg")
+
+    characters = {char for item in items for char in item}
+    missing = [char for char in characters
+               if negative_cache.peek_missing("stroke_svg", ord(char)) or not has_svg(ord(char))]
+    if missing:
+        plan.notes.append(f"no stroke SVG for {len(missing)} characters: {''.join(sorted(missing))}")
+
+
+def _plan_chat(plan, module, calls, cached=0):
+    plan.add("openai chat", calls, cached)
+    prompt_price, completion_price = CHAT_PRICES.get(module.OPENAI_MODEL, CHAT_PRICES["gpt-4o-mini"])
+    completion_tokens = min(_average_completion_tokens(), module.OPENAI_MAX_TOKENS)
+    plan.cost += calls * (PROMPT_TOKENS * prompt_price + completion_tokens * completion_price) / 1_000_000
+
+
+def _plan_images(plan, module, items, sleep_per_image=0):
+    existing = [item for item in items if os.path.exists(f"story_images/{item}_story.png")]
+    needed = len(items) - len(existing)
+    plan.add("dall-e", needed, len(existing))
+    plan.cost += needed * IMAGE_PRICES.get((module.OPENAI_IMAGE_MODEL, module.IMAGE_SIZE), 0.04)
+    plan.sleep_seconds += needed * sleep_per_image
+
+
+def plan_run(deck, items):
+    """Resolve cache state for `items` without network calls and return a RunPlan."""
+    module = importlib.import_module(DECK_MODULES[deck])
+    negative_cache = NegativeCache()
+    plan = RunPlan(deck, items)
+    plan.sleep_seconds = len(items) * ITEM_SLEEP_SECONDS[deck]
+
+    if deck == "words":
+        plan.add("translate", len(items))
+        plan.add("tatoeba", len(items))
+        _plan_forvo(plan, items, negative_cache)
+    elif deck == "hmm":
+        plan.add("translate", len(items))
+        _plan_forvo(plan, items, negative_cache)
+        _plan_chat(plan, module, len(items))
+        _plan_images(plan, module, items)
+        if os.getenv("OPENAI_CACHE_POLICY", "refresh") == "reuse":
+            plan.notes.append("chat calls are an upper bound: with OPENAI_CACHE_POLICY=reuse, "
+                              "prompts depend on the live translation and are resolved at run time")
+    elif deck == "hmm_stories":
+        from story_warehouse import StoryWarehouse
+
+        warehouse = StoryWarehouse()
+        warehouse.ingest()
+        reviewed = [item for item in items if warehouse.latest(item)]
+        warehouse.close()
+        new = len(items) - len(reviewed)
+        plan.add("translate", new, len(reviewed))
+        _plan_chat(plan, module, new, len(reviewed))
+    elif deck == "hmm_deck":
+        _plan_forvo(plan, items, negative_cache)
+        _plan_images(plan, module, items, IMAGE_SLEEP_SECONDS)
+    _plan_strokes(plan, items, negative_cache)
+    return plan
+
+
+def print_plan(deck, items, workers=1):
+    plan = plan_run(deck, items)
+    print(plan.format(workers))
+    return plan
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Estimate API calls, wall time and cost of a run without running it")
+    parser.add_argument("deck", choices=list(DECK_MODULES))
+    parser.add_argument("items", nargs="*", help="words or characters (default: the deck's pending input)")
+    args = parser.parse_args()
+
+    if args.items:
+        print_plan(args.deck, args.items)
+        return
+    from build_decks import load_config, plan
+
+    config = load_config()
+    config["decks"] = [args.deck]
+    plan(config)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+import argparse
+import hashlib
+import importlib
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from anki_collection import ANKI_COLLECTION_PATH, filter_known_words
+from apkg_volumes import MAX_PACKAGE_MB
+from build_decks import DECK_MODULES, read_input_words, write_archive
+from input_words import read_archived_words
+
+# Шардированная сборка больших списков (HSK 1–6, весь hanzi_db.txt): список делится на N частей,
+# каждая собирается в отдельном процессе со своей колодой, результат сливается в один .apkg.
+
+# Колода -> (класс генератора, метод обработки одного элемента, папка архива)
+SHARD_DECKS = {
+    "words": ("ChineseAnkiGenerator", "process_word", "input_words_archive"),
+    "hmm": ("HanziSpacesGenerator", "process_hanzi", None),
+}
+
+
+def stable_id(name):
+    """Deterministic model/deck ID in the same range the scripts draw random IDs from."""
+    return (1 << 30) + int(hashlib.sha1(name.encode("utf-8")).hexdigest(), 16) % (1 << 30)
+
+
+def split_shards(items, shards):
+    """Contiguous, order-preserving shards, so concatenating results keeps the input order."""
+    size = -(-len(items) // shards) if items else 0
+    return [items[i:i + size] for i in range(0, len(items), size)] if size else []
+
+
+def _build_shard(deck, items):
+    """Worker: build one shard with its own generator and return plain, picklable results."""
+    class_name, method_name, _ = SHARD_DECKS[deck]
+    module = importlib.import_module(DECK_MODULES[deck])
+    generator = getattr(module, class_name)()
+    results = [getattr(generator, method_name)(item) for item in items]
+    notes = [(note.fields, note.tags, note.guid) for note in generator.deck.notes]
+    return notes, generator.media_files, generator.svg_optimizer.stats, results
+
+
+def merge_media(media_lists):
+    """Concatenate media lists, keeping the first file for each name inside the deck."""
+    merged = {}
+    for media_files in media_lists:
+        for path in media_files:
+            merged.setdefault(os.path.basename(path), path)
+    return list(merged.values())
+
+
+def shard_build(deck, items, output_file, workers=os.cpu_count(), max_mb=MAX_PACKAGE_MB):
+    import genanki
+
+    class_name, _, _ = SHARD_DECKS[deck]
+    module = importlib.import_module(DECK_MODULES[deck])
+    shards = split_shards(items, workers)
+    print(f"[{deck}] {len(items)} items in {len(shards)} shards")
+
+    started = time.monotonic()
+    with ProcessPoolExecutor(max_workers=len(shards) or 1) as pool:
+        shard_results = list(pool.map(_build_shard, [deck] * len(shards), shards))
+    print(f"[{deck}] shards built in {time.monotonic() - started:.1f}s")
+
+    # Общая колода: ID модели и колоды выводятся из имён, поэтому повторные сборки совпадают
+    generator = getattr(module, class_name)()
+    generator.model.model_id = stable_id(generator.model.name)
+    generator.deck.deck_id = stable_id(generator.deck.name)
+    results = []
+    for notes, _, stats, shard_items in shard_results:
+        for fields, tags, guid in notes:
+            generator.deck.add_note(genanki.Note(model=generator.model, fields=fields, tags=tags, guid=guid))
+        generator.svg_optimizer.stats.update(stats)
+        results.extend(shard_items)
+    generator.media_files = merge_media(media for _, media, _, _ in shard_results)
+    generator.write_package(output_file, max_mb)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build a large deck in parallel shards and merge them into one .apkg")
+    parser.add_argument("deck", choices=list(SHARD_DECKS))
+    parser.add_argument("--input", help="word list file (default: the deck script's input file)")
+    parser.add_argument("--output", help="output .apkg (default: the deck script's output file)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--no-skip-archived", action="store_true", help="also build words already in the archive")
+    parser.add_argument("--archive", action="store_true", help="archive the processed words")
+    parser.add_argument("--plan", action="store_true", help="only estimate API calls, time and cost, then exit")
+    parser.add_argument("--max-size-mb", type=float, default=MAX_PACKAGE_MB, help="split the deck into .apkg volumes of at most this size")
+    parser.add_argument("--collection", default=ANKI_COLLECTION_PATH,
+                        help="skip words already in this collection.anki2 or .apkg (default: $ANKI_COLLECTION_PATH)")
+    args = parser.parse_args()
+
+    module = importlib.import_module(DECK_MODULES[args.deck])
+    words = read_input_words(args.input or module.input_file)
+    # HMM-колода работает с отдельными иероглифами
+    items = words if args.deck == "words" else list(dict.fromkeys(char for word in words for char in word))
+    archive_path = SHARD_DECKS[args.deck][2] or module.output_file_archive_path
+    if not args.no_skip_archived:
+        archived = read_archived_words(archive_path)
+        items = [item for item in items if item not in archived]
+    items = filter_known_words(items, args.collection)
+    if not items:
+        print("No new words to process.")
+        return
+    if args.plan:
+        from run_planner import print_plan
+        print_plan(args.deck, items, args.workers)
+        return
+
+    shard_build(args.deck, items, args.output or module.output_deck, args.workers, args.max_size_mb)
+    if args.archive:
+        write_archive(archive_path, items, "chinese_words")
+
+
+if __name__ == "__main__":
+    main()
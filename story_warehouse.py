@@ -0,0 +1,191 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+import sqlite3
+from datetime import datetime
+
+# Единое хранилище всех сгенерированных историй: архив processed_stories_archive/ (уже
+# отредактированные и попавшие в колоду истории) и текущий stories/stories_for_review.json.
+# Каждая уникальная версия истории хранится один раз; поиск по тексту через FTS5.
+STORY_WAREHOUSE_DB = "story_warehouse.db"
+STORIES_ARCHIVE_DIR = "processed_stories_archive"
+STORIES_JSON_FILE = "stories/stories_for_review.json"
+
+STORY_FIELDS = ("hanzi", "pinyin", "meaning_en", "meaning_ru", "actor", "location", "hint", "story")
+
+_ARCHIVE_STAMP = re.compile(r"(\d{4}-\d{2}-\d{2}_\d{6})")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS stories (
+    id INTEGER PRIMARY KEY,
+    hanzi TEXT NOT NULL,
+    pinyin TEXT, meaning_en TEXT, meaning_ru TEXT,
+    actor TEXT, location TEXT, hint TEXT, story TEXT,
+    reviewed INTEGER NOT NULL,      -- 1: из архива (история прошла ревью и попала в колоду)
+    created_at TEXT NOT NULL,       -- время версии: из имени архивного файла или mtime
+    source TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    UNIQUE (hanzi, content_hash, reviewed)
+);
+CREATE INDEX IF NOT EXISTS stories_latest ON stories (hanzi, reviewed, created_at);
+CREATE INDEX IF NOT EXISTS stories_actor ON stories (actor);
+CREATE INDEX IF NOT EXISTS stories_location ON stories (location);
+CREATE TABLE IF NOT EXISTS ingested_files (path TEXT PRIMARY KEY, size INTEGER, mtime REAL);
+CREATE VIRTUAL TABLE IF NOT EXISTS stories_fts USING fts5(
+    story, meaning_ru, content='stories', content_rowid='id', tokenize='trigram'
+);
+CREATE TRIGGER IF NOT EXISTS stories_fts_insert AFTER INSERT ON stories BEGIN
+    INSERT INTO stories_fts (rowid, story, meaning_ru) VALUES (new.id, new.story, new.meaning_ru);
+END;
+CREATE TRIGGER IF NOT EXISTS stories_fts_delete AFTER DELETE ON stories BEGIN
+    INSERT INTO stories_fts (stories_fts, rowid, story, meaning_ru) VALUES ('delete', old.id, old.story, old.meaning_ru);
+END;
+"""
+
+
+def _content_hash(entry):
+    payload = json.dumps([entry.get(field, "") for field in STORY_FIELDS], ensure_ascii=False)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def _version_time(path):
+    match = _ARCHIVE_STAMP.search(os.path.basename(path))
+    if match:
+        return datetime.strptime(match.group(1), "%Y-%m-%d_%H%M%S").isoformat()
+    return datetime.fromtimestamp(os.path.getmtime(path)).isoformat(timespec="seconds")
+
+
+class StoryWarehouse:
+    def __init__(self, db_path=STORY_WAREHOUSE_DB, archive_dir=STORIES_ARCHIVE_DIR, review_file=STORIES_JSON_FILE):
+        self.archive_dir = archive_dir
+        self.review_file = review_file
+        self.conn = sqlite3.connect(db_path)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(_SCHEMA)
+
+    def _source_files(self):
+        files = []
+        if os.path.isdir(self.archive_dir):
+            files += [(os.path.join(self.archive_dir, name), True)
+                      for name in sorted(os.listdir(self.archive_dir)) if name.endswith(".json")]
+        if os.path.exists(self.review_file):
+            files.append((self.review_file, False))
+        return files
+
+    def ingest(self):
+        """Load new or changed story files. Returns the number of new story versions."""
+        count_before = self.conn.execute("SELECT count(*) FROM stories").fetchone()[0]
+        with self.conn:
+            for path, reviewed in self._source_files():
+                stat = os.stat(path)
+                known = self.conn.execute("SELECT size, mtime FROM ingested_files WHERE path = ?", (path,)).fetchone()
+                if known and known["size"] == stat.st_size and known["mtime"] == stat.st_mtime:
+                    continue
+                try:
+                    with open(path, "r", encoding="utf-8") as f:
+                        entries = json.load(f)
+                except (OSError, json.JSONDecodeError) as e:
+                    print(f"Could not read stories file {path}: {e}")
+                    continue
+                created_at = _version_time(path)
+                rows = [
+                    tuple(entry.get(field, "") for field in STORY_FIELDS)
+                    + (int(reviewed), created_at, path, _content_hash(entry))
+                    for entry in entries if entry.get("hanzi")
+                ]
+                self.conn.executemany(
+                    f"INSERT OR IGNORE INTO stories ({', '.join(STORY_FIELDS)}, reviewed, created_at, source, content_hash) "
+                    f"VALUES ({', '.join('?' * (len(STORY_FIELDS) + 4))})", rows)
+                self.conn.execute("INSERT OR REPLACE INTO ingested_files (path, size, mtime) VALUES (?, ?, ?)",
+                                  (path, stat.st_size, stat.st_mtime))
+        return self.conn.execute("SELECT count(*) FROM stories").fetchone()[0] - count_before
+
+    def latest(self, hanzi, reviewed_only=True):
+        """Newest story version for `hanzi` as a stories_for_review.json entry, or None."""
+        row = self.conn.execute(
+            f"SELECT {', '.join(STORY_FIELDS)} FROM stories WHERE hanzi = ? AND reviewed >= ? "
+            "ORDER BY reviewed DESC, created_at DESC, id DESC LIMIT 1", (hanzi, int(reviewed_only))).fetchone()
+        return dict(row) if row else None
+
+    def latest_per_hanzi(self, reviewed_only=True):
+        rows = self.conn.execute(
+            f"SELECT {', '.join(STORY_FIELDS)} FROM stories s WHERE reviewed >= ? AND id = ("
+            "SELECT id FROM stories WHERE hanzi = s.hanzi AND reviewed >= ? "
+            "ORDER BY reviewed DESC, created_at DESC, id DESC LIMIT 1) ORDER BY hanzi",
+            (int(reviewed_only), int(reviewed_only)))
+        return [dict(row) for row in rows]
+
+    def history(self, hanzi):
+        rows = self.conn.execute(
+            "SELECT created_at, reviewed, source, story FROM stories WHERE hanzi = ? ORDER BY created_at", (hanzi,))
+        return [dict(row) for row in rows]
+
+    def search(self, text, limit=20):
+        """Full-text search over story and Russian meaning (substring match, at least 3 characters)."""
+        if len(text) >= 3:
+            query = ("SELECT s.hanzi, s.created_at, s.story FROM stories_fts JOIN stories s ON s.id = stories_fts.rowid "
+                     "WHERE stories_fts MATCH ? ORDER BY rank LIMIT ?")
+            params = ('"' + text.replace('"', '""') + '"', limit)
+        else:
+            # Триграммный индекс не ищет строки короче 3 символов (например, один иероглиф)
+            query = ("SELECT hanzi, created_at, story FROM stories WHERE story LIKE ? OR meaning_ru LIKE ? "
+                     "ORDER BY created_at DESC LIMIT ?")
+            params = (f"%{text}%", f"%{text}%", limit)
+        return [dict(row) for row in self.conn.execute(query, params)]
+
+    def usage(self, column, limit=20):
+        """How many distinct characters use each actor or location."""
+        if column not in ("actor", "location"):
+            raise ValueError(f"Unknown column: {column}")
+        rows = self.conn.execute(
+            f"SELECT {column} AS value, count(DISTINCT hanzi) AS hanzi_count FROM stories "
+            f"GROUP BY {column} ORDER BY hanzi_count DESC LIMIT ?", (limit,))
+        return [(row["value"], row["hanzi_count"]) for row in rows]
+
+    def close(self):
+        self.conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query all generated HMM stories")
+    parser.add_argument("--db", default=STORY_WAREHOUSE_DB)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("ingest", help="load new files from processed_stories_archive/ and stories/")
+    latest = subparsers.add_parser("latest", help="latest reviewed story per character")
+    latest.add_argument("hanzi", nargs="?", help="one character (default: all)")
+    latest.add_argument("--include-pending", action="store_true", help="also consider stories not reviewed yet")
+    history = subparsers.add_parser("history", help="all versions of a character's story")
+    history.add_argument("hanzi")
+    search = subparsers.add_parser("search", help="full-text search over stories")
+    search.add_argument("text")
+    for column in ("actor", "location"):
+        usage = subparsers.add_parser(f"{column}s", help=f"how often each {column} is used")
+        usage.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    warehouse = StoryWarehouse(args.db)
+    added = warehouse.ingest()
+    if args.command == "ingest":
+        print(f"Added {added} new story versions.")
+    elif args.command == "latest":
+        entries = ([warehouse.latest(args.hanzi, not args.include_pending)] if args.hanzi
+                   else warehouse.latest_per_hanzi(not args.include_pending))
+        for entry in filter(None, entries):
+            print(f"{entry['hanzi']} ({entry['pinyin']}): {entry['story']}")
+    elif args.command == "history":
+        for entry in warehouse.history(args.hanzi):
+            status = "reviewed" if entry["reviewed"] else "pending"
+            print(f"{entry['created_at']} [{status}] {entry['story']}")
+    elif args.command == "search":
+        for entry in warehouse.search(args.text):
+            print(f"{entry['hanzi']} {entry['created_at']}: {entry['story']}")
+    else:
+        for value, count in warehouse.usage(args.command[:-1], args.limit):
+            print(f"{count:4d}  {value}")
+    warehouse.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+import hashlib
+import os
+import re
+
+from progress_log import get_logger
+from stroke_pack import StrokePack, STROKE_PACK_FILE, STROKE_MEDIA_DIR, media_name
+from stroke_renderer import StrokeRenderer
+from svg_optimizer import SVG_MIN_CACHE_DIR, SVG_TIME_PRECISION
+
+log = get_logger("strokes")
+
+# Откуда брать SVG порядка черт:
+#   assets  — stroke_assets.pack или svgs/ + svgs-still/, а для остальных символов — рендер из graphics.txt
+#   render  — сначала рендер из graphics.txt (svgs/ и svgs-still/ не нужны), затем готовые файлы
+STROKE_SOURCE = os.getenv("STROKE_SOURCE", "assets")
+
+# Для слов из нескольких иероглифов — один SVG, где иероглифы стоят в ряд, а анимация
+# каждого начинается после предыдущего: одна картинка и один медиафайл на карточку вместо N.
+# Файлы кэшируются по кодам символов слова и хэшу исходных SVG и паузы, поэтому композиты из
+# разных источников (pack, svgs/, рендер) и с разными настройками (сетка, точность) не
+# перезаписывают друг друга: svgs-min/composite/20320-22909-1a2b3c4d.svg
+COMPOSITE_DIR = os.path.join(SVG_MIN_CACHE_DIR, "composite")
+COMPOSITE_CELL = 1024      # сторона viewBox одного иероглифа
+COMPOSITE_PAUSE = 0.3      # секунд между анимациями соседних иероглифов
+
+_SVG_BODY = re.compile(r'<svg[^>]*>(.*)</svg>', re.S)
+_STYLE = re.compile(r'<style[^>]*>.*?</style>', re.S)
+_GRID = re.compile(r'<g stroke="lightgray"[^>]*>.*?</g>', re.S)
+_ANIMATION = re.compile(r'animation:\s*[\w-]+\s+([\d.]+)s[^;}]*;\s*animation-delay:\s*([\d.]+)s')
+_DELAY = re.compile(r'(animation-delay:\s*)([\d.]+)s')
+_LOCAL_NAMES = (
+    (re.compile(r'\bid="([\w-]+)"'), 'id="{}"'),
+    (re.compile(r'url\(#([\w-]+)\)'), 'url(#{})'),
+    (re.compile(r'#([\w-]+)(\s*\{)'), '#{}'),
+    (re.compile(r'@keyframes\s+([\w-]+)'), '@keyframes {}'),
+    (re.compile(r'animation:\s*([\w-]+)'), 'animation:{}'),
+)
+
+
+def _prefix_names(body, prefix):
+    """Prefix ids, url(#...) references, #id selectors and keyframe names inside one glyph."""
+    for pattern, template in _LOCAL_NAMES:
+        body = pattern.sub(lambda m: template.format(prefix + m.group(1)) + "".join(m.groups()[1:]), body)
+    return body
+
+
+def composite_svg(svg_texts, pause=COMPOSITE_PAUSE):
+    """
+    Lay stroke-order SVGs side by side in one SVG.
+
+    Ids and keyframes get a per-glyph prefix so the glyphs do not collide, and the
+    animation delays of each glyph are shifted to start after the previous one ends.
+    The background grid is defined once and reused in every cell.
+    """
+    cells = []
+    styles_seen = set()
+    offset = 0.0
+    grid = None
+
+    def first_style(match):
+        if match.group(0) in styles_seen:
+            return ""
+        styles_seen.add(match.group(0))
+        return match.group(0)
+
+    for index, svg in enumerate(svg_texts):
+        body = _prefix_names(_SVG_BODY.search(svg).group(1), f"g{index}")
+        grid_match = _GRID.search(body)
+        if grid_match:
+            grid = grid or grid_match.group(0).replace("<g ", '<g id="grid" ', 1)
+            body = body.replace(grid_match.group(0), '<use xlink:href="#grid"/>', 1)
+        timings = [(float(duration), float(delay)) for duration, delay in _ANIMATION.findall(body)]
+        if timings:
+            start = offset
+            body = _DELAY.sub(lambda m: f"{m.group(1)}{round(float(m.group(2)) + start, SVG_TIME_PRECISION):g}s", body)
+            offset += max(duration + delay for duration, delay in timings) + pause
+        else:
+            # Статичные варианты задают одни и те же классы .strokeN — хватает одного <style>
+            body = _STYLE.sub(first_style, body)
+        cells.append(f'<g transform="translate({index * COMPOSITE_CELL})">{body}</g>' if index else f"<g>{body}</g>")
+    defs = f"<defs>{grid}</defs>" if grid else ""
+    return (f'<svg viewBox="0 0 {len(cells) * COMPOSITE_CELL} {COMPOSITE_CELL}" xmlns="http://www.w3.org/2000/svg" '
+            f'xmlns:xlink="http://www.w3.org/1999/xlink">' + defs + "".join(cells) + "</svg>")
+
+
+def _read_bytes(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def stroke_tag(svg_path):
+    """<img> tag for a stroke SVG; a composite keeps the card's 100px height at its full width."""
+    if not svg_path:
+        return ""
+    name = os.path.basename(svg_path)
+    if os.path.dirname(svg_path) == COMPOSITE_DIR:
+        return f'<img src="{name}" style="height:100px; max-width:none;">'
+    return f'<img src="{name}">'
+
+
+class StrokeAssets:
+    """
+    Resolves the stroke-order SVG for a character.
+
+    Uses the packed store (stroke_assets.pack, see stroke_pack.py) when it exists:
+    lookups are dictionary hits on the mmap index and only the needed assets are
+    written to stroke_media/ for packaging. Without a pack it falls back to the
+    loose svgs/ and svgs-still/ files, minified through `svg_optimizer`. Characters
+    with neither are rendered from graphics.txt (see stroke_renderer.py).
+    """
+
+    def __init__(self, negative_cache, svg_optimizer, pack_path=STROKE_PACK_FILE, media_dir=STROKE_MEDIA_DIR,
+                 renderer=None, source=STROKE_SOURCE):
+        self.negative_cache = negative_cache
+        self.svg_optimizer = svg_optimizer
+        self.media_dir = media_dir
+        self.source = source
+        self._renderer = renderer
+        self.pack = None
+        try:
+            self.pack = StrokePack(pack_path)
+            os.makedirs(media_dir, exist_ok=True)
+        except FileNotFoundError:
+            pass
+        except ValueError as e:
+            print(f"Warning: {e}. Using svgs/ and svgs-still/ instead.")
+        self._resolved = {}
+        self._words = {}
+
+    def find(self, char):
+        """Return a media path for `char`'s stroke SVG, or None if there is none."""
+        code_point = ord(char)
+        if code_point in self._resolved:
+            return self._resolved[code_point]
+        if self.negative_cache.is_missing("stroke_svg", code_point):
+            return None
+
+        from_assets = self._from_pack if self.pack else self._from_files
+        if self.source == "render":
+            svg_path = self._from_renderer(char) or from_assets(code_point)
+        else:
+            svg_path = from_assets(code_point) or self._from_renderer(char)
+        if svg_path is None:
+            log.warning(f"No SVG file found for '{char}' (code point {code_point})", extra={"item": char})
+            self.negative_cache.record_miss("stroke_svg", code_point, char)
+        self._resolved[code_point] = svg_path
+        return svg_path
+
+    def find_word(self, word):
+        """Return one media path for the stroke order of every character of `word`, or None."""
+        if word in self._words:
+            return self._words[word]
+        parts = [(ord(char), path) for char in word for path in [self.find(char)] if path]
+        if len(parts) <= 1:
+            svg_path = parts[0][1] if parts else None
+        else:
+            texts = []
+            for _, path in parts:
+                with open(path, "r", encoding="utf-8") as f:
+                    texts.append(f.read())
+            digest = hashlib.sha1("\0".join(texts + [str(COMPOSITE_PAUSE)]).encode("utf-8")).hexdigest()[:8]
+            name = "-".join(str(code_point) for code_point, _ in parts) + f"-{digest}.svg"
+            svg_path = os.path.join(COMPOSITE_DIR, name)
+            if not os.path.exists(svg_path):
+                self._write_composite(svg_path, texts)
+        self._words[word] = svg_path
+        return svg_path
+
+    def _write_composite(self, svg_path, texts):
+        os.makedirs(COMPOSITE_DIR, exist_ok=True)
+        tmp_path = f"{svg_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(composite_svg(texts))
+        os.replace(tmp_path, svg_path)
+
+    @property
+    def renderer(self):
+        # graphics.txt индексируется, только когда понадобился первый символ без готового SVG
+        if self._renderer is None:
+            self._renderer = StrokeRenderer()
+        return self._renderer
+
+    def _from_renderer(self, char):
+        if not self.renderer.available:
+            return None
+        return self.renderer.render(char)
+
+    def _from_pack(self, code_point):
+        found = self.pack.lookup(code_point)
+        if not found:
+            return None
+        variant, offset, length, original_length = found
+        svg_path = os.path.join(self.media_dir, media_name(code_point, variant))
+        data = self.pack.read(code_point, variant)
+        # Файл от прошлой сборки с тем же содержимым не переписывается
+        if not (os.path.exists(svg_path) and os.path.getsize(svg_path) == len(data) and _read_bytes(svg_path) == data):
+            tmp_path = f"{svg_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, svg_path)
+        self.svg_optimizer.stats[svg_path] = (original_length, length)
+        return svg_path
+
+    def _from_files(self, code_point):
+        svg_path = f"svgs/{code_point}.svg"
+        if not os.path.exists(svg_path):
+            svg_path = f"svgs-still/{code_point}-still.svg"
+            if not os.path.exists(svg_path):
+                return None
+        return self.svg_optimizer.optimize(svg_path)
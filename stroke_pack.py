@@ -0,0 +1,158 @@
+import argparse
+import mmap
+import os
+import struct
+
+from svg_optimizer import optimize_svg, SVG_PRECISION, SVG_DROP_GRID
+
+# Один упакованный файл вместо ~19 000 отдельных SVG в svgs/ и svgs-still/.
+#
+# Формат:
+#   заголовок  MAGIC (8 байт), число записей (uint32)
+#   индекс     записи (code_point uint32, variant uint8, offset uint64, length uint32, original_length uint32),
+#              отсортированы по (code_point, variant)
+#   данные     SVG подряд, без разделителей
+STROKE_PACK_FILE = "stroke_assets.pack"
+STROKE_MEDIA_DIR = "stroke_media"
+
+MAGIC = b"HZSVGPK1"
+_HEADER = struct.Struct("<8sI")
+_ENTRY = struct.Struct("<IBQII")
+
+ANIMATED = 0
+STILL = 1
+
+
+def media_name(code_point, variant):
+    """File name used inside the deck, identical to the loose-file layout."""
+    return f"{code_point}.svg" if variant == ANIMATED else f"{code_point}-still.svg"
+
+
+class StrokePack:
+    """Read-only, memory-mapped view of a stroke asset pack."""
+
+    def __init__(self, pack_path=STROKE_PACK_FILE):
+        self.pack_path = pack_path
+        self._file = open(pack_path, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count = _HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"{pack_path} is not a stroke asset pack")
+        index_bytes = self._mmap[_HEADER.size:_HEADER.size + count * _ENTRY.size]
+        self.index = {
+            (code_point, variant): (offset, length, original_length)
+            for code_point, variant, offset, length, original_length in _ENTRY.iter_unpack(index_bytes)
+        }
+
+    def __contains__(self, code_point):
+        return (code_point, ANIMATED) in self.index or (code_point, STILL) in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def lookup(self, code_point):
+        """Return (variant, offset, length, original_length), preferring the animated SVG, or None."""
+        for variant in (ANIMATED, STILL):
+            entry = self.index.get((code_point, variant))
+            if entry:
+                return (variant,) + entry
+        return None
+
+    def read(self, code_point, variant=ANIMATED):
+        entry = self.index.get((code_point, variant))
+        if not entry:
+            return None
+        offset, length, _ = entry
+        return self._mmap[offset:offset + length]
+
+    def extract(self, code_points, out_dir=STROKE_MEDIA_DIR):
+        """Write only the requested assets to `out_dir`. Returns the written paths."""
+        os.makedirs(out_dir, exist_ok=True)
+        paths = []
+        for code_point in code_points:
+            found = self.lookup(code_point)
+            if not found:
+                continue
+            variant, offset, length, _ = found
+            path = os.path.join(out_dir, media_name(code_point, variant))
+            with open(path, "wb") as f:
+                f.write(self._mmap[offset:offset + length])
+            paths.append(path)
+        return paths
+
+    def close(self):
+        self._mmap.close()
+        self._file.close()
+
+
+def _collect_sources(svg_dir, still_dir):
+    sources = {}
+    for directory, variant, suffix in ((svg_dir, ANIMATED, ".svg"), (still_dir, STILL, "-still.svg")):
+        if not os.path.isdir(directory):
+            continue
+        for name in os.listdir(directory):
+            stem = name[:-len(suffix)] if name.endswith(suffix) else ""
+            if stem.isdigit():
+                sources[(int(stem), variant)] = os.path.join(directory, name)
+    return sources
+
+
+def build_pack(svg_dir="svgs", still_dir="svgs-still", pack_path=STROKE_PACK_FILE,
+               minify=True, precision=SVG_PRECISION, drop_grid=SVG_DROP_GRID):
+    """Pack every <code point>.svg / <code point>-still.svg into one file."""
+    sources = _collect_sources(svg_dir, still_dir)
+    keys = sorted(sources)
+    data_start = _HEADER.size + len(keys) * _ENTRY.size
+
+    tmp_path = f"{pack_path}.tmp"
+    entries = []
+    with open(tmp_path, "wb") as f:
+        f.seek(data_start)
+        offset = data_start
+        for key in keys:
+            with open(sources[key], "rb") as src:
+                raw = src.read()
+            blob = optimize_svg(raw.decode("utf-8"), precision, drop_grid).encode("utf-8") if minify else raw
+            f.write(blob)
+            entries.append(_ENTRY.pack(key[0], key[1], offset, len(blob), len(raw)))
+            offset += len(blob)
+        f.seek(0)
+        f.write(_HEADER.pack(MAGIC, len(entries)))
+        f.write(b"".join(entries))
+    os.replace(tmp_path, pack_path)
+
+    original_total = sum(os.path.getsize(path) for path in sources.values())
+    print(f"Packed {len(entries)} SVGs into {pack_path}: "
+          f"{original_total / 1024 / 1024:.1f} MB -> {os.path.getsize(pack_path) / 1024 / 1024:.1f} MB")
+    return pack_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or inspect the packed stroke-order SVG store")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build = subparsers.add_parser("build", help="pack svgs/ and svgs-still/ into one file")
+    build.add_argument("--svg-dir", default="svgs")
+    build.add_argument("--still-dir", default="svgs-still")
+    build.add_argument("--pack", default=STROKE_PACK_FILE)
+    build.add_argument("--no-minify", action="store_true", help="store the original SVG bytes")
+    build.add_argument("--drop-grid", action="store_true", default=SVG_DROP_GRID)
+
+    extract = subparsers.add_parser("extract", help="write the SVGs for the given characters")
+    extract.add_argument("text", help="characters, e.g. 你好")
+    extract.add_argument("--pack", default=STROKE_PACK_FILE)
+    extract.add_argument("--out", default=STROKE_MEDIA_DIR)
+
+    args = parser.parse_args()
+    if args.command == "build":
+        build_pack(args.svg_dir, args.still_dir, args.pack, minify=not args.no_minify, drop_grid=args.drop_grid)
+    else:
+        pack = StrokePack(args.pack)
+        for path in pack.extract([ord(char) for char in args.text], args.out):
+            print(path)
+        pack.close()
+
+
+if __name__ == "__main__":
+    main()
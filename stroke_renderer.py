@@ -0,0 +1,157 @@
+import argparse
+import math
+import os
+
+from graphics_index import GRAPHICS_PATH, GraphicsIndex
+from stroke_pack import ANIMATED, STILL, media_name
+from svg_optimizer import (SVG_DROP_GRID, SVG_MIN_CACHE_DIR, SVG_PRECISION, SVG_TIME_PRECISION,
+                           compact_path_data, format_number)
+
+# SVG порядка черт строятся прямо из graphics.txt (makemeahanzi: контуры `strokes` и осевые
+# линии `medians`) — в том же виде, что svgs/ и svgs-still/ после svg_optimizer.py, но для
+# любого иероглифа из graphics.txt и без 245 МБ готовых файлов. Результат кэшируется по коду
+# символа: svgs-min/rendered/p0/20320.svg, 20320-still.svg.
+STROKE_RENDER_DIR = os.path.join(SVG_MIN_CACHE_DIR, "rendered")
+
+# Параметры анимации makemeahanzi: ширина пера, пауза перед чертой и скорость (в единицах viewBox)
+STROKE_WIDTH = 128
+STROKE_DELAY = 0.3 * 1024
+STROKE_SPEED = 1.2 * 1024
+
+# Цвета черт в статичном варианте, как в svgs-still/ (дальше 20-й черты — по кругу)
+STILL_COLORS = ("#BF0909", "#BFBF09", "#09BF09", "#09BFBF", "#0909BF", "#BF09BF", "#42005e", "#ff3333",
+                "#BFBFBF", "#00a53f", "#fff000", "#6600a5", "#0053a5", "#62c22b", "#BF09BF", "#BF0909",
+                "#BFBF09", "#09BF09", "#09BFBF", "#0909BF")
+STILL_TEXT_STYLE = ("text{font-family:Helvetica;font-size:50px;fill:#FFFFFF;paint-order:stroke;stroke:#000000;"
+                    "stroke-width:4px;stroke-linecap:butt;stroke-linejoin:miter;font-weight:800}")
+
+_GRID = ('<g stroke="lightgray" stroke-dasharray="1,1" stroke-width="1" transform="scale(4)">'
+         '<line x1="0" y1="0" x2="256" y2="256"/><line x1="256" y1="0" x2="0" y2="256"/>'
+         '<line x1="128" y1="0" x2="128" y2="256"/><line x1="0" y1="128" x2="256" y2="128"/></g>')
+_OPEN = '<svg viewBox="0 0 1024 1024" xmlns="http://www.w3.org/2000/svg">'
+_GLYPH = '<g transform="scale(1,-1) translate(0,-900)">'
+
+
+def median_length(median):
+    return sum(math.dist(median[i], median[i + 1]) for i in range(len(median) - 1))
+
+
+def median_path(median, precision=SVG_PRECISION):
+    return compact_path_data(" ".join(f"{'L' if i else 'M'} {x} {y}" for i, (x, y) in enumerate(median)), precision)
+
+
+def render_animated(entry, precision=SVG_PRECISION, drop_grid=SVG_DROP_GRID):
+    """Animated stroke-order SVG (each stroke drawn along its median, one after another)."""
+    css = []
+    outlines = []
+    animations = []
+    elapsed = 0.0  # в единицах viewBox: задержка черты = elapsed / STROKE_SPEED
+    for i, (stroke, median) in enumerate(zip(entry["strokes"], entry["medians"])):
+        # Округление половин вверх, как Math.round в makemeahanzi
+        length = math.floor(median_length(median) + 0.5) + STROKE_WIDTH
+        offset = length + STROKE_WIDTH
+        duration = (offset + STROKE_DELAY) / STROKE_SPEED
+        delay = elapsed / STROKE_SPEED
+        fraction = math.floor(100 * offset / (offset + STROKE_DELAY) + 0.5)
+        css.append(f"@keyframes k{i}{{from{{stroke:blue;stroke-dashoffset:{offset};stroke-width:128}}"
+                   f"{fraction}%{{animation-timing-function:step-end;stroke:blue;stroke-dashoffset:0;"
+                   f"stroke-width:128}}to{{stroke:black;stroke-width:1024}}}}"
+                   f"#a{i}{{animation:k{i} {format_number(duration, SVG_TIME_PRECISION)}s both;"
+                   f"animation-delay:{format_number(delay, SVG_TIME_PRECISION)}s;animation-timing-function:linear}}")
+        path = compact_path_data(stroke, precision)
+        outlines.append(f'<path d="{path}" fill="lightgray"/>')
+        animations.append(f'<clipPath id="c{i}"><path d="{path}"/></clipPath>'
+                          f'<path clip-path="url(#c{i})" d="{median_path(median, precision)}" fill="none" '
+                          f'id="a{i}" stroke-dasharray="{length} {2 * length}" stroke-linecap="round"/>')
+        elapsed += offset + STROKE_DELAY
+    return (_OPEN + ("" if drop_grid else _GRID) + _GLYPH + "<style>" + "".join(css) + "</style>"
+            + "".join(outlines) + "".join(animations) + "</g></svg>")
+
+
+def render_still(entry, precision=SVG_PRECISION, drop_grid=SVG_DROP_GRID):
+    """Still SVG: strokes in distinct colours, numbered at the start of each stroke."""
+    count = len(entry["strokes"])
+    css = "".join(f".stroke{i + 1}{{fill:{STILL_COLORS[i % len(STILL_COLORS)]}}}" for i in range(count))
+    paths = "".join(f'<path d="{compact_path_data(stroke, precision)}" class="stroke{i + 1}"/>'
+                    for i, stroke in enumerate(entry["strokes"]))
+    labels = []
+    for i, median in enumerate(entry["medians"]):
+        x, y = (format_number(value, precision) for value in median[0])
+        labels.append(f'<text x="{x}" y="{y}" style="transform-origin:{x}px {y}px; transform:scale(1,-1);">'
+                      f'{i + 1}</text>')
+    return (_OPEN + ("" if drop_grid else _GRID) + _GLYPH + "<style>" + css + STILL_TEXT_STYLE + "</style>"
+            + paths + "".join(labels) + "</g></svg>")
+
+
+class StrokeRenderer:
+    """
+    Renders stroke-order SVGs from graphics.txt on demand.
+
+    `render(char)` returns the path of the cached SVG for `char`, or None when the
+    character is not in graphics.txt. File names match svgs/ and svgs-still/, so
+    card fields do not depend on where an SVG came from.
+    """
+
+    def __init__(self, graphics=None, cache_dir=STROKE_RENDER_DIR, precision=SVG_PRECISION,
+                 drop_grid=SVG_DROP_GRID, variant=ANIMATED):
+        self.graphics = graphics if graphics is not None else GraphicsIndex(GRAPHICS_PATH)
+        self.precision = precision
+        self.drop_grid = drop_grid
+        self.variant = variant
+        self.cache_dir = os.path.join(cache_dir, f"p{precision}{'-nogrid' if drop_grid else ''}")
+        self.rendered = 0
+
+    @property
+    def available(self):
+        return bool(self.graphics)
+
+    def __contains__(self, char):
+        return char in self.graphics
+
+    def render(self, char, variant=None):
+        variant = self.variant if variant is None else variant
+        if char not in self.graphics:
+            return None
+        svg_path = os.path.join(self.cache_dir, media_name(ord(char), variant))
+        if not os.path.exists(svg_path):
+            render = render_animated if variant == ANIMATED else render_still
+            svg = render(self.graphics[char], self.precision, self.drop_grid)
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = f"{svg_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(svg)
+            os.replace(tmp_path, svg_path)
+            self.rendered += 1
+        return svg_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render stroke-order SVGs from makemeahanzi graphics.txt")
+    parser.add_argument("characters", nargs="*", help="characters to render (default: every character with --all)")
+    parser.add_argument("--all", action="store_true", help="render every character in graphics.txt")
+    parser.add_argument("--graphics", default=GRAPHICS_PATH)
+    parser.add_argument("--still", action="store_true", help="coloured, numbered still variant")
+    parser.add_argument("--precision", type=int, default=SVG_PRECISION)
+    parser.add_argument("--drop-grid", action="store_true", default=SVG_DROP_GRID)
+    args = parser.parse_args()
+
+    graphics = GraphicsIndex(args.graphics)
+    if not graphics.available:
+        raise SystemExit(f"{args.graphics} not found")
+    renderer = StrokeRenderer(graphics, precision=args.precision, drop_grid=args.drop_grid,
+                              variant=STILL if args.still else ANIMATED)
+    characters = list(graphics) if args.all else [char for text in args.characters for char in text]
+    total = 0
+    for char in characters:
+        svg_path = renderer.render(char)
+        if svg_path is None:
+            print(f"{char}: not in {args.graphics}")
+            continue
+        total += os.path.getsize(svg_path)
+        if not args.all:
+            print(svg_path)
+    print(f"{len(characters)} characters, {renderer.rendered} rendered, {total / 1024:.1f} KB in {renderer.cache_dir}")
+
+
+if __name__ == "__main__":
+    main()
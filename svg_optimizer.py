@@ -0,0 +1,122 @@
+import argparse
+import os
+import re
+
+# Минифицированные копии SVG порядка черт (svgs/ и svgs-still/) складываются сюда.
+# Имя файла сохраняется, поэтому теги <img src="20320.svg"> в карточках не меняются.
+SVG_MIN_CACHE_DIR = "svgs-min"
+SVG_PRECISION = 0        # знаков после запятой в координатах путей
+SVG_TIME_PRECISION = 3   # знаков после запятой в длительностях/задержках анимации
+SVG_DROP_GRID = False    # убирать декоративную сетку (серые диагонали и крест)
+
+_NUMBER = r'-?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?'
+_PATH_TOKEN = re.compile(r'[A-Za-z]|' + _NUMBER)
+_GRID_GROUP = re.compile(r'<g stroke="lightgray"[^>]*>.*?</g>', re.S)
+_STYLE_BLOCK = re.compile(r'(<style[^>]*>)(.*?)(</style>)', re.S)
+
+
+def format_number(value, precision):
+    rounded = round(float(value), precision)
+    if rounded == int(rounded):
+        return str(int(rounded))
+    return f"{rounded:.{precision}f}".rstrip('0').rstrip('.')
+
+
+def compact_path_data(d, precision=SVG_PRECISION):
+    """Round coordinates and drop optional separators: 'M 272 567 Q 306 -613' -> 'M272 567Q306-613'."""
+    out = []
+    previous_is_number = False
+    for token in _PATH_TOKEN.findall(d):
+        if token.isalpha():
+            out.append(token)
+            previous_is_number = False
+            continue
+        number = format_number(token, precision)
+        if previous_is_number and not number.startswith('-'):
+            out.append(' ')
+        out.append(number)
+        previous_is_number = True
+    return ''.join(out)
+
+
+def _minify_css(css):
+    css = re.sub(r'/\*.*?\*/', '', css, flags=re.S)
+    css = re.sub(r'\s+', ' ', css)
+    css = re.sub(r'\s*([{}:;,])\s*', r'\1', css)
+    css = css.replace(';}', '}')
+    css = re.sub(r'(\d+\.\d+)s\b', lambda m: format_number(m.group(1), SVG_TIME_PRECISION) + 's', css)
+    return css.strip()
+
+
+def optimize_svg(svg_text, precision=SVG_PRECISION, drop_grid=SVG_DROP_GRID):
+    """Return a minified copy of a makemeahanzi stroke-order SVG."""
+    svg = re.sub(r'<!--.*?-->', '', svg_text, flags=re.S)
+    if drop_grid:
+        svg = _GRID_GROUP.sub('', svg, count=1)
+    svg = _STYLE_BLOCK.sub(lambda m: '<style>' + _minify_css(m.group(2)) + m.group(3), svg)
+    svg = re.sub(r'\sd="([^"]*)"', lambda m: ' d="' + compact_path_data(m.group(1), precision) + '"', svg)
+    svg = re.sub(r'<(path|line|rect|circle)([^>]*)></\1>', r'<\1\2/>', svg)
+    svg = re.sub(r'\s+(/?>)', r'\1', svg)
+    svg = re.sub(r'>\s+<', '><', svg)
+    svg = svg.replace(' version="1.1"', '').replace('transform="scale(4, 4)"', 'transform="scale(4)"')
+    svg = re.sub(r'transform="([^"]*)"', lambda m: 'transform="' + m.group(1).replace(', ', ',') + '"', svg)
+    # Короткие идентификаторы: SVG подключается через <img>, поэтому конфликтов между файлами нет
+    svg = svg.replace('make-me-a-hanzi-animation-', 'a').replace('make-me-a-hanzi-clip-', 'c')
+    svg = re.sub(r'\bkeyframes(\d+)', r'k\1', svg)
+    return svg.strip()
+
+
+class SvgOptimizer:
+    """Caches minified stroke SVGs on disk and tracks the bytes saved for one deck."""
+
+    def __init__(self, cache_dir=SVG_MIN_CACHE_DIR, precision=SVG_PRECISION, drop_grid=SVG_DROP_GRID):
+        self.precision = precision
+        self.drop_grid = drop_grid
+        self.cache_dir = os.path.join(cache_dir, f"p{precision}{'-nogrid' if drop_grid else ''}")
+        self.stats = {}  # исходный путь -> (байт до, байт после)
+
+    def optimize(self, svg_path):
+        """Return the path of the cached minified variant of `svg_path`, building it if needed."""
+        out_path = os.path.join(self.cache_dir, os.path.basename(svg_path))
+        try:
+            if not os.path.exists(out_path) or os.path.getmtime(out_path) < os.path.getmtime(svg_path):
+                with open(svg_path, 'r', encoding='utf-8') as f:
+                    svg_text = f.read()
+                os.makedirs(self.cache_dir, exist_ok=True)
+                tmp_path = f"{out_path}.{os.getpid()}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    f.write(optimize_svg(svg_text, self.precision, self.drop_grid))
+                os.replace(tmp_path, out_path)
+            self.stats[svg_path] = (os.path.getsize(svg_path), os.path.getsize(out_path))
+            return out_path
+        except (OSError, UnicodeDecodeError) as e:
+            print(f"Could not minify {svg_path}: {e}. Using original.")
+            return svg_path
+
+    def report(self):
+        if not self.stats:
+            return "Stroke SVGs: none"
+        before = sum(b for b, _ in self.stats.values())
+        after = sum(a for _, a in self.stats.values())
+        saved = before - after
+        return (f"Stroke SVGs: {len(self.stats)} files, {before / 1024:.1f} KB -> {after / 1024:.1f} KB "
+                f"(saved {saved / 1024:.1f} KB, {100 * saved / before:.0f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the minified stroke-order SVG cache")
+    parser.add_argument("dirs", nargs="*", default=["svgs", "svgs-still"])
+    parser.add_argument("--precision", type=int, default=SVG_PRECISION)
+    parser.add_argument("--drop-grid", action="store_true", default=SVG_DROP_GRID)
+    args = parser.parse_args()
+
+    optimizer = SvgOptimizer(precision=args.precision, drop_grid=args.drop_grid)
+    for directory in args.dirs:
+        for name in sorted(os.listdir(directory)):
+            if name.endswith(".svg"):
+                optimizer.optimize(os.path.join(directory, name))
+    print(optimizer.report())
+
+
+if __name__ == "__main__":
+    main()
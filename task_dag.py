@@ -0,0 +1,114 @@
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from progress_log import stage_finished, stage_started
+
+# Этапы сборки одной карточки (перевод, аудио Forvo, история, картинка, SVG штрихов) почти
+# всё время ждут сеть. Каждый этап объявляет свои входы, и независимые этапы выполняются
+# одновременно, поэтому время карточки — это критический путь (перевод → история → картинка),
+# а не сумма всех этапов.
+STAGE_WORKERS = int(os.getenv("STAGE_WORKERS", "6"))
+
+_executor = None
+_executor_lock = threading.Lock()
+_timings = {}  # этап -> [вызовов, секунд]; суммируется по всем потокам, см. deck_report.py
+_timings_lock = threading.Lock()
+
+
+def stage_executor():
+    """Thread pool shared by every StageGraph in the process."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=STAGE_WORKERS, thread_name_prefix="stage")
+        return _executor
+
+
+def record_stage(name, seconds):
+    with _timings_lock:
+        entry = _timings.setdefault(name, [0, 0.0])
+        entry[0] += 1
+        entry[1] += seconds
+
+
+def stage_timings():
+    """{stage: (calls, seconds)} accumulated since the last reset."""
+    with _timings_lock:
+        return {name: tuple(entry) for name, entry in _timings.items()}
+
+
+def reset_stage_timings():
+    with _timings_lock:
+        _timings.clear()
+
+
+def _timed(name, func, *args):
+    started = time.perf_counter()
+    try:
+        return func(*args)
+    finally:
+        record_stage(name, time.perf_counter() - started)
+
+
+class StageGraph:
+    """
+    A small DAG of note-building stages.
+
+    `stage(name, func, deps)` registers `func`, which is called with the results of
+    `deps` as positional arguments once they are all available. `run()` executes the
+    graph and returns {name: result}. Stages are scheduled from the calling thread, so
+    a stage never blocks a pool thread waiting for another one.
+    """
+
+    def __init__(self, executor=None):
+        self.executor = executor
+        self.stages = {}
+
+    def stage(self, name, func, deps=()):
+        if name in self.stages:
+            raise ValueError(f"Duplicate stage: {name}")
+        unknown = [dep for dep in deps if dep not in self.stages]
+        if unknown:
+            # Зависимости объявляются раньше этапа, поэтому циклов быть не может
+            raise ValueError(f"Stage {name} depends on undeclared stages: {', '.join(unknown)}")
+        self.stages[name] = (func, tuple(deps))
+        return self
+
+    def run(self):
+        if STAGE_WORKERS <= 1 and self.executor is None:
+            results = {}
+            for name, (func, deps) in self.stages.items():
+                stage_started(name)
+                try:
+                    results[name] = _timed(name, func, *(results[dep] for dep in deps))
+                finally:
+                    stage_finished(name)
+            return results
+
+        executor = self.executor or stage_executor()
+        results = {}
+        pending = dict(self.stages)
+        running = {}
+        try:
+            while pending or running:
+                for name, (func, deps) in list(pending.items()):
+                    if all(dep in results for dep in deps):
+                        # Строка прогресса показывает, сколько этапов каждого вида ждут или выполняются
+                        stage_started(name)
+                        running[executor.submit(_timed, name, func, *(results[dep] for dep in deps))] = name
+                        del pending[name]
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    stage_finished(name)
+                    results[name] = future.result()
+        finally:
+            if running:
+                # После ошибки дожидаемся уже запущенных этапов, чтобы они не писали в карточку,
+                # и снимаем их со строки прогресса
+                wait(running)
+                for name in running.values():
+                    stage_finished(name)
+        return results
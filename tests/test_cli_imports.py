@@ -0,0 +1,10 @@
+import pytest
+
+from cli import IMPORT_BUDGET_MS, LIGHT_COMMAND_IMPORTS, measure_imports
+
+
+@pytest.mark.parametrize("command", sorted(LIGHT_COMMAND_IMPORTS))
+def test_quick_command_import_budget(command):
+    elapsed, heavy = measure_imports(LIGHT_COMMAND_IMPORTS[command])
+    assert heavy == [], f"`cli.py {command}` imports {', '.join(heavy)}"
+    assert elapsed <= IMPORT_BUDGET_MS, f"`cli.py {command}` imports in {elapsed:.1f} ms"
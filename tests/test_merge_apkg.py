@@ -0,0 +1,64 @@
+import json
+import sqlite3
+import zipfile
+
+import pytest
+
+import merge_apkg
+from merge_apkg import merge_apkgs
+
+
+def make_apkg(path, notes, media):
+    """Minimal .apkg: `notes` is [(id, guid, fields)], `media` is {name: bytes}."""
+    db_path = path.with_suffix(".anki2")
+    conn = sqlite3.connect(db_path)
+    conn.executescript(
+        "CREATE TABLE col (id INTEGER PRIMARY KEY, models TEXT, decks TEXT, dconf TEXT);"
+        "CREATE TABLE notes (id INTEGER PRIMARY KEY, guid TEXT, flds TEXT);"
+        "CREATE TABLE cards (id INTEGER PRIMARY KEY, nid INTEGER);"
+        "CREATE TABLE revlog (id INTEGER PRIMARY KEY);"
+        "CREATE TABLE graves (oid INTEGER);"
+        "INSERT INTO col VALUES (1, '{}', '{}', '{}');")
+    conn.executemany("INSERT INTO notes VALUES (?, ?, ?)", notes)
+    conn.executemany("INSERT INTO cards VALUES (?, ?)", [(note_id * 10, note_id) for note_id, _, _ in notes])
+    conn.commit()
+    conn.close()
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as apkg:
+        apkg.write(db_path, "collection.anki2")
+        for index, data in enumerate(media.values()):
+            apkg.writestr(str(index), data)
+        apkg.writestr("media", json.dumps({str(i): name for i, name in enumerate(media)}))
+    return path
+
+
+def read_apkg(path):
+    with zipfile.ZipFile(path) as apkg:
+        assert apkg.testzip() is None
+        media = {name: apkg.read(index) for index, name in json.loads(apkg.read("media")).items()}
+        db_path = path.with_suffix(".check.anki2")
+        db_path.write_bytes(apkg.read("collection.anki2"))
+    conn = sqlite3.connect(db_path)
+    fields = dict(conn.execute("SELECT guid, flds FROM notes"))
+    conn.close()
+    return fields, media
+
+
+@pytest.mark.parametrize("raw_copy", [True, False])
+def test_conflicting_media_names(tmp_path, monkeypatch, raw_copy):
+    if not raw_copy:
+        monkeypatch.setattr(merge_apkg, "_raw_copy_supported", lambda source_zip, target_zip: False)
+    first = make_apkg(tmp_path / "first.apkg", [(1, "a", '<img src="story.png">\x1f[sound:word.mp3]')],
+                      {"story.png": b"first image", "word.mp3": b"same audio"})
+    second = make_apkg(tmp_path / "second.apkg",
+                       [(1, "b", '<img src="story.png">\x1f[sound:word.mp3]'), (2, "a", "duplicate note")],
+                       {"story.png": b"second image", "word.mp3": b"same audio"})
+
+    stats = merge_apkgs([first, second], tmp_path / "merged.apkg")
+
+    assert (stats["notes"], stats["skipped_notes"], stats["cards"]) == (2, 1, 2)
+    assert (stats["media"], stats["duplicate_media"]) == (3, 1)
+    fields, media = read_apkg(tmp_path / "merged.apkg")
+    assert fields["a"] == '<img src="story.png">\x1f[sound:word.mp3]'
+    renamed = fields["b"].split('"')[1]
+    assert renamed != "story.png" and fields["b"] == f'<img src="{renamed}">\x1f[sound:word.mp3]'
+    assert media == {"story.png": b"first image", renamed: b"second image", "word.mp3": b"same audio"}
@@ -0,0 +1,17 @@
+from vocab_extractor import WordAutomaton
+
+
+def test_shorter_word_starting_later_is_kept():
+    automaton = WordAutomaton(["大学", "学生", "生活", "大", "学", "生", "活", "大学生"])
+    assert automaton.segment("大学生活") == ["大学生", "活"]
+
+
+def test_overlapping_words():
+    automaton = WordAutomaton(["PQ", "QAB", "AB", "A", "B", "P", "Q"])
+    assert automaton.segment("PQAB") == ["PQ", "AB"]
+
+
+def test_longest_word_at_each_position():
+    automaton = WordAutomaton(["中", "中国", "中国人", "国人", "人"])
+    assert automaton.segment("我是中国人。") == ["中国人"]
+    assert automaton.segment("人中国") == ["人", "中国"]
@@ -0,0 +1,224 @@
+import argparse
+import csv
+import glob
+import html
+import json
+import os
+import re
+import time
+from collections import Counter
+
+from input_words import is_chinese_char, read_archived_words
+
+# Поиск новой лексики в корпусе уроков (HTML-скрипты ChinesePod после
+# traditional_to_simplified.py, тексты DuChinese): автомат Ахо–Корасик по словарю
+# проходит каждый текст один раз, слова, которых нет в архивах, ранжируются по частоте.
+
+# Словарь CC-CEDICT (https://www.mdbg.net/chinese/dictionary?page=cedict), если скачан
+CEDICT_FILE = "cedict_ts.u8"
+HANZI_DB_FILE = "hanzi_db.txt"
+DUCHINESE_EXPORTS = "DuChinese_*.csv"
+TEXT_EXTENSIONS = (".html", ".htm", ".txt", ".md", ".srt")
+
+# Куда писать результат -> (входной файл скрипта, архив уже обработанных слов)
+VOCAB_TARGETS = {
+    "words": ("chinese_words.txt", "input_words_archive"),
+    "hmm": ("du_chinese_words_hanzi_movie_method.txt", "input_words_du_chinese_hmm_archive"),
+}
+
+_SKIPPED_BLOCKS = re.compile(r"<(script|style)\b.*?</\1>", re.IGNORECASE | re.DOTALL)
+_TAG = re.compile(r"<[^>]+>")
+
+
+class WordAutomaton:
+    """
+    Aho-Corasick automaton over dictionary headwords.
+
+    `segment(text)` splits `text` greedily from the left, taking the longest
+    dictionary word that starts at each position, in one pass; characters not
+    covered by any headword are skipped.
+    """
+
+    def __init__(self, words):
+        self.goto = [{}]
+        self.fail = [0]
+        self.length = [0]  # длина слова, которое оканчивается в этом состоянии (0 — не слово)
+        self.output = [0]  # ближайшее по fail-ссылкам состояние-слово (суффикс этого)
+        for word in words:
+            self._add(word)
+        self._link()
+
+    def _add(self, word):
+        state = 0
+        for char in word:
+            next_state = self.goto[state].get(char)
+            if next_state is None:
+                next_state = len(self.goto)
+                self.goto[state][char] = next_state
+                self.goto.append({})
+                self.fail.append(0)
+                self.length.append(0)
+                self.output.append(0)
+            state = next_state
+        self.length[state] = len(word)
+
+    def _link(self):
+        queue = list(self.goto[0].values())
+        for state in queue:
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                suffix = self.goto[fallback].get(char, 0)
+                self.fail[next_state] = suffix
+                self.output[next_state] = suffix if self.length[suffix] else self.output[suffix]
+
+    def segment(self, text):
+        goto, fail, length, output = self.goto, self.fail, self.length, self.output
+        # Для каждой начальной позиции — длина самого длинного слова, начинающегося в ней.
+        # В позиции end оканчиваются все слова цепочки output, а не только самое длинное:
+        # короткое слово может начинаться позже и быть длиннейшим для своей позиции
+        best = [0] * len(text)
+        state = 0
+        for end, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            match = state if length[state] else output[state]
+            while match:
+                start = end - length[match] + 1
+                if length[match] > best[start]:
+                    best[start] = length[match]
+                match = output[match]
+        words = []
+        position = 0
+        while position < len(text):
+            length = best[position]
+            if length:
+                words.append(text[position:position + length])
+                position += length
+            else:
+                position += 1
+        return words
+
+
+def read_text(path):
+    with open(path, "r", encoding="utf-8", errors="ignore") as f:
+        text = f.read()
+    if path.lower().endswith((".html", ".htm")):
+        text = html.unescape(_TAG.sub(" ", _SKIPPED_BLOCKS.sub(" ", text)))
+    return text.replace("\u200b", "")
+
+
+def corpus_files(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                for name in sorted(files):
+                    if name.lower().endswith(TEXT_EXTENSIONS):
+                        yield os.path.join(root, name)
+        else:
+            yield path
+
+
+def load_headwords(dictionary_files=(), hanzi_db_file=HANZI_DB_FILE):
+    """Simplified headwords from CC-CEDICT, DuChinese exports, plain word lists and hanzi_db.txt."""
+    headwords = set()
+    files = list(dictionary_files)
+    if not files:
+        files = ([CEDICT_FILE] if os.path.exists(CEDICT_FILE) else []) + sorted(glob.glob(DUCHINESE_EXPORTS))
+    for path in files:
+        with open(path, "r", encoding="utf-8") as f:
+            if path.endswith(".csv"):
+                rows = csv.reader(line for line in f if not line.startswith("#"))
+                headwords.update(row[0].strip() for row in rows if row)
+            else:
+                for line in f:
+                    if line.startswith("#") or not line.strip():
+                        continue
+                    parts = line.split()
+                    # CC-CEDICT: "傳統 传统 [chuan2 tong3] /tradition/", иначе одно слово в строке
+                    headwords.add(parts[1] if len(parts) > 2 and parts[2].startswith("[") else parts[0])
+    if os.path.exists(hanzi_db_file):
+        with open(hanzi_db_file, "r", encoding="utf-8") as f:
+            headwords.update(json.loads(line)["character"] for line in f if line.strip())
+    return {word for word in headwords if is_chinese_char(word)}
+
+
+def extract_vocabulary(paths, target="words", dictionary_files=(), seen=None, min_count=1):
+    """Frequency-ranked [(word, count)] of corpus vocabulary missing from the target's archive."""
+    _, archive_path = VOCAB_TARGETS[target]
+    seen = read_archived_words(archive_path) if seen is None else seen
+    started = time.monotonic()
+    headwords = load_headwords(dictionary_files) | {word for word in seen if is_chinese_char(word)}
+    automaton = WordAutomaton(headwords)
+    print(f"Automaton: {len(headwords)} headwords, {len(automaton.goto)} states "
+          f"in {time.monotonic() - started:.2f}s")
+
+    started = time.monotonic()
+    counts = Counter()
+    files = chars = 0
+    for path in corpus_files(paths):
+        text = read_text(path)
+        words = automaton.segment(text)
+        if target == "hmm":
+            # HMM-колода учит отдельные иероглифы
+            counts.update(char for word in words for char in word)
+        else:
+            counts.update(words)
+        files += 1
+        chars += len(text)
+    print(f"Scanned {files} files ({chars} characters) in {time.monotonic() - started:.2f}s")
+
+    # Counter.most_common сохраняет порядок первого появления при равной частоте
+    return [(word, count) for word, count in counts.most_common()
+            if word not in seen and count >= min_count]
+
+
+def append_words(input_file, words):
+    """Append `words` to the script's input file, skipping ones already listed there."""
+    existing = set()
+    if os.path.exists(input_file):
+        with open(input_file, "r", encoding="utf-8") as f:
+            existing = {line.strip().replace("\u200b", "") for line in f if line.strip()}
+    new_words = [word for word in words if word not in existing]
+    with open(input_file, "a", encoding="utf-8") as f:
+        f.writelines(f"{word}\n" for word in new_words)
+    print(f"Added {len(new_words)} words to {input_file}")
+    return new_words
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find vocabulary in lesson texts that is not in the archives yet")
+    parser.add_argument("paths", nargs="+", help="lesson files or directories (.html, .htm, .txt)")
+    parser.add_argument("--target", choices=list(VOCAB_TARGETS), default="words",
+                        help="words: whole words for chinese_words.txt; hmm: single characters for the HMM deck")
+    parser.add_argument("--dictionary", action="append", default=[],
+                        help=f"CC-CEDICT file, DuChinese .csv export or word list (default: {CEDICT_FILE} "
+                             f"if present and {DUCHINESE_EXPORTS})")
+    parser.add_argument("--min-count", type=int, default=1)
+    parser.add_argument("--min-length", type=int, default=1, help="skip shorter words (e.g. 2 for compounds only)")
+    parser.add_argument("--limit", type=int, help="keep only the N most frequent words")
+    parser.add_argument("--collection", help="also skip words already in this collection.anki2 or .apkg")
+    parser.add_argument("--write", action="store_true", help="append the result to the target's input file")
+    args = parser.parse_args()
+
+    ranked = extract_vocabulary(args.paths, args.target, args.dictionary, min_count=args.min_count)
+    ranked = [(word, count) for word, count in ranked if len(word) >= args.min_length]
+    if args.collection:
+        from anki_collection import filter_known_words
+
+        kept = set(filter_known_words([word for word, _ in ranked], args.collection))
+        ranked = [(word, count) for word, count in ranked if word in kept]
+    ranked = ranked[:args.limit] if args.limit else ranked
+
+    if args.write:
+        append_words(VOCAB_TARGETS[args.target][0], [word for word, _ in ranked])
+    else:
+        for word, count in ranked:
+            print(f"{count:6d}  {word}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+import argparse
+import os
+import time
+from datetime import datetime
+
+from build_decks import BUILD_CONFIG_FILE, SharedContext, build, load_config
+from input_words import is_chinese_char
+
+# Режим наблюдения: процесс держит hanzi_db.txt, кэши и клиенты загруженными,
+# дочитывает новые строки из входных файлов и собирает их в инкрементальные колоды.
+
+# Входной файл -> колоды, которые собираются из новых слов этого файла
+WATCH_INPUTS = {
+    "chinese_words.txt": ["words"],
+    "input_du_chinese_words_hanzi_movie_method.txt": ["hmm"],
+}
+WATCH_OUTPUT_DIR = "watch_output"
+POLL_INTERVAL = 1.0     # секунд между проверками файлов
+DEBOUNCE_SECONDS = 3.0  # сколько ждать тишины после последнего нового слова перед сборкой
+RETRY_SECONDS = 60.0    # через сколько повторить сборку, которая упала
+# Пауза генераторов между словами: партии в режиме наблюдения маленькие, а упавшая из-за
+# лимита сборка повторяется, поэтому новое слово не ждёт 20 секунд hmm-колоды
+WATCH_REQUEST_DELAY = 0
+
+
+class InputTail:
+    """Follows one input file and returns the complete lines appended since the last call."""
+
+    def __init__(self, path, from_start=False):
+        self.path = path
+        self.offset = 0 if from_start or not os.path.exists(path) else os.path.getsize(path)
+
+    def read_new_lines(self):
+        try:
+            size = os.path.getsize(self.path)
+        except FileNotFoundError:
+            self.offset = 0
+            return []
+        if size < self.offset:
+            # Файл очищен или заменён (архивирован скриптом) — читаем заново
+            self.offset = 0
+        if size == self.offset:
+            return []
+        with open(self.path, 'rb') as f:
+            f.seek(self.offset)
+            chunk = f.read(size - self.offset)
+        # Незавершённую последнюю строку оставляем до следующей проверки
+        end = chunk.rfind(b"\n") + 1
+        self.offset += end
+        return chunk[:end].decode('utf-8', errors='replace').splitlines()
+
+
+class WordWatcher:
+    def __init__(self, config, inputs=WATCH_INPUTS, output_dir=WATCH_OUTPUT_DIR,
+                 debounce=DEBOUNCE_SECONDS, from_start=False):
+        self.config = config
+        self.inputs = inputs
+        self.output_dir = output_dir
+        self.debounce = debounce
+        self.ctx = SharedContext(stable_ids=True, request_delay=WATCH_REQUEST_DELAY)
+        self.tails = {path: InputTail(path, from_start) for path in inputs}
+        self.pending = {path: [] for path in inputs}
+        self.last_change = None
+        self.retry_at = 0.0
+        self._warm_up()
+
+    def _warm_up(self):
+        """Import the deck modules and load hanzi_db.txt now, not on the first new word."""
+        decks = {deck for deck_list in self.inputs.values() for deck in deck_list}
+        for deck in decks:
+            self.ctx.module(deck)
+        if decks & {"hmm", "hmm_stories"}:
+            self.ctx.components_db
+
+    def poll(self):
+        for path, tail in self.tails.items():
+            lines = [line.strip().replace("\u200b", "") for line in tail.read_new_lines()]
+            words = [word for word in lines if is_chinese_char(word) and word not in self.pending[path]]
+            if words:
+                self.pending[path].extend(words)
+                self.last_change = time.monotonic()
+                print(f"[watch] {path}: +{len(words)} ({', '.join(words)})")
+
+    def ready(self):
+        now = time.monotonic()
+        return self.last_change is not None and now - self.last_change >= self.debounce and now >= self.retry_at
+
+    def flush(self):
+        stamp = datetime.now().strftime("%Y-%m-%d_%H_%M_%S")
+        os.makedirs(self.output_dir, exist_ok=True)
+        failed = {}
+        for path, words in self.pending.items():
+            if not words:
+                continue
+            decks = self.inputs[path]
+            # Каждая партия — отдельный .apkg; Anki импортирует его в колоду с тем же именем
+            outputs = {
+                deck: os.path.join(self.output_dir, f"{os.path.splitext(os.path.basename(name))[0]}_{stamp}.apkg")
+                for deck, name in self.config["outputs"].items()
+            }
+            config = {**self.config, "decks": decks, "outputs": outputs, "clear_input": False}
+            started = time.monotonic()
+            try:
+                build(config, self.ctx, words)
+            except Exception as e:
+                # Демон не падает: слова остаются в очереди до следующей попытки
+                print(f"[watch] build of {len(words)} words from {path} failed: {type(e).__name__}: {e}. "
+                      f"Retrying in {RETRY_SECONDS:.0f}s.")
+                failed[path] = words
+                continue
+            print(f"[watch] {len(words)} words from {path} -> {', '.join(outputs[d] for d in decks if d in outputs)} "
+                  f"in {time.monotonic() - started:.1f}s")
+        self.pending = {path: failed.get(path, []) for path in self.inputs}
+        self.last_change = time.monotonic() if failed else None
+        self.retry_at = time.monotonic() + RETRY_SECONDS if failed else 0.0
+
+    def run(self, poll_interval=POLL_INTERVAL):
+        print(f"[watch] watching {', '.join(self.inputs)} (Ctrl+C to stop)")
+        try:
+            while True:
+                self.poll()
+                if self.ready():
+                    self.flush()
+                time.sleep(poll_interval)
+        except KeyboardInterrupt:
+            if any(self.pending.values()):
+                print("[watch] building pending words before exit...")
+                self.flush()
+            print("[watch] stopped.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Watch the input word files and build incremental decks")
+    parser.add_argument("--config", default=BUILD_CONFIG_FILE, help=f"JSON config (default: {BUILD_CONFIG_FILE})")
+    parser.add_argument("--output-dir", default=WATCH_OUTPUT_DIR)
+    parser.add_argument("--debounce", type=float, default=DEBOUNCE_SECONDS, help="seconds of quiet before a build")
+    parser.add_argument("--interval", type=float, default=POLL_INTERVAL, help="polling interval in seconds")
+    parser.add_argument("--from-start", action="store_true", help="also process words already in the files")
+    args = parser.parse_args()
+
+    watcher = WordWatcher(load_config(args.config), output_dir=args.output_dir,
+                          debounce=args.debounce, from_start=args.from_start)
+    watcher.run(args.interval)
+
+
+if __name__ == "__main__":
+    main()